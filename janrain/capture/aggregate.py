@@ -0,0 +1,188 @@
+"""
+Count entities grouped by one or more dimensions using entity.count.
+
+Example:
+    table = group_count(api, [
+        Dimension("primaryAddress.country", ["US", "FR", "DE"]),
+        Dimension("created", month_ranges(2017, 1, 2018, 1), label="month"),
+    ], rate_limiter=RateLimiter(10))
+    for row in table:
+        print(row['primaryAddress.country'], row['month'], row['count'])
+"""
+from itertools import product
+from janrain.capture.filters import filter_literal, join_filters
+from janrain.capture.pool import run_concurrently
+from janrain.capture.tracing import span
+
+
+class Range(object):
+    """
+    A half-open range of values [start, end) used as a dimension value.
+
+    Args:
+        start - Lowest value included (None for no lower bound).
+        end   - First value excluded (None for no upper bound).
+        label - Name of the range in the result table.
+    """
+
+    def __init__(self, start, end, label=None):
+        self.start = start
+        self.end = end
+        self.label = label or "{}..{}".format(start, end)
+
+    def filter(self, attribute):
+        clauses = []
+        if self.start is not None:
+            clauses.append("{} >= {}".format(
+                attribute, filter_literal(self.start)))
+        if self.end is not None:
+            clauses.append("{} < {}".format(
+                attribute, filter_literal(self.end)))
+        return " and ".join(clauses) or "{} is not null".format(attribute)
+
+
+def month_ranges(start_year, start_month, end_year, end_month):
+    """
+    Build one Range per calendar month for date or dateTime attributes.
+
+    Returns:
+        A list of Range instances labelled 'YYYY-MM', from the start month up
+        to but excluding the end month.
+    """
+    ranges = []
+    year, month = start_year, start_month
+    while (year, month) < (end_year, end_month):
+        next_year, next_month = (year, month + 1) if month < 12 \
+            else (year + 1, 1)
+        label = "{:04d}-{:02d}".format(year, month)
+        ranges.append(Range(label + "-01",
+                            "{:04d}-{:02d}-01".format(next_year, next_month),
+                            label))
+        year, month = next_year, next_month
+    return ranges
+
+
+class Dimension(object):
+    """
+    An attribute to group counts by.
+
+    Args:
+        attribute - The attribute name (dot-notation for nested attributes).
+        values    - A list of values to match exactly, or Range instances.
+        label     - Column name in the result table (defaults to attribute).
+    """
+
+    def __init__(self, attribute, values, label=None):
+        self.attribute = attribute
+        self.values = list(values)
+        self.label = label or attribute
+
+    def exhaustive(self):
+        """
+        Check whether every entity falls in exactly one bucket: the values
+        must be Ranges covering every value without gaps, from no lower
+        bound to no upper bound, and None for entities without a value.
+        Exact values are never known to cover every value.
+        """
+        ranges = [v for v in self.values if isinstance(v, Range)]
+        if None not in self.values or \
+                len(ranges) + 1 != len(self.values):
+            return False
+        first = [r for r in ranges if r.start is None]
+        by_start = dict((r.start, r) for r in ranges if r.start is not None)
+        if len(first) != 1 or len(by_start) + 1 != len(ranges):
+            return False
+        current, covered = first[0], 1
+        while current.end is not None:
+            current = by_start.get(current.end)
+            if current is None:
+                return False
+            covered += 1
+        return covered == len(ranges)
+
+    def buckets(self):
+        """
+        Returns:
+            A list of (label, filter) 2-tuples, one for each value.
+        """
+        buckets = []
+        for value in self.values:
+            if isinstance(value, Range):
+                buckets.append((value.label, value.filter(self.attribute)))
+            elif value is None:
+                buckets.append((None, "{} is null".format(self.attribute)))
+            else:
+                buckets.append((value, "{} = {}".format(
+                    self.attribute, filter_literal(value))))
+        return buckets
+
+
+def group_count(api, dimensions, type_name="user", base_filter=None,
+                workers=10, rate_limiter=None, max_bucket=None,
+                subpartition=None):
+    """
+    Count entities for every combination of dimension values. The
+    entity.count calls run concurrently.
+
+    Args:
+        api          - A janrain.capture.Api instance.
+        dimensions   - A list of Dimension instances.
+        type_name    - The entity type to count.
+        base_filter  - A filter applied to every count.
+        workers      - Maximum number of calls to run at the same time.
+        rate_limiter - A janrain.capture.ratelimit.RateLimiter shared by the
+                       calls.
+        max_bucket   - Buckets with more entities than this are split by the
+                       subpartition dimension.
+        subpartition - A Dimension used to split large buckets, and buckets
+                       whose count failed (eg. timed out).
+
+    Returns:
+        A list of rows, one per combination. Each row is a dictionary with
+        the label of each dimension and the 'count'. Rows which were split
+        have their sub-rows under 'buckets'. Rows which failed have a None
+        count and the exception under 'error', unless the subpartition is
+        exhaustive (see Dimension.exhaustive()) and every sub-row was
+        counted: the count is then the sum of the sub-rows.
+    """
+    def count(bucket_filter):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        return api.call("entity.count", type_name=type_name,
+                        filter=bucket_filter)['total_count']
+
+    combinations = list(product(*[d.buckets() for d in dimensions]))
+    rows = []
+    filters = []
+    for combination in combinations:
+        row = {}
+        for dimension, (label, dimension_filter) in zip(dimensions,
+                                                        combination):
+            row[dimension.label] = label
+        rows.append(row)
+        filters.append(join_filters(
+            [base_filter] + [f for label, f in combination]))
+
+    with span(api.tracer, "capture.group_count", **{
+            'janrain.type_name': type_name,
+            'janrain.buckets': len(filters)}):
+        results = run_concurrently(count, filters, workers)
+
+    split = []
+    for row, (bucket_filter, total, error) in zip(rows, results):
+        row['count'] = total
+        if error is not None:
+            row['error'] = error
+        if subpartition is not None and (error is not None or (
+                max_bucket is not None and total > max_bucket)):
+            split.append((row, bucket_filter))
+
+    for row, bucket_filter in split:
+        row['buckets'] = group_count(
+            api, [subpartition], type_name, bucket_filter, workers,
+            rate_limiter)
+        if 'error' in row and subpartition.exhaustive() and \
+                all('error' not in sub for sub in row['buckets']):
+            del row['error']
+            row['count'] = sum(sub['count'] for sub in row['buckets'])
+    return rows
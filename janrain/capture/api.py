@@ -2,14 +2,23 @@
 # pylint: disable=E0611
 from __future__ import unicode_literals
 from janrain.capture.exceptions import ApiResponseError
+from janrain.capture.deadline import current_deadline
+from janrain.capture.schema import SchemaCache
+from janrain.capture.tracing import span, set_attributes
 from janrain.capture.version import __version__
-from json import dumps as to_json
+from json import dumps as to_json, loads as from_json
 from base64 import b64encode
 from hashlib import sha1
 import hmac
 import time
 import logging
 import sys
+import threading
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
 
 logger = logging.getLogger(__name__)
 
@@ -17,9 +26,26 @@ logger = logging.getLogger(__name__)
 # import from __init__.py without failing.
 try:
     import requests
+    from requests.exceptions import HTTPError
 except ImportError:
     logger.warn(
         "Missing 'requests' module. Install using 'pip install requests'.")
+    HTTPError = IOError
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+try:
+    from importlib.util import find_spec
+except ImportError:
+    def find_spec(name):
+        import imp
+        try:
+            return imp.find_module(name)
+        except ImportError:
+            return None
 
 
 def api_encode(value):
@@ -89,29 +115,44 @@ def generate_signature(api_call, unsigned_params):
     client_id = params.pop('client_id', None)
     client_secret = params.pop('client_secret', None)
 
-    headers = {}
     if access_token:
         # Simply use the access token if provided rather than id/secret
-        headers['Authorization'] = "OAuth {}".format(access_token)
+        headers = {'Authorization': "OAuth {}".format(access_token)}
     else:
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
-        data = "{}\n{}\n".format(api_call, timestamp)
-        if params:
-            kv_str = ["{}={}".format(k, v) for k, v in params.items()]
-            kv_str.sort()
-            data += "\n".join(kv_str) + "\n"
-        sha1_str = hmac.new(client_secret.encode('utf-8'),
-                            data.encode('utf-8'), sha1).digest()
-        hash_str = b64encode(sha1_str)
-        headers['Date'] = timestamp
-        signature = "Signature {}:{}".format(
-            client_id, hash_str.decode('utf-8'))
-        headers['Authorization'] = signature
-        logger.debug(signature)
+        headers = sign_params(api_call, client_id, client_secret, params)
 
     return headers, params
 
 
+def sign_params(api_call, client_id, client_secret, params):
+    """
+    Generate the "Authorization" and "Date" headers signing an API call with
+    a client_id and client_secret.
+
+    Args:
+        api_call      - The API endpoint as a relative URL.
+        client_id     - The client_id.
+        client_secret - The client_secret.
+        params        - A dictionary of decoded parameters, without the
+                        credentials.
+
+    Returns:
+        A dictionary of HTTP headers.
+    """
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+    data = "{}\n{}\n".format(api_call, timestamp)
+    if params:
+        kv_str = ["{}={}".format(k, v) for k, v in params.items()]
+        kv_str.sort()
+        data += "\n".join(kv_str) + "\n"
+    sha1_str = hmac.new(client_secret.encode('utf-8'),
+                        data.encode('utf-8'), sha1).digest()
+    hash_str = b64encode(sha1_str)
+    signature = "Signature {}:{}".format(client_id, hash_str.decode('utf-8'))
+    logger.debug(signature)
+    return {'Date': timestamp, 'Authorization': signature}
+
+
 def raise_api_exceptions(response):
     """
     Parse the response from the API converting errors into exceptions.
@@ -132,6 +173,235 @@ def raise_api_exceptions(response):
             response['code'], response['error'], message, response)
 
 
+class TransportResponse(object):
+    """
+    A minimal HTTP response returned by the transports which do not use the
+    'requests' library. It provides the subset of the requests.Response
+    interface used by Api.call().
+
+    Args:
+        status_code - The HTTP status code.
+        content     - The (decompressed) response body as a bytestring.
+        headers     - A dictionary of response headers.
+        url         - The URL which was requested.
+    """
+
+    def __init__(self, status_code, content, headers=None, url=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.url = url
+
+    def json(self):
+        """ Decode the response body. Raises ValueError for invalid JSON. """
+        return from_json(api_decode(self.content))
+
+    def raise_for_status(self):
+        """ Raise an HTTPError for 4xx and 5xx status codes. """
+        if 400 <= self.status_code < 600:
+            error = HTTPError("{} Error for url: {}".format(
+                self.status_code, self.url))
+            error.response = self
+            raise error
+
+
+class RequestsTransport(object):
+    """
+    Send API requests using a requests.Session. This is the default
+    transport.
+
+    Args:
+        session - A requests.Session instance (a new one is created if
+                  omitted).
+    """
+
+    def __init__(self, session=None):
+        self.session = session or requests.Session()
+
+    def post(self, url, headers, data, timeout):
+        """
+        POST form encoded data to the API.
+
+        Args:
+            url     - Absolute URL to the API endpoint.
+            headers - A dictionary of HTTP headers.
+            data    - A dictionary of encoded parameters.
+            timeout - A (connect_timeout, read_timeout) 2-tuple in seconds.
+
+        Returns:
+            A response object providing status_code, content, json() and
+            raise_for_status().
+        """
+        return self.session.post(url, headers=headers, data=data,
+                                 timeout=timeout)
+
+
+class Urllib3Transport(object):
+    """
+    Send API requests directly through a urllib3 connection pool. This skips
+    most of the per-request overhead of requests.Session.
+
+    Args:
+        pool_manager - A urllib3.PoolManager instance (a new one is created if
+                       omitted).
+
+    Keyword Args:
+        Passed through to urllib3.PoolManager() when creating a new pool.
+    """
+
+    def __init__(self, pool_manager=None, **kwargs):
+        import urllib3
+        self._urllib3 = urllib3
+        self.pool_manager = pool_manager or urllib3.PoolManager(**kwargs)
+
+    def post(self, url, headers, data, timeout):
+        """ See RequestsTransport.post() """
+        connect_timeout, read_timeout = timeout
+        response = self.pool_manager.request_encode_body(
+            'POST', url, fields=data, headers=headers, encode_multipart=False,
+            timeout=self._urllib3.Timeout(connect=connect_timeout,
+                                          read=read_timeout),
+            retries=False)
+        return TransportResponse(response.status, response.data,
+                                 dict(response.headers), url)
+
+
+class Http2Transport(object):
+    """
+    Send API requests over HTTP/2 using the optional 'httpx' library. Calls
+    made concurrently from many threads are multiplexed as streams over a
+    small number of connections instead of opening one connection per
+    in-flight request.
+
+    HTTP/2 is negotiated with the server during the TLS handshake. The
+    transport falls back to HTTP/1.1 when the server does not support it or
+    when the 'h2' module is not installed.
+
+    Install the dependencies using 'pip install httpx[http2]'.
+
+    Args:
+        client          - An httpx.Client instance (a new one is created if
+                          omitted).
+        max_connections - Maximum number of connections in the pool.
+
+    Keyword Args:
+        Passed through to httpx.Client() when creating a new client.
+    """
+
+    def __init__(self, client=None, max_connections=4, **kwargs):
+        import httpx
+        self._httpx = httpx
+        if client is None:
+            http2 = find_spec("h2") is not None
+            if not http2:
+                logger.warning("Missing 'h2' module, falling back to "
+                               "HTTP/1.1. Install using "
+                               "'pip install httpx[http2]'.")
+            limits = httpx.Limits(max_connections=max_connections)
+            client = httpx.Client(http2=http2, limits=limits, **kwargs)
+        self.client = client
+
+    def post(self, url, headers, data, timeout):
+        """ See RequestsTransport.post() """
+        connect_timeout, read_timeout = timeout
+        response = self.client.post(
+            url, headers=headers,
+            data={k: api_decode(v) for k, v in data.items()},
+            timeout=self._httpx.Timeout(read_timeout, connect=connect_timeout))
+        logger.debug("{} {}".format(response.http_version, url))
+        return TransportResponse(response.status_code, response.content,
+                                 dict(response.headers), url)
+
+
+class MemoryTransport(object):
+    """
+    Serve canned responses from memory without touching the network. Useful
+    for tests and for benchmarking the encoding, signing and decoding work
+    done by Api.call() in isolation.
+
+    Every request is recorded in the 'requests' attribute as a dictionary
+    with 'url', 'path', 'headers', 'params' and 'timeout' keys.
+
+    Args:
+        responses - A dictionary keyed by API endpoint (eg. "/entity.count").
+                    See add() for the allowed values.
+
+    Example:
+        transport = MemoryTransport()
+        transport.add("entity.count", {"stat": "ok", "total_count": 5})
+        api = janrain.capture.Api("foo.janrain.com", transport=transport)
+    """
+
+    def __init__(self, responses=None):
+        self.responses = {}
+        self.requests = []
+        for api_call, response in (responses or {}).items():
+            self.add(api_call, response)
+
+    def add(self, api_call, response, status_code=200):
+        """
+        Register the response for an endpoint.
+
+        Args:
+            api_call    - The API endpoint as a relative URL.
+            response    - A dictionary to encode as JSON, a bytestring body, or
+                          a callable which is passed the decoded parameters
+                          and returns either of those.
+            status_code - The HTTP status code to respond with.
+        """
+        if api_call[0] != "/":
+            api_call = "/" + api_call
+        self.responses[api_call] = (response, status_code)
+
+    def post(self, url, headers, data, timeout):
+        """ See RequestsTransport.post() """
+        path = urlparse(url).path
+        params = {k: api_decode(v) for k, v in data.items()}
+        self.requests.append({
+            'url': url,
+            'path': path,
+            'headers': headers,
+            'params': params,
+            'timeout': timeout,
+        })
+        if path not in self.responses:
+            return TransportResponse(404, b'', url=url)
+        response, status_code = self.responses[path]
+        if callable(response):
+            response = response(params)
+        if isinstance(response, (dict, list)):
+            response = to_json(response).encode('utf-8')
+        return TransportResponse(status_code, response, url=url)
+
+
+#: Transports which can be selected by name (eg. from the command-line).
+TRANSPORTS = {
+    'requests': RequestsTransport,
+    'urllib3': Urllib3Transport,
+    'http2': Http2Transport,
+}
+
+
+class CallInfo(object):
+    """
+    Measurements for a single request made by Api.call(). See Api.last_call.
+
+    Attributes:
+        url           - Absolute URL of the API endpoint.
+        status_code   - The HTTP status code of the response.
+        response_size - Size of the (decompressed) response body in bytes.
+        network_time  - Seconds spent waiting for the transport.
+        decode_time   - Seconds spent decoding the JSON response.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.status_code = None
+        self.response_size = 0
+        self.network_time = 0.0
+        self.decode_time = 0.0
+
+
 class Api(object):
     """
     Base object for making API calls to the Janrain API.
@@ -143,6 +413,30 @@ class Api(object):
         sign_requests   - A boolean indicating to sign the requests.
         user_agent      - A string specifying the HTTP user agent.
         connect_timeout - Seconds to wait for HTTP connection to be established.
+        transport       - The object used to send HTTP requests (defaults to a
+                          RequestsTransport). See also Urllib3Transport and
+                          MemoryTransport.
+        circuit_breaker - A janrain.capture.breaker.CircuitBreaker used to fail
+                          fast while an endpoint is unhealthy.
+        validate_schemas - A boolean indicating to check records sent to
+                          entity.create, entity.update and entity.bulkCreate
+                          against the cached entityType schema.
+        tracer          - An OpenTelemetry tracer used to create a span for
+                          each call (see janrain.capture.tracing).
+        rate_limiter    - A RateLimiter or SharedRateLimiter every call waits
+                          on before it is sent.
+        scheduler       - A Scheduler deciding the order in which concurrent
+                          calls are sent (see janrain.capture.scheduler).
+        hedging         - A HedgePolicy for sending duplicate requests to
+                          slow read endpoints (see janrain.capture.hedge).
+        concurrency_limiter - An AdaptiveConcurrency limiting the calls in
+                          flight (see janrain.capture.concurrency). With a
+                          scheduler, its limit also caps the calls the
+                          scheduler dispatches.
+        token_cache     - A SharedTokenCache (see janrain.capture.sharedstate).
+                          Signed calls using the default client credentials
+                          are then authorized with its OAuth access token,
+                          fetched with fetch_token() when it expires.
 
     Example:
         defaults = {'client_id': "...", 'client_secret': "..."}
@@ -151,7 +445,10 @@ class Api(object):
     """
 
     def __init__(self, api_url, defaults={}, compress=True, sign_requests=True,
-                 user_agent=None, connect_timeout=10):
+                 user_agent=None, connect_timeout=10, transport=None,
+                 circuit_breaker=None, validate_schemas=False, tracer=None,
+                 rate_limiter=None, scheduler=None, hedging=None,
+                 concurrency_limiter=None, token_cache=None):
 
         api_url = api_url.rstrip("/")
         if api_url[0:4] == "http":
@@ -171,7 +468,33 @@ class Api(object):
         # read timeout will match 'timeout' parameter passed to API call
         self.connect_timeout = connect_timeout
 
-        self.session = requests.Session()
+        self.transport = transport or RequestsTransport()
+        self.circuit_breaker = circuit_breaker
+        self.schemas = SchemaCache(self) if validate_schemas else None
+        self.tracer = tracer
+        self.rate_limiter = rate_limiter
+        self.scheduler = scheduler
+        self.hedging = hedging
+        self.concurrency_limiter = concurrency_limiter
+        if scheduler is not None and concurrency_limiter is not None and \
+                scheduler.concurrency_limiter is None:
+            scheduler.concurrency_limiter = concurrency_limiter
+        self.token_cache = token_cache
+        self._local = threading.local()
+
+    @property
+    def last_call(self):
+        """ The CallInfo for the latest request made by the current thread. """
+        return getattr(self._local, 'last_call', None)
+
+    @property
+    def session(self):
+        """ The requests.Session used by a RequestsTransport. """
+        return self.transport.session
+
+    @session.setter
+    def session(self, session):
+        self.transport = RequestsTransport(session)
 
     def call(self, api_call, **kwargs):
         """
@@ -189,40 +512,258 @@ class Api(object):
 
         Raises:
             ApiResponseError
+            JanrainDeadlineError (when called inside an expired Deadline)
+            JanrainCircuitOpenError (when the circuit breaker is open)
+            JanrainValidationError (when validating schemas)
         """
-        # Encode values for the API (JSON, bools, nulls)
-        params = self.defaults.copy()
-        for key, value in kwargs.items():
-            if value is not None:
-                params[key] = value
+        return self._request(api_call, kwargs, self._send)
+
+    def call_raw(self, api_call, **kwargs):
+        """
+        Make an API call like call() but return the undecoded response body.
+        Decoding can then be deferred or moved elsewhere (eg. to another
+        process). Only bodies up to ERROR_BODY_SIZE bytes are decoded to
+        detect error responses, which are always small.
+
+        Args:
+            api_call - The API endpoint as a relative URL.
+
+        Returns:
+            The (decompressed) response body as a bytestring.
+        """
+        return self._request(api_call, kwargs, self._send_raw)
+
+    def fetch_token(self):
+        """
+        Fetch an OAuth access token for the client with the client
+        credentials grant. Used to fill the token_cache.
+
+        Returns:
+            An (access_token, expires_in) 2-tuple.
+        """
+        result = self.call("oauth/token", grant_type="client_credentials")
+        return result['access_token'], result['expires_in']
+
+    def prepare(self, api_call, **kwargs):
+        """
+        Prepare an API call which is made repeatedly with the same
+        parameters. The endpoint URL, headers and the static parameters
+        (including the defaults) are encoded once, so that each invocation
+        only encodes and signs the parameters which vary.
+
+        Changes to the defaults, user agent or signing settings of the Api
+        after the call is prepared do not affect it.
+
+        Args:
+            api_call - The API endpoint as a relative URL.
+
+        Keyword Args:
+            Static parameters sent with every invocation.
+
+        Returns:
+            A PreparedCall which is invoked with the varying parameters.
+
+        Example:
+            find = api.prepare("entity.find", type_name="user",
+                               attributes=["uuid", "email"])
+            for email in emails:
+                find(filter="email = '{}'".format(email))
+        """
+        return PreparedCall(self, api_call, kwargs)
+
+    def _request(self, api_call, kwargs, send):
+        """ Encode and sign the parameters and send them with send(). """
+        return PreparedCall(self, api_call, {})._invoke(kwargs, send)
+
+    def _post(self, url, headers, params, timeout):
+        """ Send the encoded request and measure the response. """
+        info = self._local.last_call = CallInfo(url)
+        with span(self.tracer, "network") as current:
+            start = monotonic()
+            r = self.transport.post(url, headers, params, timeout)
+            info.network_time = monotonic() - start
+            info.status_code = r.status_code
+            info.response_size = len(r.content)
+            set_attributes(current, **{
+                'http.status_code': info.status_code,
+                'janrain.response_size': info.response_size,
+            })
+        return r, info
+
+    def _send_raw(self, url, headers, params, timeout):
+        """ Send the encoded request and return the response body. """
+        r, info = self._post(url, headers, params, timeout)
+        if len(r.content) <= ERROR_BODY_SIZE:
+            try:
+                data = r.json()
+            except ValueError:
+                data = None
+            if isinstance(data, dict):
+                raise_api_exceptions(data)
+        if r.status_code not in (200, 400, 401):
+            r.raise_for_status()
+        return r.content
 
-        params = {k: api_encode(v) for k, v in params.items()}
+    def _send(self, url, headers, params, timeout):
+        """ Send the encoded request and decode the response. """
+        r, info = self._post(url, headers, params, timeout)
 
+        # json.decoder.JSONDecodeError
+        try:
+            with span(self.tracer, "decode"):
+                start = monotonic()
+                data = r.json()
+                info.decode_time = monotonic() - start
+            raise_api_exceptions(data)
+            if r.status_code not in (200, 400, 401):
+                # /oauth/token returns 400 or 401
+                r.raise_for_status()
+            return data
+        except ValueError:
+            # The response was not valid JSON (empty body, 5xx errors, etc.)
+            r.raise_for_status()
+
+
+#: Size of the largest response body checked for errors by Api.call_raw().
+ERROR_BODY_SIZE = 4096
+
+#: Parameters which are turned into the Authorization header when signing.
+CREDENTIAL_PARAMS = frozenset(['access_token', 'client_id', 'client_secret'])
+
+
+class PreparedCall(object):
+    """
+    An API call with its URL, headers and static parameters encoded ahead of
+    time. Created by Api.prepare().
+
+    Args:
+        api      - The janrain.capture.Api instance making the call.
+        api_call - The API endpoint as a relative URL.
+        params   - A dictionary of static parameters.
+    """
+
+    def __init__(self, api, api_call, params):
+        self.api = api
         if api_call[0] != "/":
             api_call = "/" + api_call
-        url = self.api_url + api_call
-        logger.debug(url)
+        self.api_call = api_call
+        self.url = api.api_url + api_call
+        self.sign_requests = api.sign_requests
 
-        # Signing the request modifies the request object and params in-place.
-        # Sign the request *before* encoding and passing the params.
-        if self.sign_requests:
-            headers, params = generate_signature(api_call, params)
-        else:
-            headers = {}
+        # Encode values for the API (JSON, bools, nulls)
+        static = api.defaults.copy()
+        for key, value in params.items():
+            if value is not None:
+                static[key] = value
+        self.static = static
+
+        # the cached token is fetched with the default client credentials
+        # and only stands in for them
+        self._token_cache = None
+        if self.sign_requests and api.token_cache is not None and \
+                api_call != "/oauth/token" and \
+                not CREDENTIAL_PARAMS.intersection(params) and \
+                not static.get('access_token'):
+            self._token_cache = api.token_cache
+        params = {k: api_encode(v) for k, v in static.items()}
 
         # Custom user agent string
-        headers['User-Agent'] = self.user_agent
-
-        # Print the parameters (for debugging)
-        print_params = params.copy()
-        if 'client_secret' in print_params:
-            print_params['client_secret'] = "REDACTED"
-        logger.debug(print_params)
+        headers = {'User-Agent': api.user_agent}
 
         # Accept gzip compression
-        if self.compress:
+        if api.compress:
             headers['Accept-encoding'] = 'gzip'
 
+        self._credentials = None
+        if self.sign_requests:
+            # Do not POST authentication parameters. Use them to create an
+            # authentication header instead.
+            params = {k: api_decode(v) for k, v in params.items()}
+            access_token = params.pop('access_token', None)
+            client_id = params.pop('client_id', None)
+            client_secret = params.pop('client_secret', None)
+            if access_token:
+                headers['Authorization'] = "OAuth {}".format(access_token)
+            elif self._token_cache is None:
+                self._credentials = (client_id, client_secret)
+        self._params = params
+        self._headers = headers
+
+    def __call__(self, **kwargs):
+        """
+        Make the API call.
+
+        Keyword Args:
+            The varying parameters, added to the static parameters.
+
+        Returns:
+            The decoded response (see Api.call()).
+        """
+        return self._invoke(kwargs, self.api._send)
+
+    def raw(self, **kwargs):
+        """ Make the API call and return the undecoded response body. """
+        return self._invoke(kwargs, self.api._send_raw)
+
+    def _invoke(self, kwargs, send):
+        api = self.api
+        if self.sign_requests and CREDENTIAL_PARAMS.intersection(kwargs):
+            # credentials passed per call are signed like any other call
+            params = dict(self.static, **kwargs)
+            return PreparedCall(api, self.api_call, params)._invoke({}, send)
+
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.check()
+
+        if api.schemas is not None:
+            api.schemas.validate_call(self.api_call.lstrip("/"),
+                                      dict(self.static, **kwargs))
+
+        with span(api.tracer, "capture " + self.api_call, **{
+                'janrain.endpoint': self.api_call,
+                'http.url': self.url}) as current:
+            try:
+                result = self._send_traced(kwargs, send, deadline)
+            except ApiResponseError as error:
+                set_attributes(current, **{'janrain.error_code': error.code})
+                raise
+            info = api.last_call
+            if info is not None:
+                set_attributes(current, **{
+                    'http.status_code': info.status_code,
+                    'janrain.response_size': info.response_size,
+                })
+            return result
+
+    def _send_traced(self, kwargs, send, deadline):
+        api = self.api
+        with span(api.tracer, "encode"):
+            params = self._params.copy()
+            for key, value in kwargs.items():
+                if value is not None:
+                    value = api_encode(value)
+                    params[key] = api_decode(value) if self.sign_requests \
+                        else value
+
+        with span(api.tracer, "sign"):
+            logger.debug(self.url)
+            headers = self._headers.copy()
+            if self._token_cache is not None:
+                headers['Authorization'] = "OAuth {}".format(
+                    self._token_cache.get(api.fetch_token))
+            elif self._credentials is not None:
+                headers.update(sign_params(self.api_call,
+                                           self._credentials[0],
+                                           self._credentials[1], params))
+
+        # Print the parameters (for debugging)
+        if logger.isEnabledFor(logging.DEBUG):
+            print_params = params.copy()
+            if 'client_secret' in print_params:
+                print_params['client_secret'] = "REDACTED"
+            logger.debug(print_params)
+
         # Let any exceptions here get raised to the calling code. This includes
         # things like connection errors and timeouts.
 
@@ -230,16 +771,83 @@ class Api(object):
             read_timeout = params['timeout']
         else:
             read_timeout = 10
-        r = self.session.post(url, headers=headers, data=params,
-                              timeout=(self.connect_timeout, read_timeout))
-
-        # json.decoder.JSONDecodeError
-        try:
-            raise_api_exceptions(r.json())
-            if r.status_code not in (200, 400, 401):
-                # /oauth/token returns 400 or 401
-                r.raise_for_status()
-            return r.json()
-        except ValueError:
-            # The response was not valid JSON (empty body, 5xx errors, etc.)
-            r.raise_for_status()
+        timeout = (api.connect_timeout, read_timeout)
+        if api.rate_limiter is not None:
+            api.rate_limiter.acquire()
+
+        if api.scheduler is not None:
+            with span(api.tracer, "queue"):
+                api.scheduler.acquire()
+            try:
+                return self._limited(send, headers, params, timeout,
+                                     deadline)
+            finally:
+                api.scheduler.release()
+        return self._limited(send, headers, params, timeout, deadline)
+
+    def _limited(self, send, headers, params, timeout, deadline):
+        # the Scheduler only dispatches calls up to the limiter's current
+        # limit, so calls wait for a slot in priority order
+        limiter = self.api.concurrency_limiter
+        if limiter is None:
+            return self._dispatch(send, headers, params, timeout, deadline)
+        return limiter.call(self._dispatch, send, headers, params, timeout,
+                            deadline)
+
+    def _dispatch(self, send, headers, params, timeout, deadline):
+        if deadline is not None:
+            timeout = deadline.clamp(*timeout)
+
+        hedging = self.api.hedging
+        if hedging is not None and hedging.applies(self.api_call):
+            send = self._hedged(hedging, send)
+
+        if self.api.circuit_breaker is not None:
+            return self.api.circuit_breaker.call(
+                self.url, send, self.url, headers, params, timeout)
+        return send(self.url, headers, params, timeout)
+
+    def _hedged(self, hedging, send):
+        """ Wrap send() so that slow requests are hedged. """
+        api = self.api
+
+        def send_measured(*args):
+            return send(*args), api.last_call
+
+        def admit():
+            # the duplicate is only sent if it can take its own slots and
+            # rate limit token right away; the slots are taken first since
+            # a token cannot be given back
+            scheduler = api.scheduler
+            if scheduler is not None and not scheduler.try_acquire():
+                return None
+            limiter = api.concurrency_limiter
+            started = None
+            if limiter is not None:
+                started = limiter.try_acquire()
+                if started is None:
+                    if scheduler is not None:
+                        scheduler.cancel()
+                    return None
+            if api.rate_limiter is not None and \
+                    api.rate_limiter.try_acquire():
+                if limiter is not None:
+                    limiter.cancel()
+                if scheduler is not None:
+                    scheduler.cancel()
+                return None
+
+            def release(error):
+                if limiter is not None:
+                    limiter.release(started, error)
+                if scheduler is not None:
+                    scheduler.release()
+
+            return release
+
+        def send_hedged(*args):
+            result, api._local.last_call = hedging.call(
+                self.api_call, send_measured, args, admit)
+            return result
+
+        return send_hedged
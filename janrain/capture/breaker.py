@@ -0,0 +1,226 @@
+"""
+Circuit breaker for failing fast when an API endpoint is unhealthy.
+
+Example:
+    breaker = CircuitBreaker(failure_threshold=0.5, reset_timeout=30)
+    api = janrain.capture.Api("https://...", defaults,
+                              circuit_breaker=breaker)
+    ...
+    print(breaker.snapshot())
+"""
+from collections import deque
+import socket
+import threading
+import logging
+from janrain.capture.exceptions import ApiResponseError, \
+    JanrainCircuitOpenError
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def _timeout_errors():
+    errors = [socket.timeout]
+    try:
+        from requests.exceptions import Timeout
+        errors.append(Timeout)
+    except ImportError:
+        pass
+    try:
+        from urllib3.exceptions import TimeoutError
+        errors.append(TimeoutError)
+    except ImportError:
+        pass
+    try:
+        from httpx import TimeoutException
+        errors.append(TimeoutException)
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+TIMEOUT_ERRORS = _timeout_errors()
+
+
+class _Circuit(object):
+    """ State of the circuit for a single endpoint. """
+
+    def __init__(self, window):
+        self.state = CLOSED
+        # changed on every state change, so that calls admitted in an
+        # earlier state cannot decide the current one
+        self.generation = 0
+        self.outcomes = deque(maxlen=window)
+        self.opened_at = None
+        self.probes = 0
+        self.rejected = 0
+
+
+class CircuitBreaker(object):
+    """
+    Track the outcome of recent calls per endpoint and reject calls while an
+    endpoint is failing. After reset_timeout seconds a limited number of
+    half-open probe calls are let through. The circuit closes again if they
+    succeed and re-opens if they fail.
+
+    Timeouts, HTTP 5xx errors and ApiResponseErrors with one of the listed
+    codes count as failures. Any other outcome counts as a success.
+
+    Args:
+        failure_threshold - Fraction of failed calls in the window which
+                            opens the circuit.
+        min_calls         - Number of calls in the window before the failure
+                            rate is evaluated.
+        window            - Number of recent calls tracked per endpoint.
+        reset_timeout     - Seconds to wait before probing an open circuit.
+        half_open_calls   - Number of probe calls allowed at the same time.
+        error_codes       - ApiResponseError codes counted as failures.
+    """
+
+    def __init__(self, failure_threshold=0.5, min_calls=10, window=20,
+                 reset_timeout=30, half_open_calls=1, error_codes=()):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.error_codes = set(error_codes)
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def _circuit(self, endpoint):
+        if endpoint not in self._circuits:
+            self._circuits[endpoint] = _Circuit(self.window)
+        return self._circuits[endpoint]
+
+    def is_failure(self, error):
+        """
+        Decide whether an exception counts against the health of an endpoint.
+
+        Args:
+            error - The exception raised by Api.call()
+
+        Returns:
+            True if the exception should be counted as a failure.
+        """
+        if isinstance(error, ApiResponseError):
+            return error.code in self.error_codes
+        if isinstance(error, TIMEOUT_ERRORS):
+            return True
+        response = getattr(error, 'response', None)
+        status_code = getattr(response, 'status_code', None)
+        return isinstance(status_code, int) and status_code >= 500
+
+    def before_call(self, endpoint):
+        """
+        Returns:
+            The generation of the circuit, to pass to record().
+
+        Raises:
+            JanrainCircuitOpenError if the call should not be attempted.
+        """
+        with self._lock:
+            circuit = self._circuit(endpoint)
+            if circuit.state == OPEN:
+                if monotonic() - circuit.opened_at < self.reset_timeout:
+                    circuit.rejected += 1
+                    raise JanrainCircuitOpenError(endpoint)
+                logger.debug("Circuit half-open for {}".format(endpoint))
+                circuit.state = HALF_OPEN
+                circuit.generation += 1
+                circuit.probes = 0
+            if circuit.state == HALF_OPEN:
+                if circuit.probes >= self.half_open_calls:
+                    circuit.rejected += 1
+                    raise JanrainCircuitOpenError(endpoint)
+                circuit.probes += 1
+            return circuit.generation
+
+    def record(self, endpoint, failed, generation=None):
+        """
+        Record the outcome of a call.
+
+        Args:
+            endpoint   - The endpoint the call was made to.
+            failed     - True if the call failed.
+            generation - The value returned by before_call() for the call.
+                         Outcomes of calls admitted before the circuit last
+                         changed state are ignored.
+        """
+        with self._lock:
+            circuit = self._circuit(endpoint)
+            if generation is not None and generation != circuit.generation:
+                return
+            if circuit.state == HALF_OPEN:
+                if failed:
+                    self._open(endpoint, circuit)
+                else:
+                    logger.debug("Circuit closed for {}".format(endpoint))
+                    circuit.state = CLOSED
+                    circuit.generation += 1
+                    circuit.outcomes.clear()
+                return
+            circuit.outcomes.append(failed)
+            calls = len(circuit.outcomes)
+            if circuit.state == CLOSED and calls >= self.min_calls and \
+                    sum(circuit.outcomes) >= self.failure_threshold * calls:
+                self._open(endpoint, circuit)
+
+    def _open(self, endpoint, circuit):
+        logger.warning("Circuit opened for {}".format(endpoint))
+        circuit.state = OPEN
+        circuit.generation += 1
+        circuit.opened_at = monotonic()
+        circuit.outcomes.clear()
+
+    def call(self, endpoint, func, *args, **kwargs):
+        """
+        Call a function guarded by the circuit for an endpoint.
+
+        Raises:
+            JanrainCircuitOpenError if the circuit is open. Any exception
+            raised by the function is re-raised after being recorded.
+        """
+        generation = self.before_call(endpoint)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as error:
+            self.record(endpoint, self.is_failure(error), generation)
+            raise
+        self.record(endpoint, False, generation)
+        return result
+
+    def state(self, endpoint):
+        """ The state of the circuit for an endpoint ('closed', 'open' or
+        'half_open'). """
+        with self._lock:
+            return self._circuit(endpoint).state
+
+    def snapshot(self):
+        """
+        Report the state of every circuit, eg. for dashboards.
+
+        Returns:
+            A dictionary keyed by endpoint.
+        """
+        with self._lock:
+            report = {}
+            for endpoint, circuit in self._circuits.items():
+                calls = len(circuit.outcomes)
+                failures = sum(circuit.outcomes)
+                report[endpoint] = {
+                    'state': circuit.state,
+                    'calls': calls,
+                    'failures': failures,
+                    'failure_rate': float(failures) / calls if calls else 0.0,
+                    'rejected': circuit.rejected,
+                }
+            return report
@@ -0,0 +1,198 @@
+"""
+Record real API traffic to a file and replay it without a network.
+
+Requests are keyed by endpoint and canonical parameters with credentials
+removed, and stored with their status, body and latency in gzip-compressed
+JSON lines. Replaying them through the same Api code path makes profiling
+repeatable against production-shaped payloads. Secrets in JSON response
+bodies (eg. the access_token returned by oauth/token) are replaced with
+"REDACTED".
+
+Example:
+    # record
+    with RecordingTransport(RequestsTransport(), "export.cassette") as rec:
+        api = Api("https://...", defaults, transport=rec)
+        run_pipeline(api)
+
+    # replay at the recorded speed
+    api = Api("https://...", defaults,
+              transport=ReplayTransport("export.cassette", latency_scale=1))
+    run_pipeline(api)
+"""
+from base64 import b64encode, b64decode
+from json import dumps as to_json, loads as from_json
+import gzip
+import threading
+import time
+from janrain.capture.api import TransportResponse, CREDENTIAL_PARAMS, \
+    api_decode
+from janrain.capture.exceptions import JanrainCassetteError
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+#: Parameters which change on every request and are left out of the key.
+VOLATILE_PARAMS = frozenset(['timeout'])
+
+#: Response fields whose values are not written to cassettes.
+REDACTED_FIELDS = frozenset(['access_token', 'refresh_token',
+                             'authorization_code', 'client_secret'])
+
+
+def request_key(url, params):
+    """
+    Build the key identifying a request.
+
+    Args:
+        url    - Absolute URL of the API endpoint.
+        params - A dictionary of request parameters.
+
+    Returns:
+        The endpoint path followed by the canonical JSON parameters without
+        credentials, and with other secrets (eg. a refresh_token) redacted.
+    """
+    params = {k: "REDACTED" if k in REDACTED_FIELDS else api_decode(v)
+              for k, v in params.items()
+              if k not in CREDENTIAL_PARAMS and k not in VOLATILE_PARAMS}
+    return "{} {}".format(urlparse(url).path,
+                          to_json(params, sort_keys=True,
+                                  separators=(',', ':')))
+
+
+def redact(value, fields=REDACTED_FIELDS):
+    """
+    Replace the values of secret fields anywhere in decoded JSON.
+
+    Args:
+        value  - A decoded JSON value.
+        fields - The names of the fields to redact.
+
+    Returns:
+        A (value, redacted) 2-tuple where redacted is True if anything was
+        replaced.
+    """
+    redacted = False
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if key in fields:
+                result[key] = "REDACTED"
+                redacted = True
+            else:
+                result[key], changed = redact(item, fields)
+                redacted = redacted or changed
+        return result, redacted
+    if isinstance(value, list):
+        result = []
+        for item in value:
+            item, changed = redact(item, fields)
+            result.append(item)
+            redacted = redacted or changed
+        return result, redacted
+    return value, False
+
+
+def _redact_body(body, fields):
+    try:
+        data = from_json(body)
+    except ValueError:
+        return body
+    data, redacted = redact(data, fields)
+    return to_json(data, separators=(',', ':')) if redacted else body
+
+
+class RecordingTransport(object):
+    """
+    Wrap a transport and record every request and response to a file.
+
+    Args:
+        transport     - The transport making the real requests.
+        path          - Path to the cassette file (appended to).
+        redact_fields - Names of JSON response fields whose values are
+                        replaced with "REDACTED" in the cassette.
+    """
+
+    def __init__(self, transport, path, redact_fields=REDACTED_FIELDS):
+        self.transport = transport
+        self.path = path
+        self.redact_fields = frozenset(redact_fields)
+        self._stream = gzip.open(path, 'ab')
+        self._lock = threading.Lock()
+
+    def post(self, url, headers, data, timeout):
+        """ See janrain.capture.api.RequestsTransport.post() """
+        start = monotonic()
+        response = self.transport.post(url, headers, data, timeout)
+        latency = monotonic() - start
+        entry = {
+            'key': request_key(url, data),
+            'status_code': response.status_code,
+            'latency': round(latency, 6),
+        }
+        try:
+            entry['body'] = _redact_body(response.content.decode('utf-8'),
+                                         self.redact_fields)
+        except UnicodeDecodeError:
+            entry['body_b64'] = b64encode(response.content).decode('ascii')
+        line = (to_json(entry, separators=(',', ':')) + "\n").encode('utf-8')
+        with self._lock:
+            self._stream.write(line)
+        return response
+
+    def close(self):
+        with self._lock:
+            self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ReplayTransport(object):
+    """
+    Answer requests from a cassette file. Requests recorded several times
+    are replayed in the recorded order, starting over once exhausted.
+
+    Args:
+        path          - Path to the cassette file.
+        latency_scale - Sleep for the recorded latency multiplied by this
+                        factor before responding (None to respond at once).
+    """
+
+    def __init__(self, path, latency_scale=None):
+        self.latency_scale = latency_scale
+        self.entries = {}
+        self._positions = {}
+        self._lock = threading.Lock()
+        with gzip.open(path, 'rb') as stream:
+            for line in stream:
+                entry = from_json(line.decode('utf-8'))
+                self.entries.setdefault(entry['key'], []).append(entry)
+
+    def post(self, url, headers, data, timeout):
+        """ See janrain.capture.api.RequestsTransport.post() """
+        key = request_key(url, data)
+        with self._lock:
+            entries = self.entries.get(key)
+            if not entries:
+                raise JanrainCassetteError(
+                    "No recorded response for {}".format(key))
+            position = self._positions.get(key, 0)
+            self._positions[key] = (position + 1) % len(entries)
+        entry = entries[position]
+        if self.latency_scale:
+            time.sleep(entry['latency'] * self.latency_scale)
+        if 'body_b64' in entry:
+            body = b64decode(entry['body_b64'])
+        else:
+            body = entry['body'].encode('utf-8')
+        return TransportResponse(entry['status_code'], body, url=url)
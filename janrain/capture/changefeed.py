@@ -0,0 +1,145 @@
+"""
+Incrementally sync changed entities using lastUpdated watermarks.
+
+The watermark is the (lastUpdated, id) position of the last record handed
+out. It is saved after each page has been consumed, so a restarted sync
+resumes where it left off and only pulls entities changed since then.
+
+Example:
+    feed = ChangeFeed(api, FileWatermarkStore("/var/lib/sync/users.json"),
+                      attributes=["uuid", "email", "displayName"])
+    for entity in feed:
+        push_downstream(entity)
+"""
+from json import dumps as to_json, loads as from_json
+import os
+import tempfile
+import time
+import logging
+from janrain.capture.filters import filter_literal, join_filters
+from janrain.capture.paginate import Paginator
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryWatermarkStore(object):
+    """ Keep the watermark in memory (mostly useful for tests). """
+
+    def __init__(self, watermark=None):
+        self.watermark = watermark
+
+    def load(self):
+        return self.watermark
+
+    def save(self, watermark):
+        self.watermark = watermark
+
+
+class FileWatermarkStore(object):
+    """
+    Keep the watermark in a JSON file. Writes are atomic so that a crash
+    never leaves a corrupt watermark behind.
+
+    Args:
+        path - Path to the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """
+        Returns:
+            The saved watermark or None if nothing was saved yet.
+        """
+        try:
+            with open(self.path) as stream:
+                return from_json(stream.read())
+        except IOError:
+            return None
+
+    def save(self, watermark):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as stream:
+                stream.write(to_json(watermark))
+                stream.flush()
+                os.fsync(stream.fileno())
+            os.rename(temp_path, self.path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+
+class ChangeFeed(object):
+    """
+    Iterate over the entities changed since the saved watermark.
+
+    Args:
+        api        - A janrain.capture.Api instance.
+        store      - An object with load() and save(watermark) methods (eg.
+                     FileWatermarkStore).
+        type_name  - The entity type to sync.
+        attributes - A list of attributes to return (defaults to all).
+        filter     - An additional entity.find filter.
+        page_size  - Maximum number of records per entity.find call.
+        since      - lastUpdated value to start from when no watermark has
+                     been saved yet (defaults to the beginning).
+    """
+
+    def __init__(self, api, store, type_name="user", attributes=None,
+                 filter=None, page_size=1000, since=None):
+        self.api = api
+        self.store = store
+        self.type_name = type_name
+        self.attributes = attributes
+        self.filter = filter
+        self.page_size = page_size
+        self.since = since
+
+    def paginator(self):
+        """ A Paginator positioned at the saved watermark. """
+        watermark = self.store.load()
+        position = None
+        if watermark is not None:
+            position = [watermark['lastUpdated'], watermark['id']]
+        base_filter = self.filter
+        if position is None and self.since is not None:
+            since_filter = "lastUpdated >= {}".format(
+                filter_literal(self.since))
+            base_filter = join_filters([self.filter, since_filter])
+        return Paginator(self.api, self.type_name, base_filter,
+                         self.attributes, ("lastUpdated", "id"),
+                         self.page_size, position)
+
+    def pages(self):
+        """
+        Generate pages of changed entities until caught up, saving the
+        watermark after each page is consumed.
+        """
+        paginator = self.paginator()
+        for page in paginator.pages():
+            yield page
+            last = page[-1]
+            self.store.save({'lastUpdated': last['lastUpdated'],
+                             'id': last['id']})
+
+    def __iter__(self):
+        for page in self.pages():
+            for record in page:
+                yield record
+
+    def follow(self, interval=60):
+        """
+        Poll for changes forever, sleeping between polls once caught up.
+
+        Args:
+            interval - Seconds to wait between polls.
+        """
+        while True:
+            for record in self:
+                yield record
+            logger.debug("Change feed caught up, sleeping {}s".format(
+                interval))
+            time.sleep(interval)
@@ -7,6 +7,11 @@ import logging
 from argparse import ArgumentParser, HelpFormatter
 from janrain.capture import Api, config, get_version, ApiResponseError, \
     JanrainCredentialsError, JanrainConfigError
+from janrain.capture.api import TRANSPORTS
+from janrain.capture.fanout import init_apis, fan_out
+from janrain.capture.loadtest import run_load_test
+from janrain.capture.profiling import Profile
+from janrain.capture.tracing import span
 
 
 class ApiArgumentParser(ArgumentParser):
@@ -47,6 +52,11 @@ class ApiArgumentParser(ArgumentParser):
                           help="authenticate using the default client defined "
                                "in the configuration file")
 
+        # every client found in the configuration file
+        self.add_argument('-A', '--all-clients', action='store_true',
+                          help="run against every client defined in the "
+                               "configuration file")
+
     def parse_args(self, args=None, namespace=None):
         # override to store the result which can later be used by init_api()
         args = super(ApiArgumentParser, self).parse_args(args, namespace)
@@ -116,6 +126,21 @@ class ApiArgumentParser(ArgumentParser):
         else:
             return Api(credentials['apid_uri'], defaults)
 
+    def init_apis(self, api_class=None):
+        """
+        Initialize one janrain.capture.Api() instance for each client defined
+        in the configuration file. Used with the --all-clients flag.
+
+        Returns:
+            A dictionary of janrain.capture.Api instances keyed by client name
+
+        """
+        if not self._parsed_args:
+            raise Exception("You must call the parse_args() method before "
+                            "the init_apis() method.")
+
+        return init_apis(api_class=api_class or Api)
+
 # flattens the parameters list if multiple -p is used
 
 
@@ -128,12 +153,13 @@ def flatten_list(items):
         yield items
 
 
-def main():
+def init_parser(prog=None):
     """
-    Main entry point for CLI. This may be called by running the module directly
-    or by an executable installed onto the system path.
+    Create an ApiArgumentParser with the options shared by the capture-api
+    commands.
     """
     parser = ApiArgumentParser(
+        prog=prog,
         formatter_class=lambda prog: HelpFormatter(prog, max_help_position=30))
     parser.add_argument('api_call',
                         help="API endpoint expressed as a relative path "
@@ -151,36 +177,146 @@ def main():
                         help="log debug messages to stdout")
     parser.add_argument('-a', '--user-agent',
                         help="user agent to use for the API call")
-    args = parser.parse_args()
+    parser.add_argument('-t', '--transport', choices=sorted(TRANSPORTS),
+                        help="HTTP transport used to send requests "
+                             "(default: requests)")
+    parser.add_argument('-P', '--profile', metavar="FILE",
+                        help="write the cProfile statistics, peak memory and "
+                             "time spent per phase to a file")
+    return parser
 
-    try:
-        api = parser.init_api()
-    except (JanrainConfigError, JanrainCredentialsError) as error:
-        sys.exit(str(error))
 
+def configure_api(api, args):
+    """ Apply the command-line options to an Api instance. """
     if args.disable_signed_requests:
         api.sign_requests = False
 
     if args.user_agent:
         api.user_agent = args.user_agent
 
+    if args.transport:
+        api.transport = TRANSPORTS[args.transport]()
+
+
+def parse_parameters(args):
+    """ Map the list of parameters from the command line into a dict. """
+    if not args.parameters:
+        return {}
+    return dict(item.split("=", 1) for item in flatten_list(args.parameters))
+
+
+def loadtest_main(argv=None):
+    """
+    Entry point for 'capture-api loadtest'. Calls an endpoint for a fixed
+    duration and prints the throughput, latencies and errors as JSON.
+    """
+    parser = init_parser(prog="capture-api loadtest")
+    parser.add_argument('-D', '--duration', type=float, default=10,
+                        help="seconds to run the test for (default: 10)")
+    parser.add_argument('-c', '--concurrency', type=int, default=10,
+                        help="number of calls in flight (default: 10)")
+    parser.add_argument('-r', '--rate', type=float,
+                        help="start this many calls per second instead of "
+                             "calling as fast as the concurrency allows")
+    args = parser.parse_args(argv)
+    if args.all_clients:
+        parser.error("--all-clients cannot be used with loadtest")
+
+    try:
+        api = parser.init_api()
+    except (JanrainConfigError, JanrainCredentialsError) as error:
+        sys.exit(str(error))
+    configure_api(api, args)
+
     if args.debug:
         logging.basicConfig(level=logging.DEBUG)
 
-    # map list of parameters from command line into a dict for use as kwargs
-    kwargs = {}
-    if args.parameters:
-        kwargs = dict(item.split("=", 1)
-                      for item in flatten_list(args.parameters))
+    profile = Profile(args.profile, [api]) if args.profile else None
+    if profile is not None:
+        profile.start()
+    try:
+        result = run_load_test(api, args.api_call, parse_parameters(args),
+                               duration=args.duration,
+                               concurrency=args.concurrency, rate=args.rate)
+        print_json(result.summary(), profile)
+    finally:
+        if profile is not None:
+            profile.stop()
+
+    sys.exit()
+
+
+def main():
+    """
+    Main entry point for CLI. This may be called by running the module directly
+    or by an executable installed onto the system path.
+    """
+    if sys.argv[1:2] == ['loadtest']:
+        return loadtest_main(sys.argv[2:])
+
+    parser = init_parser()
+    parser.add_argument('-w', '--workers', type=int, default=10,
+                        help="number of clients to call at the same time "
+                             "when using --all-clients")
+    args = parser.parse_args()
 
     try:
-        data = api.call(args.api_call, **kwargs)
-    except ApiResponseError as error:
-        sys.exit("API Error {} - {}\n".format(error.code, str(error)))
+        if args.all_clients:
+            apis = parser.init_apis()
+        else:
+            api = parser.init_api()
+            apis = {'api': api}
+    except (JanrainConfigError, JanrainCredentialsError) as error:
+        sys.exit(str(error))
 
-    print(json.dumps(data, indent=2, sort_keys=True))
+    for api in apis.values():
+        configure_api(api, args)
 
-    sys.exit()
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG)
+
+    kwargs = parse_parameters(args)
+
+    profile = Profile(args.profile, apis.values()) if args.profile else None
+    if profile is not None:
+        profile.start()
+    try:
+        status = call_apis(apis, args, kwargs, profile)
+    finally:
+        if profile is not None:
+            profile.stop()
+
+    sys.exit(status)
+
+
+def call_apis(apis, args, kwargs, profile=None):
+    """
+    Make the API call for main() and print the result.
+
+    Returns:
+        The exit status: None on success or an error message.
+    """
+    status = None
+    if args.all_clients:
+        result = fan_out(apis, args.api_call, workers=args.workers, **kwargs)
+        data = {'results': result.results, 'errors': result.error_summary()}
+        if not result.ok:
+            status = "API call failed for {} of {} clients".format(
+                len(result.errors), len(apis))
+    else:
+        try:
+            data = apis['api'].call(args.api_call, **kwargs)
+        except ApiResponseError as error:
+            return "API Error {} - {}\n".format(error.code, str(error))
+
+    print_json(data, profile)
+    return status
+
+
+def print_json(data, profile=None):
+    """ Print data as JSON, timed as the "output" phase when profiling. """
+    with span(profile.recorder if profile else None, "output"):
+        print(json.dumps(data, indent=2, sort_keys=True))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,192 @@
+"""
+Adaptive limit on the number of API calls in flight.
+
+The limit grows additively while calls succeed and is cut multiplicatively
+when Capture shows signs of overload (timeouts, HTTP 5xx or 429 responses, or
+the given ApiResponseError codes), like TCP congestion control (AIMD). This
+lets bulk jobs use the capacity available without overloading the API when
+it slows down.
+
+Example:
+    limiter = AdaptiveConcurrency(initial=4, maximum=32)
+    api = janrain.capture.Api("https://...", defaults,
+                              concurrency_limiter=limiter)
+    export(api, sink, partitions, workers=32)
+    print(limiter.limit)
+"""
+import logging
+import threading
+
+from janrain.capture.breaker import TIMEOUT_ERRORS
+from janrain.capture.deadline import current_deadline
+from janrain.capture.exceptions import ApiResponseError, JanrainDeadlineError
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveConcurrency(object):
+    """
+    Limit the calls in flight, adjusting the limit to how the API responds.
+    Worker pools (eg. the 'workers' of export()) should be sized for the
+    maximum; calls beyond the current limit wait for a slot.
+
+    Args:
+        initial        - The starting limit.
+        minimum        - The lowest the limit is cut to.
+        maximum        - The highest the limit grows to.
+        increase       - Amount the limit grows by after 'limit' successful
+                         calls (ie. roughly once per round of calls).
+        decrease       - Factor the limit is multiplied by on overload.
+        target_latency - Seconds above which a successful call does not grow
+                         the limit (no latency target by default).
+        error_codes    - ApiResponseError codes which signal overload (eg. the
+                         rate limit errors of the application).
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=64, increase=1,
+                 decrease=0.5, target_latency=None, error_codes=()):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.target_latency = target_latency
+        self.error_codes = set(error_codes)
+        self._limit = float(min(max(initial, minimum), maximum))
+        self._in_flight = 0
+        self._decreased_at = None
+        self._increases = 0
+        self._decreases = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        """ The current number of calls allowed in flight. """
+        return int(self._limit)
+
+    def is_overload(self, error):
+        """
+        Decide whether an exception means the API is overloaded.
+
+        Args:
+            error - The exception raised by Api.call()
+        """
+        if isinstance(error, ApiResponseError):
+            return error.code in self.error_codes
+        if isinstance(error, TIMEOUT_ERRORS):
+            return True
+        response = getattr(error, 'response', None)
+        status_code = getattr(response, 'status_code', None)
+        return isinstance(status_code, int) and \
+            (status_code >= 500 or status_code == 429)
+
+    def acquire(self):
+        """
+        Wait for a slot. The wait is bounded by the current Deadline, if any.
+
+        Returns:
+            The time the call started, to pass to release().
+
+        Raises:
+            JanrainDeadlineError
+        """
+        deadline = current_deadline()
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = deadline.remaining()
+                if remaining <= 0:
+                    raise JanrainDeadlineError(
+                        "Deadline of {}s exceeded waiting for a slot".format(
+                            deadline.seconds))
+                self._condition.wait(remaining)
+            self._in_flight += 1
+            return monotonic()
+
+    def try_acquire(self):
+        """
+        Take a slot without waiting.
+
+        Returns:
+            The time the call started, to pass to release(), or None if no
+            slot is free.
+        """
+        with self._condition:
+            if self._in_flight >= int(self._limit):
+                return None
+            self._in_flight += 1
+            return monotonic()
+
+    def cancel(self):
+        """
+        Give back a slot taken by try_acquire() for a call which was not
+        made, without adjusting the limit.
+        """
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def release(self, started, error=None):
+        """
+        Give back a slot and adjust the limit to the outcome of the call.
+
+        Args:
+            started - The value returned by acquire() or try_acquire().
+            error   - The exception raised by the call, if any.
+        """
+        latency = monotonic() - started
+        with self._condition:
+            self._in_flight -= 1
+            if error is not None and self.is_overload(error):
+                # calls started before the last cut do not cut it again
+                if self._decreased_at is None or \
+                        started > self._decreased_at:
+                    self._limit = max(self.minimum,
+                                      self._limit * self.decrease)
+                    self._decreased_at = monotonic()
+                    self._decreases += 1
+                    logger.debug("Concurrency limit cut to {}".format(
+                        self.limit))
+            elif error is None and (self.target_latency is None or
+                                    latency <= self.target_latency):
+                if self._limit < self.maximum:
+                    limit = self.limit
+                    self._limit = min(self.maximum, self._limit +
+                                      float(self.increase) / self._limit)
+                    if self.limit > limit:
+                        self._increases += 1
+            self._condition.notify_all()
+
+    def call(self, func, *args, **kwargs):
+        """ Call a function while holding a slot. """
+        started = self.acquire()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as error:
+            self.release(started, error)
+            raise
+        self.release(started)
+        return result
+
+    def stats(self):
+        """
+        Report the state of the limiter, eg. for dashboards.
+
+        Returns:
+            A dictionary with the current 'limit', the calls 'in_flight', and
+            the number of times the limit was raised ('increases') and cut
+            ('decreases').
+        """
+        with self._condition:
+            return {
+                'limit': self.limit,
+                'in_flight': self._in_flight,
+                'increases': self._increases,
+                'decreases': self._decreases,
+            }
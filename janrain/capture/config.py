@@ -119,6 +119,16 @@ def get_clusters():
     return get_settings_at_path("clusters")
 
 
+def get_clients():
+    """
+    Get the list of all clients.
+
+    Returns:
+        A dictionary containing the client settings keyed by client name.
+    """
+    return get_settings_at_path("clients")
+
+
 def get_config_file():
     """
     Get the full path to the config file. By default, this is a YAML file named
@@ -0,0 +1,100 @@
+"""
+End-to-end time budgets spanning many API calls.
+
+A Deadline is activated with a 'with' statement. Every call to Api.call()
+made inside the block (including calls made by the pagination and batch
+helpers, and by worker threads they start) has its connect and read timeouts
+clamped to the time remaining, and fails with JanrainDeadlineError once the
+budget is exhausted.
+
+Example:
+    with Deadline(0.8):
+        user = api.call("entity", uuid=uuid)
+        count = api.call("entity.count", type_name="user")
+"""
+import threading
+from janrain.capture.exceptions import JanrainDeadlineError
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+_local = threading.local()
+
+
+def current_deadline():
+    """
+    Get the deadline active in the current thread.
+
+    Returns:
+        A Deadline instance or None.
+    """
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        return stack[-1]
+    return None
+
+
+class Deadline(object):
+    """
+    A time budget shared by every API call made while it is active. Nested
+    deadlines never extend the budget of an enclosing deadline.
+
+    Args:
+        seconds - The total time budget in seconds.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = monotonic() + seconds
+
+    def remaining(self):
+        """ Seconds left before the deadline (never negative). """
+        return max(0.0, self.expires - monotonic())
+
+    @property
+    def expired(self):
+        """ True once the budget has been used up. """
+        return self.remaining() <= 0
+
+    def check(self):
+        """
+        Raises:
+            JanrainDeadlineError if the budget has been used up.
+        """
+        if self.expired:
+            raise JanrainDeadlineError(
+                "Deadline of {}s exceeded".format(self.seconds))
+
+    def clamp(self, connect_timeout, read_timeout):
+        """
+        Limit request timeouts to the time remaining.
+
+        Args:
+            connect_timeout - Seconds to wait for a connection.
+            read_timeout    - Seconds to wait for a response.
+
+        Returns:
+            A (connect_timeout, read_timeout) 2-tuple.
+
+        Raises:
+            JanrainDeadlineError if the budget has been used up.
+        """
+        self.check()
+        remaining = self.remaining()
+        return (min(float(connect_timeout), remaining),
+                min(float(read_timeout), remaining))
+
+    def __enter__(self):
+        outer = current_deadline()
+        if outer is not None and outer is not self:
+            self.expires = min(self.expires, outer.expires)
+        if getattr(_local, 'stack', None) is None:
+            _local.stack = []
+        _local.stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.stack.pop()
+        return False
@@ -0,0 +1,200 @@
+"""
+Send minimal entity updates by diffing a desired record against its current
+state.
+
+Example:
+    updater = EntityUpdater(api, type_name="user")
+    updater.update({'givenName': "Jane", 'primaryAddress': {'city': "Paris"}},
+                   uuid=uuid)
+    print(updater.stats.calls_saved, updater.stats.bytes_saved)
+"""
+from json import dumps as to_json
+import threading
+
+#: Attributes managed by Capture which are never sent in an update.
+READ_ONLY_ATTRIBUTES = frozenset(['id', 'uuid', 'created', 'lastUpdated'])
+
+
+def _canonical(value):
+    return to_json(value, sort_keys=True, separators=(',', ':'))
+
+
+def _plural_key(element):
+    if isinstance(element, dict):
+        element = {k: v for k, v in element.items()
+                   if k not in READ_ONLY_ATTRIBUTES}
+    return _canonical(element)
+
+
+def plurals_equal(current, desired):
+    """
+    Compare two plurals ignoring element order and read-only attributes such
+    as the element 'id'.
+
+    Returns:
+        True if both plurals contain the same elements.
+    """
+    if current is None or desired is None:
+        return current == desired
+    return sorted(_plural_key(e) for e in current) == \
+        sorted(_plural_key(e) for e in desired)
+
+
+def diff_attributes(current, desired, replace=False):
+    """
+    Compute the smallest set of attributes which turns the current record into
+    the desired record with entity.update. Objects are compared recursively
+    so that only the changed sub-attributes are included. Plurals are
+    compared as a whole and sent in full when any element differs.
+
+    Args:
+        current - A dictionary of the current attribute values.
+        desired - A dictionary of the desired attribute values.
+        replace - Also clear the attributes in the current record which are
+                  missing from the desired record (entity.replace semantics).
+
+    Returns:
+        A dictionary of changed attributes which is empty if nothing differs.
+    """
+    current = current or {}
+    changes = {}
+    for key, value in desired.items():
+        if key in READ_ONLY_ATTRIBUTES:
+            continue
+        old = current.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested = diff_attributes(old, value, replace)
+            if nested:
+                changes[key] = nested
+        elif isinstance(value, list) or isinstance(old, list):
+            if not plurals_equal(old, value):
+                changes[key] = value
+        elif key not in current or old != value:
+            changes[key] = value
+    if replace:
+        for key, old in current.items():
+            if key in desired or key in READ_ONLY_ATTRIBUTES:
+                continue
+            if isinstance(old, list):
+                if old:
+                    changes[key] = []
+            elif isinstance(old, dict):
+                nested = diff_attributes(old, {}, replace)
+                if nested:
+                    changes[key] = nested
+            elif old is not None:
+                changes[key] = None
+    return changes
+
+
+class UpdateStats(object):
+    """
+    Savings made by EntityUpdater.
+
+    Attributes:
+        calls_made  - Number of entity.update calls sent.
+        calls_saved - Number of calls skipped because nothing changed,
+                      without having to fetch the current record.
+        fetches     - Number of entity calls made to fetch the current
+                      record.
+        bytes_sent  - Size of the 'value' parameters which were sent.
+        bytes_saved - Size of the full records minus the bytes sent.
+    """
+
+    def __init__(self):
+        self.calls_made = 0
+        self.calls_saved = 0
+        self.fetches = 0
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+
+    def record(self, full_size, sent_size, called, fetched=False):
+        with self._lock:
+            if fetched:
+                self.fetches += 1
+            if called:
+                self.calls_made += 1
+            elif not fetched:
+                # a fetch instead of an update saves nothing
+                self.calls_saved += 1
+            self.bytes_sent += sent_size
+            self.bytes_saved += full_size - sent_size
+
+    def as_dict(self):
+        return {
+            'calls_made': self.calls_made,
+            'calls_saved': self.calls_saved,
+            'fetches': self.fetches,
+            'bytes_sent': self.bytes_sent,
+            'bytes_saved': self.bytes_saved,
+        }
+
+
+class EntityUpdater(object):
+    """
+    Update entities by sending only the attributes that changed.
+
+    Args:
+        api       - A janrain.capture.Api instance.
+        type_name - The entity type to update.
+    """
+
+    def __init__(self, api, type_name="user"):
+        self.api = api
+        self.type_name = type_name
+        self.stats = UpdateStats()
+
+    def fetch(self, attributes=None, **identifier):
+        """
+        Fetch the current values of the attributes for an entity.
+
+        Args:
+            attributes - A list of attribute names (defaults to all).
+
+        Keyword Args:
+            Identify the entity (eg. uuid="...", or key_attribute and
+            key_value).
+        """
+        if attributes is not None:
+            attributes = sorted(attributes)
+        return self.api.call("entity", type_name=self.type_name,
+                             attributes=attributes, **identifier)['result']
+
+    def update(self, desired, current=None, replace=False, **identifier):
+        """
+        Update an entity with the attributes which differ from its current
+        state. No API call is made when nothing differs.
+
+        Args:
+            desired - A dictionary of the desired attribute values.
+            current - A dictionary of the current attribute values, eg. from a
+                      cache. Fetched from the API when omitted.
+            replace - Clear attributes missing from the desired record instead
+                      of leaving them untouched (like entity.replace).
+
+        Keyword Args:
+            Identify the entity (eg. uuid="...", or key_attribute and
+            key_value).
+
+        Returns:
+            The dictionary of changed attributes which was sent.
+        """
+        fetched = current is None
+        if fetched:
+            # replacing needs the whole record to find attributes to clear
+            attributes = None if replace else desired.keys()
+            current = self.fetch(attributes, **identifier)
+
+        changes = diff_attributes(current, desired, replace)
+        full_size = len(_canonical(desired).encode('utf-8'))
+        if not changes:
+            self.stats.record(full_size, 0, False, fetched)
+            return changes
+
+        value = _canonical(changes)
+        self.api.call("entity.update", type_name=self.type_name, value=value,
+                      **identifier)
+        self.stats.record(full_size, len(value.encode('utf-8')), True,
+                          fetched)
+        return changes
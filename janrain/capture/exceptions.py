@@ -37,3 +37,35 @@ class ApiResponseError(JanrainApiException):
         self.code = code
         self.error = error
         self.response = response
+
+
+class JanrainDeadlineError(JanrainApiException):
+    """ The time budget for a group of API calls ran out. """
+    pass
+
+
+class JanrainCircuitOpenError(JanrainApiException):
+    """ A call was rejected because the circuit for the endpoint is open. """
+
+    def __init__(self, endpoint):
+        JanrainApiException.__init__(
+            self, "Circuit open for '{}'".format(endpoint))
+        self.endpoint = endpoint
+
+
+class JanrainValidationError(JanrainApiException):
+    """ A record does not match the schema of its entity type. """
+
+    def __init__(self, errors):
+        JanrainApiException.__init__(self, "; ".join(errors))
+        self.errors = errors
+
+
+class JanrainCassetteError(JanrainApiException):
+    """ A request has no recorded response to replay. """
+    pass
+
+
+class JanrainSharedStateError(JanrainApiException):
+    """ A shared state file or directory could be read by other users. """
+    pass
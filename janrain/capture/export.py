@@ -0,0 +1,271 @@
+"""
+Export every entity of a type as JSON lines, partitioned by id range.
+
+Partitions are exported concurrently, each paging through its id range in
+order. Raw page bodies can be handed to a pool of processes for decoding,
+transformation and serialization, so that throughput scales with the
+number of CPU cores instead of being capped by a single process. With a
+pool, each partition is requested in fixed windows of ids so that the next
+page never depends on the body of the previous one: pages are decoded in
+the pool while the next pages are fetched, and the output for each
+partition is written in id order.
+
+Example:
+    partitions = id_partitions(api, 8)
+    with DirectorySink("/tmp/users") as sink:
+        export(api, sink, partitions, attributes=["uuid", "email"],
+               processes=4)
+"""
+from collections import deque
+from json import dumps as to_json, loads as from_json
+import multiprocessing
+import os
+from janrain.capture.api import raise_api_exceptions
+from janrain.capture.filters import join_filters, keyset_filter
+from janrain.capture.paginate import AdaptivePageSize, request_page
+from janrain.capture.pool import run_concurrently
+from janrain.capture.tracing import span, set_attributes
+
+
+def id_partitions(api, count, type_name="user", filter=None):
+    """
+    Split the entities into id ranges of roughly equal size.
+
+    Args:
+        api       - A janrain.capture.Api instance.
+        count     - Number of partitions.
+        type_name - The entity type.
+        filter    - An entity.find filter expression.
+
+    Returns:
+        A list of filter expressions, one per partition.
+    """
+    results = api.call("entity.find", type_name=type_name, filter=filter,
+                       attributes=["id"], sort_on=["-id"],
+                       max_results=1)['results']
+    if not results:
+        return [filter]
+    max_id = results[0]['id']
+    size = max(1, (max_id + count) // count)
+    partitions = []
+    for start in range(0, max_id + 1, size):
+        partitions.append(join_filters([
+            filter, "id >= {} and id < {}".format(start, start + size)]))
+    return partitions
+
+
+def id_bounds(api, type_name="user", filter=None):
+    """
+    Find the lowest and highest id of the entities matching a filter.
+
+    Returns:
+        A (min_id, max_id) 2-tuple, or None if no entity matched.
+    """
+    bounds = []
+    for sort_on in ("id", "-id"):
+        results = api.call("entity.find", type_name=type_name,
+                           filter=filter, attributes=["id"],
+                           sort_on=[sort_on], max_results=1)['results']
+        if not results:
+            return None
+        bounds.append(results[0]['id'])
+    return tuple(bounds)
+
+
+def decode_page(raw, transform=None):
+    """
+    Decode, transform and serialize a page of entity.find results. Runs in
+    a worker process when the export uses a process pool.
+
+    Args:
+        raw       - The raw entity.find response body.
+        transform - A callable applied to each record (must be picklable
+                    when using a process pool, ie. a module level function).
+                    Records for which it returns None are skipped.
+
+    Returns:
+        A dictionary with the 'count' of results in the page, the 'last_id'
+        of the page, the serialized JSON 'lines' and, for error responses,
+        the decoded 'error' response.
+    """
+    response = from_json(raw.decode('utf-8'))
+    if response.get('stat') == 'error':
+        return {'error': response}
+    results = response['results']
+    lines = []
+    for record in results:
+        if transform is not None:
+            record = transform(record)
+            if record is None:
+                continue
+        lines.append(to_json(record, separators=(',', ':')))
+    data = "".join(line + "\n" for line in lines).encode('utf-8')
+    return {
+        'count': len(results),
+        'last_id': results[-1]['id'] if results else None,
+        'lines': data,
+    }
+
+
+class DirectorySink(object):
+    """
+    Write each partition to its own JSON lines file in a directory.
+
+    Args:
+        directory - Path to the directory (created if needed).
+        prefix    - File name prefix.
+    """
+
+    def __init__(self, directory, prefix="part"):
+        self.directory = directory
+        self.prefix = prefix
+        self._files = {}
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, partition):
+        return os.path.join(self.directory, "{}-{:04d}.jsonl".format(
+            self.prefix, partition))
+
+    def write(self, partition, data):
+        """ Append serialized records to a partition. """
+        if partition not in self._files:
+            self._files[partition] = open(self.path(partition), 'wb')
+        self._files[partition].write(data)
+
+    def close(self):
+        for stream in self._files.values():
+            stream.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def export(api, sink, partitions=(None,), type_name="user", attributes=None,
+           page_size=1000, workers=4, processes=0, transform=None):
+    """
+    Export the entities matching each partition filter.
+
+    Args:
+        api        - A janrain.capture.Api instance.
+        sink       - An object with a write(partition, data) method
+                     receiving JSON lines as bytes (eg. DirectorySink).
+        partitions - A list of filter expressions (see id_partitions()).
+        type_name  - The entity type.
+        attributes - A list of attributes to export (defaults to all).
+        page_size  - Maximum number of records per entity.find call, or a
+                     janrain.capture.paginate.AdaptivePageSize (copied for
+                     each partition).
+        workers    - Number of partitions exported at the same time.
+        processes  - Number of processes decoding pages. Pages are decoded
+                     in the exporting threads when 0. Otherwise each
+                     partition is requested in windows of 'page_size' ids
+                     between its lowest and highest id (see id_bounds()),
+                     and keeps up to this many pages in the pool while it
+                     fetches the next ones.
+        transform  - A callable applied to each record (see decode_page()).
+
+    Returns:
+        A dictionary keyed by partition index with the number of records
+        exported, or the exception which stopped the partition.
+    """
+    if attributes is not None and 'id' not in attributes:
+        attributes = list(attributes) + ['id']
+    pool = multiprocessing.Pool(processes) if processes else None
+
+    def export_partition(index):
+        with span(api.tracer, "capture.export.partition", **{
+                'janrain.partition': index}) as current:
+            if pool is None:
+                exported = export_pages(index)
+            else:
+                exported = export_windows(index)
+            set_attributes(current, **{'janrain.records': exported})
+            return exported
+
+    def write(index, page):
+        if 'error' in page:
+            raise_api_exceptions(page['error'])
+        if page['lines']:
+            sink.write(index, page['lines'])
+
+    def export_pages(index):
+        exported = 0
+        last_id = None
+        adaptive = isinstance(page_size, AdaptivePageSize)
+        partition_page_size = page_size.copy() if adaptive else page_size
+        while True:
+            page_filter = partitions[index]
+            if last_id is not None:
+                page_filter = join_filters(
+                    [page_filter, keyset_filter(["id"], [last_id])])
+            raw, size = request_page(partition_page_size, lambda size: (
+                api.call_raw("entity.find", type_name=type_name,
+                             filter=page_filter, attributes=attributes,
+                             sort_on=["id"], max_results=size)), api.tracer)
+            call_info = api.last_call
+            page = decode_page(raw, transform)
+            write(index, page)
+            if adaptive:
+                partition_page_size.observe(call_info, page['count'])
+            exported += page['count']
+            if page['count'] < size:
+                return exported
+            last_id = page['last_id']
+
+    def export_windows(index):
+        bounds = id_bounds(api, type_name, partitions[index])
+        if bounds is None:
+            return 0
+        next_id, max_id = bounds
+        exported = 0
+        adaptive = isinstance(page_size, AdaptivePageSize)
+        partition_page_size = page_size.copy() if adaptive else page_size
+        # (pages being decoded by the pool, call info) in id order
+        pending = deque()
+
+        def collect():
+            result, call_info = pending.popleft()
+            page = result.get()
+            write(index, page)
+            if adaptive:
+                partition_page_size.observe(call_info, page['count'])
+            return page['count']
+
+        while next_id <= max_id:
+            start = next_id
+            # ids are unique, so a window of 'size' ids fits in one page
+            raw, size = request_page(partition_page_size, lambda size: (
+                api.call_raw("entity.find", type_name=type_name,
+                             filter=join_filters([
+                                 partitions[index],
+                                 "id >= {} and id < {}".format(
+                                     start, start + size)]),
+                             attributes=attributes, sort_on=["id"],
+                             max_results=size)), api.tracer)
+            next_id = start + size
+            pending.append((pool.apply_async(decode_page, (raw, transform)),
+                            api.last_call))
+            while pending and (len(pending) > processes or
+                               pending[0][0].ready()):
+                exported += collect()
+        while pending:
+            exported += collect()
+        return exported
+
+    try:
+        with span(api.tracer, "capture.export", **{
+                'janrain.type_name': type_name,
+                'janrain.partitions': len(partitions)}):
+            results = run_concurrently(export_partition,
+                                       range(len(partitions)), workers)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return {index: count if error is None else error
+            for index, count, error in results}
@@ -0,0 +1,134 @@
+"""
+Run the same API call against many Capture applications at once.
+
+Example:
+    apis = janrain.capture.fanout.init_apis()
+    result = janrain.capture.fanout.fan_out(apis, "entity.count",
+                                            type_name="user")
+    for name, count in result.results.items():
+        print(name, count['total_count'])
+"""
+from janrain.capture.api import Api
+from janrain.capture.exceptions import JanrainCredentialsError
+from janrain.capture.pool import run_concurrently
+from janrain.capture.tracing import span
+from janrain.capture import config
+
+
+def api_from_settings(settings, api_class=Api, name=None):
+    """
+    Initialize a janrain.capture.Api instance from a dictionary of settings as
+    found in the configuration file.
+
+    Args:
+        settings  - A dictionary containing 'apid_uri', 'client_id' and
+                    'client_secret'.
+        api_class - The class to instantiate (defaults to Api).
+        name      - Name of the settings used in error messages.
+
+    Returns:
+        A janrain.capture.Api instance
+
+    Raises:
+        JanrainCredentialsError
+    """
+    missing = [k for k in ('apid_uri', 'client_id', 'client_secret')
+               if k not in settings]
+    if missing:
+        raise JanrainCredentialsError(
+            "Missing {} in the settings for '{}'".format(
+                ", ".join(missing), name))
+    defaults = {k: settings[k] for k in ('client_id', 'client_secret')}
+    return api_class(settings['apid_uri'], defaults)
+
+
+def init_apis(keys=None, api_class=Api):
+    """
+    Initialize one janrain.capture.Api instance for each client in the
+    configuration file.
+
+    Args:
+        keys      - A list of configuration keys (client names or dot-paths).
+                    Defaults to every client under 'clients'.
+        api_class - The class to instantiate (defaults to Api).
+
+    Returns:
+        A dictionary of janrain.capture.Api instances keyed by client name.
+    """
+    if keys is None:
+        settings = config.get_clients()
+    else:
+        settings = {key: config.get_settings(key) for key in keys}
+    return {name: api_from_settings(values, api_class, name)
+            for name, values in settings.items()}
+
+
+class FanOutResult(object):
+    """
+    The aggregated outcome of running a call against many clients.
+
+    Attributes:
+        results - A dictionary of API responses keyed by client name.
+        errors  - A dictionary of exceptions keyed by client name.
+    """
+
+    def __init__(self, results=None, errors=None):
+        self.results = results or {}
+        self.errors = errors or {}
+
+    @property
+    def ok(self):
+        """ True if the call succeeded for every client. """
+        return not self.errors
+
+    def error_summary(self):
+        """
+        Describe the failures in a form that can be serialized to JSON.
+
+        Returns:
+            A dictionary keyed by client name.
+        """
+        summary = {}
+        for name, error in self.errors.items():
+            summary[name] = {
+                'error': type(error).__name__,
+                'message': str(error),
+            }
+            if hasattr(error, 'code'):
+                summary[name]['code'] = error.code
+        return summary
+
+
+def fan_out(apis, api_call, workers=10, **kwargs):
+    """
+    Make the same API call against every client concurrently. A failure for
+    one client is recorded in the result and does not stop the others.
+
+    Args:
+        apis     - A dictionary of janrain.capture.Api instances keyed by name
+                   (see init_apis()).
+        api_call - The API endpoint as a relative URL.
+        workers  - Maximum number of calls to run at the same time.
+
+    Keyword Args:
+        Passed through to each Api.call()
+
+    Returns:
+        A FanOutResult instance
+    """
+    def call(name):
+        return apis[name].call(api_call, **kwargs)
+
+    tracer = next((api.tracer for api in apis.values()
+                   if isinstance(api, Api) and api.tracer is not None), None)
+    with span(tracer, "capture.fan_out", **{'janrain.endpoint': api_call,
+                                            'janrain.clients': len(apis)}):
+        results = run_concurrently(call, sorted(apis), workers)
+
+    result = FanOutResult()
+    for name, response, error in results:
+        if error is None:
+            result.results[name] = response
+        else:
+            result.errors[name] = error
+    return result
@@ -0,0 +1,66 @@
+""" Helpers for building entity.find and entity.count filter expressions. """
+
+
+def quote_filter_value(value):
+    """
+    Quote a string for use in an entity.find filter.
+
+    Returns:
+        The value enclosed in single quotes with quotes and backslashes
+        escaped.
+    """
+    value = value.replace("\\", "\\\\").replace("'", "\\'")
+    return "'{}'".format(value)
+
+
+def filter_literal(value):
+    """ Format a Python value as a literal in an entity.find filter. """
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return quote_filter_value(value)
+
+
+def join_filters(filters, operator="and"):
+    """
+    Combine filter expressions, skipping empty ones.
+
+    Args:
+        filters  - A list of filter expressions (or None).
+        operator - "and" or "or".
+
+    Returns:
+        The combined filter, or None if every filter was empty.
+    """
+    filters = [f for f in filters if f]
+    if not filters:
+        return None
+    if len(filters) == 1:
+        return filters[0]
+    return " {} ".format(operator).join("({})".format(f) for f in filters)
+
+
+def keyset_filter(keys, position):
+    """
+    Build a filter matching records sorted after a position, for keyset
+    pagination over one or more sort attributes.
+
+    Args:
+        keys     - A list of attribute names in sort order.
+        position - A list of the values of those attributes for the last
+                   record already seen.
+
+    Returns:
+        A filter expression (eg. "lastUpdated > 'x' or (lastUpdated = 'x'
+        and id > 5)").
+    """
+    clauses = []
+    for i, key in enumerate(keys):
+        parts = ["{} = {}".format(k, filter_literal(v))
+                 for k, v in zip(keys[:i], position[:i])]
+        parts.append("{} > {}".format(key, filter_literal(position[i])))
+        clauses.append(" and ".join(parts))
+    return join_filters(clauses, "or")
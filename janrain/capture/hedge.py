@@ -0,0 +1,270 @@
+"""
+Hedged requests for latency-critical reads.
+
+When no response has arrived after a delay taken from the recent latency
+distribution of an endpoint (eg. its 95th percentile), a duplicate request is
+sent and whichever response arrives first is used. The slower response is
+discarded. A budget caps the share of calls which are hedged so that a slow
+API is not sent twice the load. The duplicate takes its own rate limit token
+and slots from the Api's scheduler and concurrency limiter, and is not sent
+if they are not free right away. Requests run on a pool of threads shared
+by every call made with the policy. Requests never wait for a thread: when
+none is free the original request is sent from the caller's thread and is
+not hedged, and no duplicate is sent.
+
+Only idempotent read endpoints should be hedged.
+
+Example:
+    hedging = HedgePolicy(endpoints=["entity"], percentile=95, budget=0.05)
+    api = janrain.capture.Api("https://...", defaults, hedging=hedging)
+    ...
+    print(hedging.stats())
+"""
+from collections import deque
+from multiprocessing.pool import ThreadPool
+import logging
+import threading
+
+from janrain.capture.exceptions import ApiResponseError
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of a list of numbers.
+
+    Args:
+        values  - A non-empty list of numbers.
+        percent - The percentile (0-100).
+    """
+    ordered = sorted(values)
+    index = int(round(percent / 100.0 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+class HedgePolicy(object):
+    """
+    Decide when to hedge calls to read endpoints and keep statistics.
+
+    Args:
+        endpoints     - The API endpoints which are safe to hedge.
+        percentile    - Percentile of recent latencies after which a duplicate
+                        request is sent.
+        budget        - Maximum fraction of calls which may be hedged.
+        initial_delay - Delay used until 'min_samples' latencies are known.
+        min_delay     - Lower bound of the delay in seconds.
+        window        - Number of recent latencies kept per endpoint.
+        min_samples   - Number of latencies needed to compute the delay.
+        workers       - Number of threads sending hedged calls' requests
+                        (the original and the duplicate each use one until
+                        they finish, even after the other one won).
+    """
+
+    def __init__(self, endpoints=("entity",), percentile=95, budget=0.05,
+                 initial_delay=1.0, min_delay=0.01, window=200,
+                 min_samples=20, workers=32):
+        self.endpoints = frozenset("/" + e.lstrip("/") for e in endpoints)
+        self.percentile = percentile
+        self.budget = budget
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.window = window
+        self.min_samples = min_samples
+        self.workers = workers
+        self._pool = None
+        self._busy = 0
+        self._latencies = {}
+        self._calls = 0
+        self._hedges = 0
+        self._wins = 0
+        self._lock = threading.Lock()
+
+    def applies(self, api_call):
+        """ True if calls to the endpoint may be hedged. """
+        return "/" + api_call.lstrip("/") in self.endpoints
+
+    def delay(self, api_call):
+        """ Seconds to wait for a response before hedging. """
+        with self._lock:
+            latencies = list(self._latencies.get(api_call, ()))
+        return self._delay(latencies)
+
+    def _delay(self, latencies):
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, percentile(latencies, self.percentile))
+
+    def _record(self, api_call, latency):
+        with self._lock:
+            latencies = self._latencies.get(api_call)
+            if latencies is None:
+                latencies = self._latencies[api_call] = deque(
+                    maxlen=self.window)
+            latencies.append(latency)
+
+    def _allow_hedge(self, admit):
+        with self._lock:
+            if self._hedges + 1 > self.budget * self._calls:
+                return None
+            self._hedges += 1
+        release = admit()
+        if release is None:
+            with self._lock:
+                self._hedges -= 1
+        return release
+
+    def _reserve(self):
+        """ Reserve a thread of the pool, returning None if none is free. """
+        with self._lock:
+            if self._busy >= self.workers:
+                return None
+            self._busy += 1
+            if self._pool is None:
+                self._pool = ThreadPool(self.workers)
+            return self._pool
+
+    def _unreserve(self):
+        with self._lock:
+            self._busy -= 1
+
+    def _submit(self, pool, func, *args):
+        """ Run a function on a thread reserved with _reserve(). """
+        def run():
+            try:
+                func(*args)
+            finally:
+                self._unreserve()
+
+        pool.apply_async(run)
+
+    def call(self, api_call, func, args=(), admit=None):
+        """
+        Call a function, calling it again in parallel if it is slow.
+
+        Args:
+            api_call - The API endpoint (used to keep latencies).
+            func     - The function sending the request.
+            args     - The arguments to call the function with.
+            admit    - A function taking the rate limit token and slots
+                       needed by the duplicate without waiting. It returns
+                       None if they are not available, otherwise a function
+                       giving them back which is passed the exception raised
+                       by the duplicate (or None).
+
+        Returns:
+            The result of whichever call finished first.
+        """
+        with self._lock:
+            self._calls += 1
+        admit = admit or (lambda: lambda error: None)
+        results = Queue()
+        context = contextvars.copy_context() if contextvars else None
+
+        def attempt(hedge, release):
+            start = monotonic()
+            try:
+                item = (hedge, func(*args), None)
+            except Exception as error:
+                item = (hedge, None, error)
+            if release is not None:
+                release(item[2])
+            self._record(api_call, monotonic() - start)
+            results.put(item)
+
+        def start(pool, hedge, release=None):
+            if context is None:
+                self._submit(pool, attempt, hedge, release)
+            else:
+                self._submit(pool, context.copy().run, attempt, hedge,
+                             release)
+
+        pool = self._reserve()
+        if pool is None:
+            # every thread is busy: send the request from this thread
+            start_time = monotonic()
+            try:
+                return func(*args)
+            finally:
+                self._record(api_call, monotonic() - start_time)
+
+        start(pool, False)
+        pending = 1
+        try:
+            item = results.get(timeout=self.delay(api_call))
+        except Empty:
+            pool = self._reserve()
+            release = None
+            if pool is not None:
+                release = self._allow_hedge(admit)
+                if release is None:
+                    self._unreserve()
+            if release is not None:
+                logger.debug("Hedging {}".format(api_call))
+                start(pool, True, release)
+                pending += 1
+            item = results.get()
+
+        while True:
+            hedge, result, error = item
+            pending -= 1
+            if error is None or isinstance(error, ApiResponseError) or \
+                    not pending:
+                break
+            # a failed request still has a chance to be saved by the other
+            item = results.get()
+
+        if hedge:
+            with self._lock:
+                self._wins += 1
+        if error is not None:
+            raise error
+        return result
+
+    def stats(self):
+        """
+        Report how often calls were hedged.
+
+        Returns:
+            A dictionary with the number of 'calls', 'hedges' and 'wins' (the
+            hedged request answered first), the 'hedge_rate' and 'win_rate',
+            and the current hedging 'delays' keyed by endpoint.
+        """
+        with self._lock:
+            latencies = {api_call: list(values)
+                         for api_call, values in self._latencies.items()}
+            result = {
+                'calls': self._calls,
+                'hedges': self._hedges,
+                'wins': self._wins,
+                'hedge_rate': float(self._hedges) / self._calls
+                if self._calls else 0.0,
+                'win_rate': float(self._wins) / self._hedges
+                if self._hedges else 0.0,
+            }
+        result['delays'] = {api_call: self._delay(values)
+                            for api_call, values in latencies.items()}
+        return result
+
+    def close(self):
+        """ Stop the threads sending requests. """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
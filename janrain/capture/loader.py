@@ -0,0 +1,241 @@
+"""
+Batch individual entity lookups into shared entity.find calls.
+
+Lookups made by many threads within a short window are gathered and sent as
+a single entity.find with an 'or'-joined filter. Each caller receives its
+own record, or None when no record matched.
+
+Example:
+    loader = EntityLoader(api, key_attribute="email",
+                          attributes=["uuid", "displayName"])
+    # called concurrently from request handlers
+    user = loader.load("jane@example.com")
+"""
+from collections import OrderedDict
+import threading
+from janrain.capture.deadline import current_deadline
+from janrain.capture.exceptions import JanrainDeadlineError
+from janrain.capture.filters import filter_literal, join_filters, \
+    keyset_filter
+from janrain.capture.tracing import span
+
+
+def build_filters(attribute, values, max_length=4096):
+    """
+    Build 'or'-joined equality filters matching any of the values, split so
+    that no filter is longer than max_length characters.
+
+    Args:
+        attribute  - The attribute to compare.
+        values     - The values to match.
+        max_length - Maximum length of each filter string.
+
+    Returns:
+        A list of (filter, values) 2-tuples.
+    """
+    filters = []
+    clauses = []
+    chunk = []
+    length = 0
+    for value in values:
+        clause = "{} = {}".format(attribute, filter_literal(value))
+        added = len(clause) + (len(" or ") if clauses else 0)
+        if clauses and length + added > max_length:
+            filters.append((" or ".join(clauses), chunk))
+            clauses, chunk, length = [], [], 0
+            added = len(clause)
+        clauses.append(clause)
+        chunk.append(value)
+        length += added
+    if clauses:
+        filters.append((" or ".join(clauses), chunk))
+    return filters
+
+
+class _Entry(object):
+    """ A pending lookup shared by every caller asking for the same key. """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.keys = []
+        # keys not yet looked up by the batch being sent
+        self.remaining = 0
+        self.result = None
+        self.error = None
+
+    def add(self, key):
+        if key not in self.keys:
+            self.keys.append(key)
+        return self
+
+
+class _Batch(object):
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.closed = threading.Event()
+
+
+class EntityLoader(object):
+    """
+    Gather entity lookups by a unique attribute and resolve them in batches.
+
+    Args:
+        api               - A janrain.capture.Api instance.
+        type_name         - The entity type to look up.
+        key_attribute     - The unique attribute to look up by (eg. "uuid"
+                            or "email").
+        attributes        - A list of attributes to return (defaults to all).
+        max_batch         - Maximum number of keys sent in one batch.
+        wait              - Seconds to wait for more keys before sending a
+                            batch which is not full.
+        max_filter_length - Maximum length of each entity.find filter.
+        normalize         - A callable mapping keys which identify the same
+                            entity to one value, eg. lambda key: key.lower()
+                            for case-insensitive emails. Keys are sent as
+                            given; only the matching uses this. Defaults to
+                            exact matching.
+    """
+
+    def __init__(self, api, type_name="user", key_attribute="uuid",
+                 attributes=None, max_batch=100, wait=0.005,
+                 max_filter_length=4096, normalize=None):
+        self.api = api
+        self.type_name = type_name
+        self.key_attribute = key_attribute
+        if attributes is not None and key_attribute not in attributes:
+            attributes = list(attributes) + [key_attribute]
+        self.attributes = attributes
+        self.max_batch = max_batch
+        self.wait = wait
+        self.max_filter_length = max_filter_length
+        self._normalize = normalize or (lambda key: key)
+        self.calls = 0
+        self.keys_loaded = 0
+        self._batch = None
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        """
+        Look up a single entity. Blocks until the batch containing the key
+        has been resolved.
+
+        Args:
+            key - The value of the key attribute.
+
+        Returns:
+            The entity as a dictionary, or None if no entity matched.
+        """
+        normalized = self._normalize(key)
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _Batch()
+            if normalized not in batch.entries:
+                batch.entries[normalized] = _Entry()
+            entry = batch.entries[normalized].add(key)
+            full = len(batch.entries) >= self.max_batch
+            if full:
+                self._close(batch)
+
+        if full:
+            self._dispatch(batch)
+        elif leader:
+            # The first caller in a window sends the batch unless another
+            # caller fills it up first.
+            batch.closed.wait(self.wait)
+            with self._lock:
+                send = self._batch is batch
+                if send:
+                    self._close(batch)
+            if send:
+                self._dispatch(batch)
+
+        deadline = current_deadline()
+        if not entry.done.wait(deadline.remaining() if deadline else None):
+            raise JanrainDeadlineError(
+                "Deadline of {}s exceeded".format(deadline.seconds))
+        if entry.error is not None:
+            raise entry.error
+        return entry.result
+
+    def load_many(self, keys):
+        """
+        Look up many entities at once without waiting for other callers.
+
+        Args:
+            keys - A list of values of the key attribute.
+
+        Returns:
+            A list of entities (or None) in the same order as the keys.
+        """
+        results = {}
+        keys = list(keys)
+        for i in range(0, len(keys), self.max_batch):
+            batch = _Batch()
+            for key in keys[i:i + self.max_batch]:
+                batch.entries.setdefault(self._normalize(key),
+                                         _Entry()).add(key)
+            self._dispatch(batch)
+            for normalized, entry in batch.entries.items():
+                if entry.error is not None:
+                    raise entry.error
+                results[normalized] = entry.result
+        return [results[self._normalize(key)] for key in keys]
+
+    def _close(self, batch):
+        self._batch = None
+        batch.closed.set()
+
+    def _dispatch(self, batch):
+        try:
+            with span(self.api.tracer, "capture.load_batch", **{
+                    'janrain.keys': len(batch.entries)}):
+                keys = []
+                for entry in batch.entries.values():
+                    entry.remaining = len(entry.keys)
+                    keys.extend(entry.keys)
+                for find_filter, chunk in build_filters(
+                        self.key_attribute, keys, self.max_filter_length):
+                    self._find(batch, find_filter, chunk)
+                    # resolve callers whose keys have all been looked up so
+                    # that errors from later chunks do not reach them
+                    for key in chunk:
+                        entry = batch.entries[self._normalize(key)]
+                        entry.remaining -= 1
+                        if entry.remaining == 0:
+                            entry.done.set()
+        except Exception as error:
+            for entry in batch.entries.values():
+                if not entry.done.is_set():
+                    entry.error = error
+                    entry.done.set()
+        finally:
+            for entry in batch.entries.values():
+                entry.done.set()
+
+    def _find(self, batch, find_filter, keys):
+        # a key can match several records (eg. emails differing in case),
+        # so the results are paged by the key attribute; one more record
+        # than keys is requested so that most lookups need a single call
+        page_size = len(keys) + 1
+        page_filter = find_filter
+        self.keys_loaded += len(keys)
+        while True:
+            results = self.api.call(
+                "entity.find", type_name=self.type_name, filter=page_filter,
+                attributes=self.attributes, sort_on=[self.key_attribute],
+                max_results=page_size)['results']
+            self.calls += 1
+            for record in results:
+                value = record.get(self.key_attribute)
+                if value is None:
+                    continue
+                entry = batch.entries.get(self._normalize(value))
+                if entry is not None and entry.result is None:
+                    entry.result = record
+            last = results[-1].get(self.key_attribute) if results else None
+            if len(results) < page_size or last is None:
+                return
+            page_filter = join_filters([
+                find_filter, keyset_filter([self.key_attribute], [last])])
@@ -0,0 +1,212 @@
+"""
+Drive an API endpoint with a steady load and measure how it responds.
+
+Calls go through the normal Api.call() code path, so the encoding, signing,
+transport and decoding costs are included in the latencies.
+
+String parameters are templates: "$n" is replaced by the sequence number of
+the call and "$uuid" by a random UUID.
+
+Example:
+    result = run_load_test(api, "entity", {'type_name': "user",
+                                           'key_attribute': "email",
+                                           'key_value': "user$n@example.com"},
+                           duration=30, concurrency=20)
+    print(result.summary())
+"""
+from collections import Counter
+from string import Template
+import threading
+import time
+import uuid
+
+from janrain.capture.exceptions import ApiResponseError
+from janrain.capture.hedge import percentile
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+def render_params(params, n):
+    """
+    Fill in the templates in the string parameters for one call.
+
+    Args:
+        params - A dictionary of parameters.
+        n      - The sequence number of the call.
+
+    Returns:
+        A new dictionary of parameters.
+    """
+    rendered = {}
+    for key, value in params.items():
+        if isinstance(value, string_types) and '$' in value:
+            value = Template(value).safe_substitute(n=n, uuid=uuid.uuid4())
+        rendered[key] = value
+    return rendered
+
+
+def error_key(error):
+    """ Group errors by API error code, or by exception class. """
+    if isinstance(error, ApiResponseError):
+        return str(error.code)
+    return type(error).__name__
+
+
+class LoadTestResult(object):
+    """
+    Latencies and errors collected during a load test.
+
+    Attributes:
+        latencies - A list of call latencies in seconds.
+        errors    - A Counter of failed calls keyed by API error code or
+                    exception class name.
+        elapsed   - Duration of the test in seconds.
+        dropped   - Number of calls due at a fixed rate which had not
+                    started when the test ended.
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = Counter()
+        self.elapsed = 0.0
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def record(self, latency, error=None):
+        with self._lock:
+            self.latencies.append(latency)
+            if error is not None:
+                self.errors[error_key(error)] += 1
+
+    def summary(self):
+        """
+        Summarize the test in a form that can be serialized to JSON.
+
+        Returns:
+            A dictionary with the number of 'requests', 'errors' and
+            'dropped' calls, the 'throughput' in calls per second, 'latency'
+            percentiles in seconds, and the errors keyed by code
+            ('error_codes').
+        """
+        latencies = self.latencies
+        summary = {
+            'requests': len(latencies),
+            'errors': sum(self.errors.values()),
+            'dropped': self.dropped,
+            'error_codes': dict(self.errors),
+            'duration': round(self.elapsed, 3),
+            'throughput': round(len(latencies) / self.elapsed, 3)
+            if self.elapsed else 0.0,
+            'latency': {},
+        }
+        if latencies:
+            summary['latency'] = {
+                'p50': round(percentile(latencies, 50), 6),
+                'p90': round(percentile(latencies, 90), 6),
+                'p99': round(percentile(latencies, 99), 6),
+                'max': round(max(latencies), 6),
+            }
+        return summary
+
+
+def run_load_test(api, api_call, params=None, duration=10, concurrency=10,
+                  rate=None):
+    """
+    Call an endpoint repeatedly for a fixed duration.
+
+    With only 'concurrency', each worker thread sends its next call as soon as
+    the previous one completes (closed loop). With a 'rate', calls are started
+    at fixed intervals whatever the response times (open loop) by up to
+    'concurrency' threads. Their latency is measured from the time the call
+    was due, so that a backlog of calls shows up in the latencies. Calls
+    still waiting for a thread when the duration is up are not sent and are
+    counted as dropped.
+
+    Args:
+        api         - A janrain.capture.Api instance.
+        api_call    - The API endpoint as a relative URL.
+        params      - A dictionary of parameter templates.
+        duration    - Seconds to run the test for.
+        concurrency - Number of calls in flight at the same time.
+        rate        - Calls started per second.
+
+    Returns:
+        A LoadTestResult instance
+    """
+    params = params or {}
+    result = LoadTestResult()
+    counter = [0]
+    counter_lock = threading.Lock()
+    start = monotonic()
+    end = start + duration
+
+    def call(due):
+        with counter_lock:
+            counter[0] += 1
+            n = counter[0]
+        try:
+            api.call(api_call, **render_params(params, n))
+        except Exception as error:
+            result.record(monotonic() - due, error)
+        else:
+            result.record(monotonic() - due)
+
+    if rate is None:
+        def worker():
+            while True:
+                now = monotonic()
+                if now >= end:
+                    return
+                call(now)
+    else:
+        # None tells a worker to stop
+        schedule = Queue()
+
+        def worker():
+            while True:
+                due = schedule.get()
+                if due is None:
+                    return
+                if monotonic() >= end:
+                    result.drop()
+                    continue
+                call(due)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    if rate is not None:
+        # computed from the start rather than added up, so that rounding
+        # errors never schedule an extra call
+        for i in range(int(round(duration * rate))):
+            due = start + i / float(rate)
+            wait = due - monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            schedule.put(due)
+        for _ in threads:
+            schedule.put(None)
+
+    for thread in threads:
+        thread.join()
+    result.elapsed = monotonic() - start
+    return result
@@ -0,0 +1,218 @@
+"""
+Iterate over large entity.find results using keyset pagination.
+
+Each page is requested with a filter selecting the records sorted after the
+last record of the previous page, which stays fast no matter how deep into
+the results the iteration is (unlike 'first_result' offsets).
+
+Example:
+    paginator = Paginator(api, attributes=["uuid", "email"],
+                          filter="emailVerified is not null")
+    for record in paginator:
+        print(record['email'])
+
+Pass an AdaptivePageSize as the page_size to tune the number of records per
+page from the observed response times and sizes.
+"""
+import threading
+from janrain.capture.breaker import TIMEOUT_ERRORS
+from janrain.capture.filters import join_filters, keyset_filter
+from janrain.capture.tracing import span, set_attributes
+
+
+class AdaptivePageSize(object):
+    """
+    Tune the number of records requested per page towards a target latency.
+    The size grows while pages come back quickly, shrinks when they are slow
+    or large, and is cut back on timeouts.
+
+    Args:
+        initial        - Page size to start with.
+        minimum        - Smallest page size.
+        maximum        - Largest page size.
+        target_latency - Desired seconds per page (network and decoding).
+        max_page_bytes - Largest desired response body in bytes.
+        growth         - Largest factor the size grows by after one page.
+        backoff        - Factor the size is multiplied by after a timeout,
+                         and the largest reduction after a slow page.
+    """
+
+    def __init__(self, initial=1000, minimum=10, maximum=10000,
+                 target_latency=2.0, max_page_bytes=10 * 1024 * 1024,
+                 growth=1.5, backoff=0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.max_page_bytes = max_page_bytes
+        self.growth = growth
+        self.backoff = backoff
+        self._size = float(self._clamp(initial))
+        self._lock = threading.Lock()
+
+    def _clamp(self, size):
+        return max(self.minimum, min(self.maximum, size))
+
+    @property
+    def size(self):
+        """ The page size to request next. """
+        return int(self._size)
+
+    def copy(self):
+        """ A new controller with the same settings and current size. """
+        return AdaptivePageSize(self.size, self.minimum, self.maximum,
+                                self.target_latency, self.max_page_bytes,
+                                self.growth, self.backoff)
+
+    def observe(self, call_info, records):
+        """
+        Adjust the size after a page.
+
+        Args:
+            call_info - The janrain.capture.api.CallInfo of the page request.
+            records   - Number of records in the page.
+        """
+        if call_info is None or records < 1:
+            return
+        with self._lock:
+            elapsed = call_info.network_time + call_info.decode_time
+            ideal = self.maximum
+            if elapsed > 0:
+                ideal = self.target_latency * records / elapsed
+            if self.max_page_bytes and call_info.response_size:
+                bytes_per_record = float(call_info.response_size) / records
+                ideal = min(ideal, self.max_page_bytes / bytes_per_record)
+            ideal = max(self._size * self.backoff,
+                        min(self._size * self.growth, ideal))
+            self._size = float(self._clamp(ideal))
+
+    def timed_out(self):
+        """
+        Shrink the size after a page request timed out.
+
+        Returns:
+            False if the size was already at the minimum.
+        """
+        with self._lock:
+            if self._size <= self.minimum:
+                return False
+            self._size = float(self._clamp(self._size * self.backoff))
+            return True
+
+
+def request_page(page_size, fetch, tracer=None):
+    """
+    Request a page with fetch(max_results). When page_size is an
+    AdaptivePageSize, a timed out page is requested again with fewer
+    records until the minimum size is reached.
+
+    Args:
+        page_size - A number of records or an AdaptivePageSize.
+        fetch     - A callable making the request.
+        tracer    - A tracer used to create a span for the page (see
+                    janrain.capture.tracing).
+
+    Returns:
+        A 2-tuple of the result of fetch() and the page size requested.
+    """
+    with span(tracer, "capture.page") as current:
+        if not isinstance(page_size, AdaptivePageSize):
+            set_attributes(current, **{'janrain.page_size': page_size})
+            return fetch(page_size), page_size
+        retries = 0
+        while True:
+            size = page_size.size
+            set_attributes(current, **{'janrain.page_size': size,
+                                       'janrain.retries': retries})
+            try:
+                return fetch(size), size
+            except TIMEOUT_ERRORS:
+                if not page_size.timed_out():
+                    raise
+                retries += 1
+
+
+class Paginator(object):
+    """
+    Iterate over every entity matching a filter, in pages.
+
+    Args:
+        api            - A janrain.capture.Api instance.
+        type_name      - The entity type to read.
+        filter         - An entity.find filter expression.
+        attributes     - A list of attributes to return (defaults to all).
+                         The sort keys are always included.
+        keys           - Attributes to sort and page by. The last one must
+                         be unique (eg. 'id').
+        page_size      - Maximum number of records per entity.find call, or
+                         an AdaptivePageSize.
+        position       - Values of the keys for the last record already
+                         seen, to resume an iteration.
+        record_factory - A callable converting each record before it is
+                         returned, to reduce memory use (eg.
+                         JsonRecord.from_dict, see janrain.capture.records).
+    """
+
+    def __init__(self, api, type_name="user", filter=None, attributes=None,
+                 keys=("id",), page_size=1000, position=None,
+                 record_factory=None):
+        self.api = api
+        self.type_name = type_name
+        self.filter = filter
+        self.keys = list(keys)
+        if attributes is not None:
+            attributes = list(attributes)
+            attributes.extend(k for k in self.keys if k not in attributes)
+        self.attributes = attributes
+        self.page_size = page_size
+        self.position = list(position) if position is not None else None
+        self.record_factory = record_factory
+
+    def key(self, record):
+        """ The position of a record. """
+        return [record[k] for k in self.keys]
+
+    def fetch(self, page_filter, max_results):
+        """
+        Make the entity.find call for a page.
+
+        Returns:
+            The list of records in the page.
+        """
+        return self.api.call(
+            "entity.find", type_name=self.type_name, filter=page_filter,
+            attributes=self.attributes, sort_on=self.keys,
+            max_results=max_results)['results']
+
+    def pages(self):
+        """
+        Generate pages of records. The position is advanced after each page,
+        once the caller has asked for the next one.
+        """
+        while True:
+            page_filter = self.filter
+            if self.position is not None:
+                page_filter = join_filters(
+                    [self.filter, keyset_filter(self.keys, self.position)])
+            results, size = request_page(
+                self.page_size, lambda size: self.fetch(page_filter, size),
+                self.api.tracer)
+            if isinstance(self.page_size, AdaptivePageSize):
+                self.page_size.observe(self.api.last_call, len(results))
+
+            # drop records at or before the position, which can be returned
+            # when values share a boundary (eg. truncated timestamps)
+            records = [r for r in results if self.position is None or
+                       self.key(r) > self.position]
+            if records:
+                position = self.key(records[-1])
+                if self.record_factory is not None:
+                    records = [self.record_factory(r) for r in records]
+                yield records
+                self.position = position
+            if len(results) < size or not records:
+                return
+
+    def __iter__(self):
+        for page in self.pages():
+            for record in page:
+                yield record
@@ -0,0 +1,73 @@
+""" Helpers for running Janrain API calls concurrently. """
+from multiprocessing.pool import ThreadPool
+from janrain.capture.deadline import current_deadline
+from janrain.capture.scheduler import current_priority, priority
+import logging
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+logger = logging.getLogger(__name__)
+
+
+def run_concurrently(func, items, workers=10):
+    """
+    Call a function once for each item using a pool of threads. Exceptions
+    raised by the function are captured rather than propagated so that one
+    failed call does not abort the others.
+
+    A Deadline active in the calling thread is also applied in the worker
+    threads. Items which have not started when it expires fail with
+    JanrainDeadlineError. The priority class set with scheduler.priority()
+    and context variables (eg. the current tracing span) are also copied into
+    the worker threads.
+
+    Args:
+        func    - A callable accepting a single item.
+        items   - An iterable of items to pass to the callable.
+        workers - Maximum number of calls to run at the same time.
+
+    Returns:
+        A list of (item, result, error) 3-tuples in the same order as the
+        items. The error is None if the call succeeded and the result is None
+        if it failed.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    deadline = current_deadline()
+    priority_class = current_priority()
+    context = contextvars.copy_context() if contextvars else None
+
+    def run_in_context(item):
+        if context is None:
+            return run(item)
+        return context.copy().run(run, item)
+
+    def run(item):
+        if priority_class is None:
+            return run_with_deadline(item)
+        with priority(priority_class):
+            return run_with_deadline(item)
+
+    def run_with_deadline(item):
+        try:
+            if deadline is None:
+                return item, func(item), None
+            with deadline:
+                deadline.check()
+                return item, func(item), None
+        except Exception as error:
+            logger.debug("Concurrent call for {} failed: {}".format(
+                item, error))
+            return item, None, error
+
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(run_in_context, items)
+    finally:
+        pool.close()
+        pool.join()
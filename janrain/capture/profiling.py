@@ -0,0 +1,178 @@
+"""
+Find where the time and memory of a run of API calls goes.
+
+Profile captures cProfile statistics and the tracemalloc peak memory, and
+adds up the time spent in each phase of the API calls (encode, sign,
+network, decode) by tracing the given Api instances. Other phases, such as
+formatting the output, are added with phase(). The report is written as
+plain text which can be compared between runs with diff.
+
+cProfile only profiles the thread which started the profile; the phase
+times include every thread.
+
+Example:
+    with Profile("profile.txt", [api]) as profile:
+        users = api.call("entity.find", type_name="user")
+        with profile.phase("output"):
+            print(json.dumps(users, indent=2, sort_keys=True))
+"""
+from contextlib import contextmanager
+import cProfile
+import pstats
+import threading
+
+from janrain.capture.tracing import span
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+
+class PhaseRecorder(object):
+    """
+    A tracer which adds up the time spent in spans of each name. Spans are
+    also passed on to another tracer, if given.
+
+    Args:
+        tracer - The tracer to pass spans on to (eg. the Api's tracer).
+    """
+
+    def __init__(self, tracer=None):
+        self.tracer = tracer
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def chain(self, tracer):
+        """
+        Create a recorder adding to the same totals which passes its spans on
+        to another tracer.
+        """
+        recorder = PhaseRecorder(tracer)
+        recorder.phases = self.phases
+        recorder._lock = self._lock
+        return recorder
+
+    @contextmanager
+    def start_as_current_span(self, name, attributes=None):
+        start = monotonic()
+        try:
+            if self.tracer is None:
+                yield None
+            else:
+                with self.tracer.start_as_current_span(
+                        name, attributes=attributes) as current:
+                    yield current
+        finally:
+            elapsed = monotonic() - start
+            with self._lock:
+                calls, seconds = self.phases.get(name, (0, 0.0))
+                self.phases[name] = (calls + 1, seconds + elapsed)
+
+
+class Profile(object):
+    """
+    Profile the code run between start() and stop() (or inside a 'with'
+    block).
+
+    Args:
+        path  - File the report is written to when the profile stops.
+        apis  - janrain.capture.Api instances whose calls are broken down by
+                phase.
+        limit - Number of functions listed from the cProfile statistics.
+        sort  - Sort order of the cProfile statistics.
+    """
+
+    def __init__(self, path=None, apis=(), limit=30, sort='cumulative'):
+        self.path = path
+        self.apis = list(apis)
+        self.limit = limit
+        self.sort = sort
+        self.recorder = PhaseRecorder()
+        self.profiler = cProfile.Profile()
+        self.elapsed = 0.0
+        self.peak_memory = None
+        self._tracers = []
+        self._started = None
+        self._tracing_memory = False
+
+    def start(self):
+        self._tracers = [api.tracer for api in self.apis]
+        for api in self.apis:
+            api.tracer = self.recorder.chain(api.tracer)
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing_memory = True
+        self._started = monotonic()
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+        self.elapsed = monotonic() - self._started
+        if self._tracing_memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self._tracing_memory = False
+        for api, tracer in zip(self.apis, self._tracers):
+            api.tracer = tracer
+        if self.path:
+            with open(self.path, 'w') as stream:
+                stream.write(self.report())
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def phase(self, name):
+        """
+        Time a block of code as a named phase.
+
+        Example:
+            with profile.phase("output"):
+                print(json.dumps(data, indent=2, sort_keys=True))
+        """
+        return span(self.recorder, name)
+
+    @property
+    def phases(self):
+        """ A dictionary of (count, seconds) 2-tuples keyed by phase. """
+        return dict(self.recorder.phases)
+
+    def report(self):
+        """
+        Format the profile as text.
+
+        Returns:
+            The wall time, peak memory, the time per phase sorted by name,
+            and the cProfile statistics of the slowest functions.
+        """
+        lines = ["wall time: {:.6f}s".format(self.elapsed)]
+        if self.peak_memory is not None:
+            lines.append("peak memory: {} bytes".format(self.peak_memory))
+        lines.append("")
+        lines.append("{:<32} {:>8} {:>12}".format("phase", "count",
+                                                  "seconds"))
+        for name, (count, seconds) in sorted(self.phases.items()):
+            lines.append("{:<32} {:>8} {:>12.6f}".format(name, count,
+                                                         seconds))
+        lines.append("")
+
+        stream = StringIO()
+        stats = pstats.Stats(self.profiler, stream=stream)
+        stats.sort_stats(self.sort).print_stats(self.limit)
+        lines.append(stream.getvalue())
+        return "\n".join(lines)
@@ -0,0 +1,127 @@
+"""
+Entity reads which always request an explicit list of attributes.
+
+Example:
+    class UserSummary(Projection):
+        type_name = "user"
+        attributes = ["uuid", "email", "displayName"]
+
+    users = UserSummary(api)
+    user = users.get(uuid=uuid)
+    matches = users.find("email = 'jane@example.com'")
+    print(users.stats.as_dict())
+"""
+import threading
+
+
+class PayloadStats(object):
+    """
+    Sizes and timings of the responses read through a projection.
+
+    Attributes:
+        calls        - Number of API calls made.
+        records      - Number of records returned.
+        bytes        - Total size of the response bodies.
+        network_time - Total seconds spent waiting for responses.
+        decode_time  - Total seconds spent decoding responses.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.records = 0
+        self.bytes = 0
+        self.network_time = 0.0
+        self.decode_time = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, call_info, records):
+        """
+        Add the measurements of a call.
+
+        Args:
+            call_info - A janrain.capture.api.CallInfo instance.
+            records   - Number of records in the response.
+        """
+        with self._lock:
+            self.calls += 1
+            self.records += records
+            if call_info is not None:
+                self.bytes += call_info.response_size
+                self.network_time += call_info.network_time
+                self.decode_time += call_info.decode_time
+
+    @property
+    def bytes_per_record(self):
+        """ Average response size per record returned. """
+        return float(self.bytes) / self.records if self.records else 0.0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'records': self.records,
+            'bytes': self.bytes,
+            'bytes_per_record': self.bytes_per_record,
+            'network_time': self.network_time,
+            'decode_time': self.decode_time,
+        }
+
+
+class Projection(object):
+    """
+    Read helpers for an entity type which always send the 'attributes'
+    parameter. Declare the attributes on a subclass or pass them in.
+
+    Args:
+        api        - A janrain.capture.Api instance.
+        attributes - A list of attribute names (dot-notation for nested
+                     attributes). Defaults to the class attribute.
+        type_name  - The entity type. Defaults to the class attribute.
+    """
+    type_name = "user"
+    attributes = ()
+
+    def __init__(self, api, attributes=None, type_name=None):
+        self.api = api
+        if attributes is not None:
+            self.attributes = attributes
+        if type_name is not None:
+            self.type_name = type_name
+        if not self.attributes:
+            raise ValueError("A projection needs at least one attribute")
+        self.attributes = list(self.attributes)
+        self.stats = PayloadStats()
+
+    def get(self, **identifier):
+        """
+        Read a single entity.
+
+        Keyword Args:
+            Identify the entity (eg. uuid="...", or key_attribute and
+            key_value).
+
+        Returns:
+            A dictionary containing the projected attributes.
+        """
+        response = self.api.call("entity", type_name=self.type_name,
+                                 attributes=self.attributes, **identifier)
+        self.stats.record(self.api.last_call, 1)
+        return response['result']
+
+    def find(self, filter=None, **kwargs):
+        """
+        Find entities matching a filter.
+
+        Args:
+            filter - An entity.find filter expression.
+
+        Keyword Args:
+            Passed through to entity.find (eg. max_results, sort_on).
+
+        Returns:
+            A list of dictionaries containing the projected attributes.
+        """
+        response = self.api.call("entity.find", type_name=self.type_name,
+                                 attributes=self.attributes, filter=filter,
+                                 **kwargs)
+        self.stats.record(self.api.last_call, len(response['results']))
+        return response['results']
@@ -0,0 +1,62 @@
+"""
+Client-side rate limiting for API calls.
+
+Example:
+    limiter = RateLimiter(rate=20)
+    for uuid in uuids:
+        limiter.acquire()
+        api.call("entity", type_name="user", uuid=uuid)
+"""
+import threading
+import time
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+
+class RateLimiter(object):
+    """
+    A thread-safe token bucket allowing 'rate' calls per second on average
+    with bursts of up to 'burst' calls.
+
+    Args:
+        rate  - Calls per second.
+        burst - Maximum number of calls allowed at once (defaults to rate).
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self._tokens = self.burst
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """
+        Take tokens without waiting.
+
+        Returns:
+            0 if the tokens were taken, otherwise the number of seconds to
+            wait before trying again.
+        """
+        with self._lock:
+            self._refill(monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """ Block until the tokens are available and take them. """
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
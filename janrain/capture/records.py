@@ -0,0 +1,183 @@
+"""
+Compact in-memory representations of entity records.
+
+Holding hundreds of thousands of records as the nested dictionaries returned
+by Api.call() uses a lot of memory. Two alternatives are provided, both of
+which can be passed as the record_factory of a Paginator:
+
+- record_class() builds a class with __slots__ for a fixed list of
+  attributes. Nested attributes (dot-notation) are flattened.
+- JsonRecord keeps each record as compact UTF-8 JSON bytes and decodes it
+  when an attribute is accessed.
+
+Example:
+    User = record_class(["uuid", "email", "primaryAddress.city"])
+    for user in Paginator(api, attributes=User.attributes,
+                          record_factory=User.from_dict):
+        print(user['primaryAddress.city'])
+"""
+from json import dumps as to_json, loads as from_json
+import re
+
+
+def _get_path(record, name):
+    value = record
+    for chunk in name.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(chunk)
+    return value
+
+
+class SlotsRecord(object):
+    """
+    Base class for the classes built by record_class(). Values are read by
+    attribute name with record['name'] or record.get('name').
+    """
+    __slots__ = ()
+    attributes = ()
+    _slot_names = {}
+
+    @classmethod
+    def from_dict(cls, record):
+        """ Build a record from a dictionary returned by the API. """
+        obj = cls.__new__(cls)
+        for name, slot in cls._slot_names.items():
+            setattr(obj, slot, _get_path(record, name))
+        return obj
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, self._slot_names[name])
+        except KeyError:
+            raise KeyError(name)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def as_dict(self):
+        """ The values keyed by attribute name. """
+        return {name: getattr(self, slot)
+                for name, slot in self._slot_names.items()}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and \
+            self.as_dict() == other.as_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, self.as_dict())
+
+
+def record_class(attributes, name="Record"):
+    """
+    Build a SlotsRecord subclass for a fixed list of attributes.
+
+    Args:
+        attributes - A list of attribute names (dot-notation for nested
+                     attributes).
+        name       - The name of the class.
+
+    Returns:
+        A class with a from_dict() constructor.
+
+    Raises:
+        ValueError if an attribute maps to the same slot as another one or
+        cannot be used as a slot (eg. 'as_dict' or '__class__').
+    """
+    slot_names = {}
+    for attribute in attributes:
+        slot = re.sub(r'\W', '_', attribute)
+        if slot in slot_names.values():
+            raise ValueError("Duplicate attribute '{}'".format(attribute))
+        if not slot or slot[0].isdigit() or slot.startswith('__') or \
+                hasattr(SlotsRecord, slot):
+            raise ValueError("Reserved attribute name '{}'".format(
+                attribute))
+        slot_names[attribute] = slot
+    return type(str(name), (SlotsRecord,), {
+        '__slots__': tuple(slot_names.values()),
+        'attributes': list(attributes),
+        '_slot_names': slot_names,
+    })
+
+
+class JsonRecord(object):
+    """
+    A record kept as compact UTF-8 JSON bytes and decoded on access.
+
+    Args:
+        raw - The JSON encoded record.
+    """
+    __slots__ = ('raw',)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    @classmethod
+    def from_dict(cls, record):
+        """ Build a record from a dictionary returned by the API. """
+        return cls(to_json(record, separators=(',', ':'))
+                   .encode('utf-8'))
+
+    def decode(self):
+        """ The record as a dictionary. """
+        return from_json(self.raw.decode('utf-8'))
+
+    def __getitem__(self, name):
+        value = self.decode()
+        for chunk in name.split("."):
+            value = value[chunk]
+        return value
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except (KeyError, TypeError):
+            return default
+
+    def __eq__(self, other):
+        return isinstance(other, JsonRecord) and self.raw == other.raw
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "JsonRecord({!r})".format(self.raw)
+
+
+def memory_footprint(records, record_factory=None):
+    """
+    Measure the memory allocated while building a list of records, to
+    compare representations.
+
+    Args:
+        records        - A list of dictionaries returned by the API.
+        record_factory - A callable converting each dictionary (eg.
+                         JsonRecord.from_dict). The dictionaries are copied
+                         when omitted.
+
+    Returns:
+        The number of bytes held by the converted list.
+    """
+    import copy
+    import tracemalloc
+    factory = record_factory or copy.deepcopy
+    # leave tracing alone if someone else (eg. a Profile) started it
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        converted = [factory(record) for record in records]
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        if started:
+            tracemalloc.stop()
+    del converted
+    return size
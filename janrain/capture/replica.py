@@ -0,0 +1,219 @@
+"""
+Mirror an entity type into a local SQLite database and query it locally.
+
+Only the selected attributes are copied. Nested attributes are named with
+dot-notation and objects or plurals are stored as JSON text. refresh() pulls
+the entities changed since the previous refresh using a ChangeFeed whose
+watermark is committed together with the rows. Deleted entities are not
+detected by incremental refreshes; use rebuild() to start over. When the
+list of attributes changes the table is recreated and filled again by the
+next refresh.
+
+Example:
+    replica = Replica(api, "users.db", attributes=["email", "birthday"],
+                      indexes=["email"])
+    replica.refresh()
+    users = replica.query("birthday >= ?", ["2000-01-01"])
+"""
+from json import dumps as to_json, loads as from_json
+import sqlite3
+import threading
+from janrain.capture.changefeed import ChangeFeed
+
+#: Columns which are always replicated.
+REQUIRED_ATTRIBUTES = ("id", "uuid", "lastUpdated")
+
+
+def _quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _get_path(record, name):
+    value = record
+    for chunk in name.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(chunk)
+    if isinstance(value, (dict, list)):
+        return to_json(value, sort_keys=True)
+    return value
+
+
+class SqliteWatermarkStore(object):
+    """
+    Keep change feed watermarks in a table of the replica database. Saved
+    watermarks are committed with the replicated rows.
+
+    Args:
+        connection - A sqlite3 connection.
+        name       - Name of the watermark (the replicated table).
+    """
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+        connection.execute("CREATE TABLE IF NOT EXISTS _watermarks "
+                           "(name TEXT PRIMARY KEY, watermark TEXT)")
+
+    def load(self):
+        row = self.connection.execute(
+            "SELECT watermark FROM _watermarks WHERE name = ?",
+            (self.name,)).fetchone()
+        return from_json(row[0]) if row else None
+
+    def save(self, watermark):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO _watermarks (name, watermark) "
+            "VALUES (?, ?)", (self.name, to_json(watermark)))
+
+
+class Replica(object):
+    """
+    A local SQLite copy of selected attributes of an entity type.
+
+    Args:
+        api        - A janrain.capture.Api instance.
+        path       - Path to the SQLite database (":memory:" for a temporary
+                     database).
+        type_name  - The entity type to mirror.
+        attributes - A list of attributes to copy (dot-notation for nested
+                     attributes). id, uuid and lastUpdated are always copied.
+        indexes    - A list of attributes to index for fast queries.
+        page_size  - Maximum number of records per entity.find call.
+    """
+
+    def __init__(self, api, path, type_name="user", attributes=(),
+                 indexes=(), page_size=1000):
+        self.api = api
+        self.type_name = type_name
+        self.table = type_name
+        self.columns = list(REQUIRED_ATTRIBUTES)
+        self.columns.extend(a for a in attributes if a not in self.columns)
+        self.page_size = page_size
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        # _lock guards the connection, _refresh_lock serializes refreshes
+        # so that entity.find calls are made without blocking queries
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.store = SqliteWatermarkStore(self.connection, self.table)
+        self._create(indexes)
+        self.connection.commit()
+
+    def _create(self, indexes):
+        existing = [row[1] for row in self.connection.execute(
+            "PRAGMA table_info({})".format(_quote(self.table)))]
+        if existing and set(existing) != set(self.columns):
+            # rows copied with other attributes would never be completed
+            # by incremental refreshes, so start over
+            self.connection.execute("DROP TABLE {}".format(
+                _quote(self.table)))
+            self.connection.execute(
+                "DELETE FROM _watermarks WHERE name = ?", (self.table,))
+        columns = ", ".join(_quote(c) for c in self.columns[1:])
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS {} (id INTEGER PRIMARY KEY, {})"
+            .format(_quote(self.table), columns))
+        for attribute in ("uuid",) + tuple(indexes):
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                    _quote("{}_{}".format(self.table, attribute)),
+                    _quote(self.table), _quote(attribute)))
+
+    def _upsert(self, records):
+        sql = "INSERT OR REPLACE INTO {} ({}) VALUES ({})".format(
+            _quote(self.table), ", ".join(_quote(c) for c in self.columns),
+            ", ".join("?" for c in self.columns))
+        self.connection.executemany(
+            sql, [[_get_path(r, c) for c in self.columns] for r in records])
+
+    def refresh(self):
+        """
+        Copy the entities changed since the previous refresh.
+
+        Returns:
+            The number of entities copied.
+        """
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self):
+        attributes = sorted(set(c.split(".")[0] for c in self.columns))
+        copied = 0
+        with self._lock:
+            feed = ChangeFeed(self.api, self.store, self.type_name,
+                              attributes, page_size=self.page_size)
+            paginator = feed.paginator()
+        # pages are fetched without the lock so queries are not blocked by
+        # the network; each page is committed with its watermark
+        for page in paginator.pages():
+            last = page[-1]
+            with self._lock:
+                try:
+                    self._upsert(page)
+                    self.store.save({'lastUpdated': last['lastUpdated'],
+                                     'id': last['id']})
+                    self.connection.commit()
+                except Exception:
+                    self.connection.rollback()
+                    raise
+            copied += len(page)
+        return copied
+
+    def rebuild(self):
+        """ Delete every local row and copy all entities again. """
+        with self._refresh_lock:
+            with self._lock:
+                self.connection.execute("DELETE FROM {}".format(
+                    _quote(self.table)))
+                self.connection.execute(
+                    "DELETE FROM _watermarks WHERE name = ?", (self.table,))
+                self.connection.commit()
+            return self._refresh()
+
+    def query(self, where=None, params=(), order_by=None, limit=None):
+        """
+        Query the local copy.
+
+        Args:
+            where    - An SQL condition using '?' placeholders. Quote nested
+                       attribute names (eg. '"primaryAddress.city" = ?').
+            params   - Values for the placeholders.
+            order_by - An SQL ORDER BY expression.
+            limit    - Maximum number of rows to return.
+
+        Returns:
+            A list of dictionaries keyed by attribute name.
+        """
+        sql = "SELECT * FROM {}".format(_quote(self.table))
+        if where:
+            sql += " WHERE " + where
+        if order_by:
+            sql += " ORDER BY " + order_by
+        if limit is not None:
+            sql += " LIMIT {:d}".format(limit)
+        with self._lock:
+            rows = self.connection.execute(sql, list(params)).fetchall()
+        return [dict(zip(row.keys(), row)) for row in rows]
+
+    def get(self, **equals):
+        """
+        Find a single entity by attribute values (eg. uuid="...").
+
+        Returns:
+            A dictionary, or None if no entity matched.
+        """
+        where = " and ".join("{} = ?".format(_quote(k)) for k in equals)
+        rows = self.query(where, list(equals.values()), limit=1)
+        return rows[0] if rows else None
+
+    def count(self, where=None, params=()):
+        """ Count local entities matching an SQL condition. """
+        sql = "SELECT COUNT(*) FROM {}".format(_quote(self.table))
+        if where:
+            sql += " WHERE " + where
+        with self._lock:
+            return self.connection.execute(sql, list(params)).fetchone()[0]
+
+    def close(self):
+        self.connection.close()
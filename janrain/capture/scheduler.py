@@ -0,0 +1,283 @@
+"""
+Priority scheduling of API calls sharing one client.
+
+A Scheduler limits the number of calls in flight (and optionally their rate)
+and decides which waiting call is sent next. Classes with a lower priority
+number are always served first; classes with the same priority share the
+remaining capacity in proportion to their weights (weighted fair queuing).
+
+Example:
+    scheduler = Scheduler(concurrency=8, rate_limiter=RateLimiter(20))
+    api = Api("https://...", defaults, scheduler=scheduler)
+
+    with priority("bulk"):
+        for page in Paginator(api, "user"):
+            ...
+"""
+from contextlib import contextmanager
+import threading
+
+from janrain.capture.deadline import current_deadline
+from janrain.capture.exceptions import JanrainDeadlineError
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+#: Default classes as name: (priority, weight).
+DEFAULT_CLASSES = {
+    'interactive': (0, 1),
+    'bulk': (1, 1),
+}
+
+_local = threading.local()
+
+
+def current_priority():
+    """
+    Get the priority class active in the current thread.
+
+    Returns:
+        A class name or None.
+    """
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        return stack[-1]
+    return None
+
+
+@contextmanager
+def priority(name):
+    """
+    Send every call made inside the block with the given priority class.
+
+    Args:
+        name - The name of a class of the Scheduler (eg. "bulk").
+    """
+    if getattr(_local, 'stack', None) is None:
+        _local.stack = []
+    _local.stack.append(name)
+    try:
+        yield
+    finally:
+        _local.stack.pop()
+
+
+class _Ticket(object):
+    __slots__ = ('name', 'finish', 'queued', 'granted')
+
+    def __init__(self, name, finish):
+        self.name = name
+        self.finish = finish
+        self.queued = monotonic()
+        self.granted = False
+
+
+class _ClassStats(object):
+
+    def __init__(self, priority, weight):
+        self.priority = priority
+        self.weight = float(weight)
+        self.queue = []
+        self.last_finish = 0.0
+        self.active = 0
+        self.dispatched = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class Scheduler(object):
+    """
+    Queue API calls by priority class and dispatch them as capacity allows.
+
+    Args:
+        concurrency  - Maximum number of calls in flight.
+        rate_limiter - A RateLimiter (or SharedRateLimiter) consulted before
+                       each call is dispatched, so that the rate limit is
+                       also given to the highest priority first.
+        classes      - A dictionary of (priority, weight) 2-tuples keyed by
+                       class name (defaults to DEFAULT_CLASSES).
+        default      - The class of calls made outside a priority() block.
+        concurrency_limiter - An AdaptiveConcurrency whose current limit
+                       caps the calls in flight, so that calls wait for it
+                       in priority order (set by Api when both are given).
+    """
+
+    def __init__(self, concurrency=10, rate_limiter=None, classes=None,
+                 default='interactive', concurrency_limiter=None):
+        classes = classes or DEFAULT_CLASSES
+        if default not in classes:
+            raise ValueError("Unknown default class '{}'".format(default))
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+        self.default = default
+        self._classes = {name: _ClassStats(*value)
+                         for name, value in classes.items()}
+        self._active = 0
+        self._virtual_time = 0.0
+        self._timer = None
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self, name=None):
+        """
+        Wait for this call's turn and hold a slot while it runs. The wait is
+        bounded by the current Deadline, if any.
+
+        Args:
+            name - The priority class (defaults to the class set by
+                   priority(), then to the default class).
+
+        Raises:
+            JanrainDeadlineError
+        """
+        self.acquire(name)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, name=None):
+        """ Wait for a slot (see slot()). Must be followed by release(). """
+        name = name or current_priority() or self.default
+        try:
+            stats = self._classes[name]
+        except KeyError:
+            raise ValueError("Unknown priority class '{}'".format(name))
+        deadline = current_deadline()
+
+        with self._condition:
+            start = max(self._virtual_time, stats.last_finish)
+            stats.last_finish = start + 1 / stats.weight
+            ticket = _Ticket(name, stats.last_finish)
+            stats.queue.append(ticket)
+            self._dispatch()
+            while not ticket.granted:
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = deadline.remaining()
+                if remaining <= 0:
+                    stats.queue.remove(ticket)
+                    raise JanrainDeadlineError(
+                        "Deadline of {}s exceeded while queued".format(
+                            deadline.seconds))
+                self._condition.wait(remaining)
+
+    def try_acquire(self, name=None):
+        """
+        Take a slot without waiting, unless other calls are queued. Must be
+        followed by release() if it succeeded.
+
+        Returns:
+            True if a slot was taken.
+        """
+        name = name or current_priority() or self.default
+        try:
+            stats = self._classes[name]
+        except KeyError:
+            raise ValueError("Unknown priority class '{}'".format(name))
+
+        with self._condition:
+            if self._active >= self._capacity() or \
+                    any(c.queue for c in self._classes.values()):
+                return False
+            if self.rate_limiter is not None and \
+                    self.rate_limiter.try_acquire():
+                return False
+            self._active += 1
+            stats.dispatched += 1
+            return True
+
+    def cancel(self, name=None):
+        """
+        Give back a slot taken by try_acquire() for a call which was not
+        made, so that it is not counted as dispatched.
+        """
+        name = name or current_priority() or self.default
+        with self._condition:
+            self._classes[name].dispatched -= 1
+            self._active -= 1
+            self._dispatch()
+
+    def release(self):
+        """ Give back a slot taken by acquire() or try_acquire(). """
+        with self._condition:
+            self._active -= 1
+            self._dispatch()
+
+    def _capacity(self):
+        if self.concurrency_limiter is None:
+            return self.concurrency
+        return min(self.concurrency, self.concurrency_limiter.limit)
+
+    def _next(self):
+        """ The class to serve next, or None if nothing is queued. """
+        best = None
+        for stats in self._classes.values():
+            if not stats.queue:
+                continue
+            if best is None or (stats.priority, stats.queue[0].finish) < \
+                    (best.priority, best.queue[0].finish):
+                best = stats
+        return best
+
+    def _dispatch(self):
+        # called with the condition held
+        granted = False
+        while self._active < self._capacity():
+            stats = self._next()
+            if stats is None:
+                break
+            if self.rate_limiter is not None:
+                wait = self.rate_limiter.try_acquire()
+                if wait:
+                    self._retry_after(wait)
+                    break
+            ticket = stats.queue.pop(0)
+            ticket.granted = True
+            waited = monotonic() - ticket.queued
+            self._virtual_time = ticket.finish - 1 / stats.weight
+            self._active += 1
+            stats.dispatched += 1
+            stats.total_wait += waited
+            stats.max_wait = max(stats.max_wait, waited)
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def _retry_after(self, wait):
+        if self._timer is not None:
+            return
+
+        def retry():
+            with self._condition:
+                self._timer = None
+                self._dispatch()
+
+        self._timer = threading.Timer(wait, retry)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def stats(self):
+        """
+        Report queue depth and wait times.
+
+        Returns:
+            A dictionary keyed by class name with the number of calls
+            'queued' and 'dispatched', and the 'mean_wait' and 'max_wait' in
+            seconds. The key 'active' holds the number of calls in flight.
+        """
+        with self._condition:
+            result = {'active': self._active}
+            for name, stats in self._classes.items():
+                result[name] = {
+                    'queued': len(stats.queue),
+                    'dispatched': stats.dispatched,
+                    'mean_wait': stats.total_wait / stats.dispatched
+                    if stats.dispatched else 0.0,
+                    'max_wait': stats.max_wait,
+                }
+            return result
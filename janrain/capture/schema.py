@@ -0,0 +1,244 @@
+"""
+Validate entity payloads locally against the schema of their entity type.
+
+Schemas are fetched once per entity type with the entityType API call,
+compiled into a Validator, and cached. Api checks the records sent to
+entity.create, entity.update and entity.bulkCreate when it is created with
+validate_schemas=True.
+
+Example:
+    api = janrain.capture.Api("https://...", defaults, validate_schemas=True)
+    # raises JanrainValidationError without making the API call
+    api.call("entity.create", type_name="user",
+             attributes={'emial': "jane@example.com"})
+"""
+from json import loads as from_json
+import re
+import threading
+from janrain.capture.exceptions import JanrainValidationError
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+def _is_string(value):
+    return isinstance(value, string_types)
+
+
+def _is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_date(value):
+    return _is_string(value) and DATE_RE.match(value) is not None
+
+
+#: Checks for the value of each attribute type. Types which are not listed
+#: (eg. json) accept any value.
+TYPE_CHECKS = {
+    'string': _is_string,
+    'uuid': _is_string,
+    'ipAddress': _is_string,
+    'password': _is_string,
+    'password-crypt-sha256': _is_string,
+    'password-bcrypt': _is_string,
+    'password-md5-hex': _is_string,
+    'boolean': lambda value: isinstance(value, bool),
+    'integer': _is_integer,
+    'id': _is_integer,
+    'decimal': _is_number,
+    'date': _is_date,
+    'dateTime': _is_string,
+    'time': _is_string,
+}
+
+
+class _Attribute(object):
+    """ A compiled attribute definition. """
+
+    def __init__(self, attr_def):
+        self.name = attr_def['name']
+        self.type = attr_def['type']
+        self.length = attr_def.get('length')
+        self.required = 'required' in (attr_def.get('constraints') or ())
+        self.children = None
+        if self.type in ('object', 'plural'):
+            self.children = Validator(attr_def.get('attr_defs') or [])
+
+
+class Validator(object):
+    """
+    A validator compiled from the attribute definitions of an entity type.
+
+    Args:
+        attr_defs - The 'attr_defs' list of an entityType schema.
+    """
+
+    def __init__(self, attr_defs):
+        self.attributes = {}
+        for attr_def in attr_defs:
+            attribute = _Attribute(attr_def)
+            self.attributes[attribute.name] = attribute
+
+    def errors(self, record, partial=True, path=""):
+        """
+        Find every problem with a record.
+
+        Args:
+            record  - A dictionary of attribute values.
+            partial - False to also require the attributes with a 'required'
+                      constraint (as on entity.create).
+            path    - Prefix for attribute names in error messages.
+
+        Returns:
+            A list of error messages which is empty if the record is valid.
+        """
+        if not isinstance(record, dict):
+            return ["{}: expected an object".format(path or "record")]
+        errors = []
+        for name, value in record.items():
+            attribute = self.attributes.get(name)
+            full_name = path + name
+            if attribute is None:
+                errors.append("{}: unknown attribute".format(full_name))
+            elif value is not None:
+                errors.extend(self._value_errors(attribute, value, full_name,
+                                                 partial))
+        if not partial:
+            for name, attribute in self.attributes.items():
+                if attribute.required and record.get(name) is None:
+                    errors.append("{}{}: required".format(path, name))
+        return errors
+
+    def _value_errors(self, attribute, value, name, partial):
+        if attribute.type == 'object':
+            return attribute.children.errors(value, partial, name + ".")
+        if attribute.type == 'plural':
+            if not isinstance(value, list):
+                return ["{}: expected a plural".format(name)]
+            errors = []
+            for i, element in enumerate(value):
+                errors.extend(attribute.children.errors(
+                    element, partial, "{}[{}].".format(name, i)))
+            return errors
+        check = TYPE_CHECKS.get(attribute.type)
+        if check is not None and not check(value):
+            return ["{}: expected {}".format(name, attribute.type)]
+        if attribute.length and _is_string(value) and \
+                len(value) > attribute.length:
+            return ["{}: longer than {} characters".format(
+                name, attribute.length)]
+        return []
+
+    def validate(self, record, partial=True):
+        """
+        Raises:
+            JanrainValidationError if the record is not valid.
+        """
+        errors = self.errors(record, partial)
+        if errors:
+            raise JanrainValidationError(errors)
+
+
+def _decode(value):
+    if _is_string(value) or isinstance(value, bytes):
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return from_json(value)
+    return value
+
+
+class SchemaCache(object):
+    """
+    Fetch and compile the schema of each entity type once.
+
+    Args:
+        api - A janrain.capture.Api instance.
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self._validators = {}
+        self._fetch_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, type_name):
+        """
+        Get the validator for an entity type, fetching the schema if needed.
+        Concurrent calls for the same type fetch it once; other types are
+        not held up by the fetch.
+
+        Returns:
+            A Validator instance.
+        """
+        with self._lock:
+            validator = self._validators.get(type_name)
+            if validator is not None:
+                return validator
+            fetch_lock = self._fetch_locks.setdefault(type_name,
+                                                      threading.Lock())
+        with fetch_lock:
+            with self._lock:
+                validator = self._validators.get(type_name)
+            if validator is None:
+                schema = self.api.call("entityType",
+                                       type_name=type_name)['schema']
+                validator = Validator(schema['attr_defs'])
+                with self._lock:
+                    self._validators[type_name] = validator
+            return validator
+
+    def clear(self, type_name=None):
+        """ Forget cached schemas (eg. after entityType.addAttribute). """
+        with self._lock:
+            if type_name is None:
+                self._validators.clear()
+            else:
+                self._validators.pop(type_name, None)
+
+    def validate_call(self, api_call, params):
+        """
+        Validate the records sent by an entity.create, entity.update or
+        entity.bulkCreate call. Updates of a single attribute (using the
+        attribute_name parameter) are not checked.
+
+        Args:
+            api_call - The API endpoint without a leading slash.
+            params   - The keyword arguments passed to Api.call().
+
+        Raises:
+            JanrainValidationError
+        """
+        type_name = params.get('type_name')
+        if not type_name:
+            return
+        if api_call == "entity.create":
+            records = [_decode(params.get('attributes') or {})]
+            partial = False
+        elif api_call == "entity.update":
+            if params.get('attribute_name'):
+                return
+            records = [_decode(params.get('value') or {})]
+            partial = True
+        elif api_call == "entity.bulkCreate":
+            records = _decode(params.get('all_attributes') or [])
+            partial = False
+        else:
+            return
+
+        validator = self.get(type_name)
+        errors = []
+        for i, record in enumerate(records):
+            prefix = "record {}: ".format(i) if len(records) > 1 else ""
+            errors.extend(prefix + error
+                          for error in validator.errors(record, partial))
+        if errors:
+            raise JanrainValidationError(errors)
@@ -0,0 +1,261 @@
+"""
+Rate limits and OAuth tokens shared by every process on a host.
+
+Each process of a gunicorn server or multiprocessing exporter normally has
+its own Api, so in-process limiters and token caches are multiplied by the
+number of processes. The classes here keep their state in small files
+guarded by an exclusive file lock (fcntl, so POSIX only), which every
+process using the same client_id opens. The files are kept in a directory
+only the current user can access, and are refused if another user owns
+them or could read them.
+
+Example:
+    limiter = SharedRateLimiter.for_client(client_id, rate=20)
+    tokens = SharedTokenCache.for_client(client_id)
+    api = janrain.capture.Api("https://...", defaults, rate_limiter=limiter,
+                              token_cache=tokens)
+"""
+from contextlib import contextmanager
+from hashlib import sha1
+from json import dumps as to_json, loads as from_json
+import errno
+import fcntl
+import mmap
+import os
+import stat
+import struct
+import tempfile
+import threading
+import time
+
+from janrain.capture.deadline import current_deadline
+from janrain.capture.exceptions import JanrainDeadlineError, \
+    JanrainSharedStateError
+
+#: Layout of the rate limiter file: available tokens, last update time.
+BUCKET = struct.Struct('<dd')
+
+
+def _check_private(status, path):
+    if status.st_uid != os.getuid() or status.st_mode & 0o077:
+        raise JanrainSharedStateError(
+            "'{}' must be owned by the current user and not accessible by "
+            "other users".format(path))
+
+
+def state_directory(directory=None):
+    """
+    The directory of the state files.
+
+    Args:
+        directory - The directory to use. Defaults to a directory under the
+                    temp directory which is created for the current user
+                    with mode 0700.
+
+    Raises:
+        JanrainSharedStateError if the default directory is a symbolic link
+        or could be accessed by other users.
+    """
+    if directory is not None:
+        return directory
+    directory = os.path.join(tempfile.gettempdir(),
+                             "janrain-{}".format(os.getuid()))
+    try:
+        os.mkdir(directory, 0o700)
+    except OSError as error:
+        if error.errno != errno.EEXIST:
+            raise
+    status = os.lstat(directory)
+    if not stat.S_ISDIR(status.st_mode):
+        raise JanrainSharedStateError(
+            "'{}' is not a directory".format(directory))
+    _check_private(status, directory)
+    return directory
+
+
+def state_path(kind, client_id, directory=None):
+    """
+    Path of the state file for a client.
+
+    Args:
+        kind      - The kind of state (eg. "ratelimit").
+        client_id - The client_id sharing the state.
+        directory - Directory of the file (see state_directory()).
+    """
+    digest = sha1(client_id.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(state_directory(directory),
+                        "janrain-{}-{}".format(kind, digest))
+
+
+def open_state(path):
+    """
+    Open (or create) a state file without following symbolic links.
+
+    Returns:
+        The open file descriptor.
+
+    Raises:
+        JanrainSharedStateError if the file is owned by another user or
+        could be accessed by other users.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+    try:
+        _check_private(os.fstat(fd), path)
+    except Exception:
+        os.close(fd)
+        raise
+    return fd
+
+
+@contextmanager
+def locked(fd, lock):
+    """
+    Hold an exclusive lock on an open file. flock() locks belong to the open
+    file, which the threads of a process share, so a thread lock is held as
+    well to exclude the other threads.
+
+    Args:
+        fd   - The open file descriptor.
+        lock - A threading.Lock shared by the threads using the descriptor.
+    """
+    with lock:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class SharedRateLimiter(object):
+    """
+    A token bucket kept in a memory mapped file so that all processes
+    opening the same file share one request budget. Provides the same
+    interface as janrain.capture.ratelimit.RateLimiter.
+
+    Args:
+        path  - Path to the state file (created if needed).
+        rate  - Calls per second.
+        burst - Maximum number of calls allowed at once (defaults to rate).
+    """
+
+    def __init__(self, path, rate, burst=None):
+        self.path = path
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self._lock = threading.Lock()
+        self._fd = open_state(path)
+        with locked(self._fd, self._lock):
+            if os.fstat(self._fd).st_size < BUCKET.size:
+                os.ftruncate(self._fd, BUCKET.size)
+                os.write(self._fd, BUCKET.pack(self.burst, time.time()))
+        self._map = mmap.mmap(self._fd, BUCKET.size)
+
+    @classmethod
+    def for_client(cls, client_id, rate, burst=None, directory=None):
+        """ Open the limiter shared by every process using a client_id. """
+        return cls(state_path("ratelimit", client_id, directory), rate, burst)
+
+    def try_acquire(self, tokens=1):
+        """
+        Take tokens without waiting.
+
+        Returns:
+            0 if the tokens were taken, otherwise the number of seconds to
+            wait before trying again.
+        """
+        with locked(self._fd, self._lock):
+            available, updated = BUCKET.unpack(self._map[:BUCKET.size])
+            now = time.time()
+            available = min(self.burst,
+                            available + max(0.0, now - updated) * self.rate)
+            wait = 0
+            if available >= tokens:
+                available -= tokens
+            else:
+                wait = (tokens - available) / self.rate
+            self._map[:BUCKET.size] = BUCKET.pack(available, now)
+            return wait
+
+    def acquire(self, tokens=1):
+        """
+        Block until the tokens are available and take them.
+
+        Raises:
+            JanrainDeadlineError if the current Deadline expires first.
+        """
+        deadline = current_deadline()
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            if deadline is not None and wait >= deadline.remaining():
+                raise JanrainDeadlineError(
+                    "Deadline of {}s exceeded waiting for the rate "
+                    "limit".format(deadline.seconds))
+            time.sleep(wait)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class SharedTokenCache(object):
+    """
+    An OAuth access token cached in a file shared by every process using the
+    same client_id. Only one process fetches a new token when it expires;
+    the others wait for it and reuse it.
+
+    Args:
+        path   - Path to the state file (created if needed).
+        margin - Seconds before expiry at which a token is refreshed.
+    """
+
+    def __init__(self, path, margin=60):
+        self.path = path
+        self.margin = margin
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_client(cls, client_id, margin=60, directory=None):
+        """ Open the token cache shared by every process using a client_id.
+        """
+        return cls(state_path("token", client_id, directory), margin)
+
+    def get(self, fetch):
+        """
+        Get the cached token, or fetch and cache a new one.
+
+        Args:
+            fetch - A callable returning an (access_token, expires_in)
+                    2-tuple, called while holding the lock.
+
+        Returns:
+            The access token.
+        """
+        fd = open_state(self.path)
+        try:
+            with locked(fd, self._lock):
+                with os.fdopen(os.dup(fd), 'r+') as stream:
+                    content = stream.read()
+                    state = from_json(content) if content else {}
+                    if state.get('expires_at', 0) - self.margin > time.time():
+                        return state['access_token']
+                    access_token, expires_in = fetch()
+                    stream.seek(0)
+                    stream.truncate()
+                    stream.write(to_json({
+                        'access_token': access_token,
+                        'expires_at': time.time() + expires_in,
+                    }))
+                    return access_token
+        finally:
+            os.close(fd)
+
+    def clear(self):
+        """ Forget the cached token (eg. after it was revoked). """
+        fd = open_state(self.path)
+        try:
+            with locked(fd, self._lock):
+                os.ftruncate(fd, 0)
+        finally:
+            os.close(fd)
@@ -0,0 +1,86 @@
+import unittest
+
+from janrain.capture import Api
+from janrain.capture.api import MemoryTransport
+from janrain.capture.aggregate import group_count, Dimension, Range, \
+    month_ranges
+from janrain.capture.ratelimit import RateLimiter
+
+COUNTS = {
+    "(country = 'US') and (optIn = true)": 10,
+    "(country = 'US') and (optIn = false)": 5,
+    "(country = 'FR') and (optIn = true)": 3,
+    "(country = 'FR') and (optIn = false)": 0,
+    "(country = 'US') and (age < 30)": 9,
+    "(country = 'US') and (age >= 30)": 6,
+    "(country = 'US') and (age is null)": 1,
+}
+
+
+def count(params):
+    if params['filter'] in COUNTS:
+        return {"stat": "ok", "total_count": COUNTS[params['filter']]}
+    if params['filter'] == "country = 'FR'":
+        return {"stat": "ok", "total_count": 7}
+    return {"stat": "error", "code": 510, "error": "timeout",
+            "error_description": "count timed out"}
+
+
+class TestGroupCount(unittest.TestCase):
+    """ Test grouped entity counts """
+
+    def setUp(self):
+        self.transport = MemoryTransport()
+        self.transport.add("entity.count", count)
+        self.api = Api('foo.janrain.com', transport=self.transport,
+                       defaults={'client_id': 'foo', 'client_secret': 'bar'})
+
+    def test_group_count(self):
+        """ A count is made for every combination of values """
+        rows = group_count(self.api, [
+            Dimension("country", ["US", "FR"]),
+            Dimension("optIn", [True, False]),
+        ], rate_limiter=RateLimiter(1000))
+        self.assertEqual(len(self.transport.requests), 4)
+        self.assertEqual(rows[0], {'country': "US", 'optIn': True,
+                                   'count': 10})
+        self.assertEqual(rows[3]['count'], 0)
+
+    def test_subpartition(self):
+        """ Large and failed buckets are split by another dimension """
+        rows = group_count(self.api, [Dimension("country", ["US", "FR"])],
+                           max_bucket=10,
+                           subpartition=Dimension("optIn", [True, False]))
+        # the values of optIn may not all be listed, so no total is known
+        self.assertIn('error', rows[0])
+        self.assertIsNone(rows[0]['count'])
+        self.assertEqual([r['count'] for r in rows[0]['buckets']], [10, 5])
+        self.assertEqual(rows[1]['count'], 7)
+        self.assertNotIn('buckets', rows[1])
+
+    def test_exhaustive_subpartition(self):
+        """ Failed buckets are summed from an exhaustive subpartition """
+        ages = Dimension("age", [Range(None, 30), Range(30, None), None])
+        rows = group_count(self.api, [Dimension("country", ["US"])],
+                           subpartition=ages)
+        self.assertNotIn('error', rows[0])
+        self.assertEqual(rows[0]['count'], 16)
+
+    def test_exhaustive(self):
+        """ Only gapless open-ended ranges and null are exhaustive """
+        self.assertTrue(Dimension("age", [
+            Range(30, None), None, Range(None, 20), Range(20, 30)]
+        ).exhaustive())
+        self.assertFalse(Dimension("age", [
+            Range(None, 20), Range(30, None), None]).exhaustive())
+        self.assertFalse(Dimension("age", [
+            Range(None, 30), Range(30, None)]).exhaustive())
+        self.assertFalse(Dimension("optIn", [True, False, None]).exhaustive())
+
+    def test_month_ranges(self):
+        """ Month ranges cross year boundaries """
+        ranges = month_ranges(2017, 11, 2018, 2)
+        self.assertEqual([r.label for r in ranges],
+                         ["2017-11", "2017-12", "2018-01"])
+        self.assertEqual(ranges[1].filter("created"),
+                         "created >= '2017-12-01' and created < '2018-01-01'")
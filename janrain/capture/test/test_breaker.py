@@ -0,0 +1,114 @@
+import unittest
+
+try:
+    from mock import patch
+except ImportError:
+    from unittest.mock import patch
+
+from janrain.capture import Api, ApiResponseError, JanrainCircuitOpenError
+from janrain.capture.api import MemoryTransport, HTTPError
+from janrain.capture.breaker import CircuitBreaker, monotonic
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """ Test failing fast on unhealthy endpoints """
+
+    def setUp(self):
+        self.transport = MemoryTransport()
+        self.breaker = CircuitBreaker(min_calls=2, window=4,
+                                      reset_timeout=30, error_codes=[510])
+        self.api = Api('foo.janrain.com', transport=self.transport,
+                       defaults={'client_id': 'foo', 'client_secret': 'bar'},
+                       circuit_breaker=self.breaker)
+        self.url = "https://foo.janrain.com/entity"
+
+    def test_opens_on_5xx(self):
+        """ Repeated 5xx responses open the circuit """
+        self.transport.add("entity", b"", status_code=503)
+        for i in range(2):
+            with self.assertRaises(HTTPError):
+                self.api.call("entity")
+        self.assertEqual(self.breaker.state(self.url), 'open')
+
+        with self.assertRaises(JanrainCircuitOpenError):
+            self.api.call("entity")
+        self.assertEqual(len(self.transport.requests), 2)
+        self.assertEqual(self.breaker.snapshot()[self.url]['rejected'], 1)
+
+    def test_error_codes(self):
+        """ Only the configured API error codes count as failures """
+        self.transport.add("entity", {"stat": "error", "code": 310,
+                                      "error": "record_not_found",
+                                      "error_description": "not found"})
+        for i in range(4):
+            with self.assertRaises(ApiResponseError):
+                self.api.call("entity")
+        self.assertEqual(self.breaker.state(self.url), 'closed')
+
+        self.transport.add("entity", {"stat": "error", "code": 510,
+                                      "error": "rate_limit_exceeded",
+                                      "error_description": "slow down"})
+        for i in range(2):
+            with self.assertRaises(ApiResponseError):
+                self.api.call("entity")
+        self.assertEqual(self.breaker.state(self.url), 'open')
+
+    def test_half_open(self):
+        """ A successful probe closes the circuit again """
+        self.transport.add("entity", b"", status_code=500)
+        for i in range(2):
+            with self.assertRaises(HTTPError):
+                self.api.call("entity")
+
+        self.transport.add("entity", {"stat": "ok"})
+        with patch('janrain.capture.breaker.monotonic',
+                   return_value=monotonic() + 60):
+            self.api.call("entity")
+        self.assertEqual(self.breaker.state(self.url), 'closed')
+        self.assertEqual(self.breaker.snapshot()[self.url]['calls'], 0)
+
+    def test_stale_success(self):
+        """ Only a probe call can close a half-open circuit """
+        started = self.breaker.before_call(self.url)
+        for i in range(2):
+            self.breaker.record(self.url, True, self.breaker.before_call(
+                self.url))
+        self.assertEqual(self.breaker.state(self.url), 'open')
+
+        with patch('janrain.capture.breaker.monotonic',
+                   return_value=monotonic() + 60):
+            probe = self.breaker.before_call(self.url)
+        self.breaker.record(self.url, False, started)
+        self.assertEqual(self.breaker.state(self.url), 'half_open')
+        self.breaker.record(self.url, False, probe)
+        self.assertEqual(self.breaker.state(self.url), 'closed')
+
+
+@unittest.skipIf(httpx is None, "httpx is not installed")
+class TestHttp2Timeouts(unittest.TestCase):
+    """ Test timeouts raised by the HTTP/2 transport """
+
+    def test_timeouts_open_circuit(self):
+        """ httpx timeouts count as failures """
+        from janrain.capture.api import Http2Transport
+
+        def handler(request):
+            raise httpx.ReadTimeout("timed out", request=request)
+
+        client = httpx.Client(transport=httpx.MockTransport(handler))
+        breaker = CircuitBreaker(min_calls=2, window=4)
+        api = Api('foo.janrain.com', transport=Http2Transport(client),
+                  defaults={'client_id': 'foo', 'client_secret': 'bar'},
+                  circuit_breaker=breaker)
+        for i in range(2):
+            with self.assertRaises(httpx.TimeoutException):
+                api.call("entity")
+        self.assertEqual(breaker.state("https://foo.janrain.com/entity"),
+                         'open')
+        with self.assertRaises(JanrainCircuitOpenError):
+            api.call("entity")
@@ -0,0 +1,88 @@
+import unittest
+import gzip
+import os
+import shutil
+import tempfile
+
+from janrain.capture import Api, ApiResponseError
+from janrain.capture.api import MemoryTransport
+from janrain.capture.cassette import RecordingTransport, ReplayTransport
+from janrain.capture.exceptions import JanrainCassetteError
+
+
+class TestCassette(unittest.TestCase):
+    """ Test recording and replaying API traffic """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "test.cassette")
+        self.defaults = {'client_id': 'foo', 'client_secret': 'bar'}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self, sign_requests=True):
+        transport = MemoryTransport()
+        counts = iter([5, 6])
+        transport.add("entity.count", lambda params: {
+            "stat": "ok", "total_count": next(counts)})
+        transport.add("entity", {"stat": "error", "code": 310,
+                                 "error": "record_not_found",
+                                 "error_description": "not found"})
+        with RecordingTransport(transport, self.path) as recorder:
+            api = Api('foo.janrain.com', defaults=self.defaults,
+                      transport=recorder, sign_requests=sign_requests)
+            api.call("entity.count", type_name="user")
+            api.call("entity.count", type_name="user")
+            with self.assertRaises(ApiResponseError):
+                api.call("entity", uuid="abc")
+
+    def test_replay(self):
+        """ Recorded responses are replayed in order """
+        self.record()
+        api = Api('foo.janrain.com', defaults=self.defaults,
+                  transport=ReplayTransport(self.path, latency_scale=1))
+        self.assertEqual(api.call("entity.count",
+                                  type_name="user")['total_count'], 5)
+        self.assertEqual(api.call("entity.count",
+                                  type_name="user")['total_count'], 6)
+        with self.assertRaises(ApiResponseError):
+            api.call("entity", uuid="abc")
+        with self.assertRaises(JanrainCassetteError):
+            api.call("entity", uuid="def")
+
+    def test_credentials_redacted(self):
+        """ Credentials are never written to the cassette """
+        self.record(sign_requests=False)
+        with gzip.open(self.path, 'rb') as stream:
+            content = stream.read()
+        self.assertNotIn(b"bar", content)
+        self.assertNotIn(b"client_id", content)
+
+    def test_response_secrets_redacted(self):
+        """ Tokens returned by the API are never written to the cassette """
+        transport = MemoryTransport()
+        transport.add("oauth/token", {
+            "stat": "ok", "access_token": "secret-access",
+            "refresh_token": "secret-refresh", "expires_in": 3600,
+            "capture_user": {"uuid": "abc",
+                             "accessTokens": [{"access_token": "nested"}]}})
+        with RecordingTransport(transport, self.path) as recorder:
+            api = Api('foo.janrain.com', defaults=self.defaults,
+                      transport=recorder)
+            api.call("oauth/token", grant_type="refresh_token",
+                     refresh_token="secret-request")
+        with gzip.open(self.path, 'rb') as stream:
+            content = stream.read()
+        self.assertNotIn(b"secret-access", content)
+        self.assertNotIn(b"secret-refresh", content)
+        self.assertNotIn(b"nested", content)
+        self.assertNotIn(b"secret-request", content)
+
+        api = Api('foo.janrain.com', defaults=self.defaults,
+                  transport=ReplayTransport(self.path))
+        result = api.call("oauth/token", grant_type="refresh_token",
+                          refresh_token="another")
+        self.assertEqual(result['access_token'], "REDACTED")
+        self.assertEqual(result['expires_in'], 3600)
+        self.assertEqual(result['capture_user']['uuid'], "abc")
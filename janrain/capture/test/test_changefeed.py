@@ -0,0 +1,73 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from janrain.capture import Api
+from janrain.capture.api import MemoryTransport
+from janrain.capture.changefeed import ChangeFeed, FileWatermarkStore, \
+    MemoryWatermarkStore
+from janrain.capture.filters import keyset_filter
+
+RECORDS = [
+    {'id': 1, 'lastUpdated': "2018-01-01 00:00:00", 'email': "a@x.com"},
+    {'id': 2, 'lastUpdated': "2018-01-01 00:00:00", 'email': "b@x.com"},
+    {'id': 3, 'lastUpdated': "2018-01-01 00:00:00", 'email': "c@x.com"},
+    {'id': 4, 'lastUpdated': "2018-01-02 00:00:00", 'email': "d@x.com"},
+]
+
+
+def find(params):
+    """ Emulates the filters generated for lastUpdated/id positions """
+    records = RECORDS
+    if params.get('filter'):
+        position = [r for r in RECORDS
+                    if "id > {}".format(r['id']) in params['filter']][0]
+        # also return the boundary record like a truncated timestamp would
+        records = [r for r in RECORDS if r['lastUpdated'] >=
+                   position['lastUpdated'] and r['id'] >= position['id']]
+    return {"stat": "ok",
+            "results": records[:int(params['max_results'])]}
+
+
+class TestChangeFeed(unittest.TestCase):
+    """ Test incremental syncing with watermarks """
+
+    def setUp(self):
+        self.transport = MemoryTransport()
+        self.transport.add("entity.find", find)
+        self.api = Api('foo.janrain.com', transport=self.transport,
+                       defaults={'client_id': 'foo', 'client_secret': 'bar'})
+
+    def test_keyset_filter(self):
+        """ Filters select records after a composite position """
+        self.assertEqual(
+            keyset_filter(["lastUpdated", "id"], ["2018-01-01", 5]),
+            "(lastUpdated > '2018-01-01') or "
+            "(lastUpdated = '2018-01-01' and id > 5)")
+
+    def test_incremental(self):
+        """ Pages share boundary timestamps without duplicates """
+        store = MemoryWatermarkStore()
+        feed = ChangeFeed(self.api, store, attributes=["email"], page_size=2)
+        self.assertEqual([r['id'] for r in feed], [1, 2, 3, 4])
+        self.assertEqual(store.watermark,
+                         {'lastUpdated': "2018-01-02 00:00:00", 'id': 4})
+        self.assertEqual(self.transport.requests[0]['params']['sort_on'],
+                         '["lastUpdated", "id"]')
+
+        # nothing changed since the last sync
+        self.assertEqual(list(feed), [])
+
+    def test_file_store(self):
+        """ Watermarks survive restarts """
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "watermark.json")
+            store = FileWatermarkStore(path)
+            self.assertIsNone(store.load())
+            store.save({'lastUpdated': "2018-01-01 00:00:00", 'id': 2})
+            feed = ChangeFeed(self.api, FileWatermarkStore(path))
+            self.assertEqual([r['id'] for r in feed], [3, 4])
+        finally:
+            shutil.rmtree(directory)
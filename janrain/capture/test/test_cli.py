@@ -0,0 +1,102 @@
+import unittest
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+try:
+    from mock import patch
+except ImportError:
+    from unittest.mock import patch
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from janrain.capture import Api
+from janrain.capture.api import MemoryTransport
+from janrain.capture.cli import ApiArgumentParser, call_apis, \
+    loadtest_main
+from janrain.capture.profiling import Profile
+
+
+class TestLoadTestCommand(unittest.TestCase):
+    """ Test the 'capture-api loadtest' command """
+
+    def setUp(self):
+        self.transport = MemoryTransport()
+        self.transport.add("entity.count", {'stat': "ok", 'total_count': 1})
+        self.api = Api('foo.janrain.com', transport=self.transport,
+                       defaults={'client_id': 'foo', 'client_secret': 'bar'})
+
+    def run_command(self, argv):
+        stdout = StringIO()
+        with patch.object(ApiArgumentParser, 'init_api',
+                          return_value=self.api), \
+                patch.object(sys, 'stdout', stdout), \
+                patch.object(sys, 'stderr', StringIO()):
+            with self.assertRaises(SystemExit) as context:
+                loadtest_main(argv)
+        return context.exception.code, stdout.getvalue()
+
+    def test_loadtest(self):
+        """ The summary of a closed loop run is printed as JSON """
+        code, output = self.run_command([
+            'entity.count', '--duration', '0.1', '--concurrency', '2',
+            '--parameters', 'type_name=user'])
+        self.assertIsNone(code)
+        summary = json.loads(output)
+        self.assertEqual(summary['requests'], len(self.transport.requests))
+        self.assertGreater(summary['requests'], 0)
+        self.assertEqual(summary['errors'], 0)
+        self.assertEqual(self.transport.requests[0]['params'],
+                         {'type_name': "user"})
+
+    def test_rate(self):
+        """ A fixed rate schedules duration times rate calls """
+        code, output = self.run_command([
+            'entity.count', '-D', '0.2', '-c', '1', '-r', '50'])
+        self.assertIsNone(code)
+        summary = json.loads(output)
+        self.assertEqual(summary['requests'] + summary['dropped'], 10)
+
+    def test_all_clients_rejected(self):
+        """ Load tests run against a single client """
+        code, output = self.run_command(['--all-clients', 'entity.count'])
+        self.assertEqual(code, 2)
+        self.assertEqual(self.transport.requests, [])
+
+
+class TestProfileOption(unittest.TestCase):
+    """ Test profiling an API call made by 'capture-api -P FILE' """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.transport = MemoryTransport()
+        self.transport.add("entity.count", {'stat': "ok", 'total_count': 1})
+        self.api = Api('foo.janrain.com', transport=self.transport,
+                       defaults={'client_id': 'foo', 'client_secret': 'bar'})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_call_apis(self):
+        """ The profile report includes the network and output phases """
+        path = os.path.join(self.directory, "profile.txt")
+        args = argparse.Namespace(all_clients=False, api_call="entity.count")
+        stdout = StringIO()
+        with patch.object(sys, 'stdout', stdout):
+            with Profile(path, apis=[self.api]) as profile:
+                status = call_apis({'api': self.api}, args, {}, profile)
+        self.assertIsNone(status)
+        self.assertEqual(json.loads(stdout.getvalue())['total_count'], 1)
+
+        with open(path) as stream:
+            report = stream.read()
+        self.assertIn("wall time:", report)
+        phases = [line.split()[0] for line in report.splitlines()
+                  if line and line.split()[0] in ("network", "output")]
+        self.assertEqual(phases, ["network", "output"])
@@ -0,0 +1,156 @@
+import unittest
+import socket
+import threading
+import time
+
+from janrain.capture import Api, ApiResponseError
+from janrain.capture.api import MemoryTransport, TransportResponse
+from janrain.capture.concurrency import AdaptiveConcurrency
+from janrain.capture.deadline import Deadline
+from janrain.capture.exceptions import JanrainDeadlineError
+from janrain.capture.pool import run_concurrently
+from janrain.capture.scheduler import Scheduler, priority
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    """ Test the AIMD concurrency limit """
+
+    def test_additive_increase(self):
+        """ Fast successful calls raise the limit by one """
+        limiter = AdaptiveConcurrency(initial=2, maximum=4)
+        for i in range(3):
+            limiter.release(limiter.acquire())
+        self.assertEqual(limiter.limit, 3)
+        for i in range(20):
+            limiter.release(limiter.acquire())
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.stats()['increases'], 2)
+
+    def test_slow_calls_do_not_increase(self):
+        """ Calls slower than the target leave the limit """
+        limiter = AdaptiveConcurrency(initial=2, target_latency=0.5)
+        for i in range(10):
+            limiter.release(limiter.acquire() - 1)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_multiplicative_decrease(self):
+        """ Overload errors halve the limit once per cut """
+        limiter = AdaptiveConcurrency(initial=16, error_codes=[510])
+        started = [limiter.acquire() for i in range(3)]
+        limiter.release(started[0], socket.timeout())
+        self.assertEqual(limiter.limit, 8)
+        # calls started before the cut do not cut it again
+        limiter.release(started[1], socket.timeout())
+        self.assertEqual(limiter.limit, 8)
+        limiter.release(started[2])
+
+        limiter.release(limiter.acquire(),
+                        ApiResponseError(510, "rate_limited", "", {}))
+        self.assertEqual(limiter.limit, 4)
+        limiter.release(limiter.acquire(),
+                        ApiResponseError(310, "record_not_found", "", {}))
+        self.assertEqual(limiter.limit, 4)
+
+        error = IOError()
+        error.response = TransportResponse(503, b'')
+        limiter.release(limiter.acquire(), error)
+        self.assertEqual(limiter.stats(), {
+            'limit': 2, 'in_flight': 0, 'increases': 0, 'decreases': 3})
+
+        limiter.minimum = 2
+        limiter.release(limiter.acquire(), socket.timeout())
+        self.assertEqual(limiter.limit, 2)
+
+    def test_limits_calls_in_flight(self):
+        """ No more calls than the limit run at once """
+        limiter = AdaptiveConcurrency(initial=2, maximum=2)
+        lock = threading.Lock()
+        in_flight = [0, 0]
+
+        def work(i):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+
+        run_concurrently(lambda i: limiter.call(work, i), range(10), 5)
+        self.assertEqual(in_flight[1], 2)
+
+    def test_deadline(self):
+        """ Waiting for a slot respects the deadline """
+        limiter = AdaptiveConcurrency(initial=1)
+        started = limiter.acquire()
+        with Deadline(0.01):
+            with self.assertRaises(JanrainDeadlineError):
+                limiter.acquire()
+        limiter.release(started)
+
+    def test_api(self):
+        """ Api calls adjust the limit from their outcome """
+        transport = MemoryTransport()
+        transport.add("entity.count", {'stat': "ok", 'total_count': 1})
+        transport.add("entity", {}, status_code=503)
+        limiter = AdaptiveConcurrency(initial=4)
+        api = Api('foo.janrain.com', transport=transport,
+                  concurrency_limiter=limiter,
+                  defaults={'client_id': 'foo', 'client_secret': 'bar'})
+        for i in range(5):
+            api.call("entity.count", type_name="user")
+        self.assertEqual(limiter.limit, 5)
+        with self.assertRaises(Exception):
+            api.call("entity", type_name="user", id=1)
+        self.assertEqual(limiter.stats()['limit'], 2)
+        self.assertEqual(limiter.stats()['in_flight'], 0)
+
+    def test_scheduler_priority(self):
+        """ Calls wait for the concurrency limit in priority order """
+        started = threading.Event()
+        release = threading.Event()
+        order = []
+
+        def count(params):
+            order.append(params['type_name'])
+            if params['type_name'] == "first":
+                started.set()
+                release.wait(5)
+            return {'stat': "ok", 'total_count': 1}
+
+        transport = MemoryTransport()
+        transport.add("entity.count", count)
+        limiter = AdaptiveConcurrency(initial=1, maximum=4,
+                                      target_latency=0.1)
+        scheduler = Scheduler(concurrency=10)
+        api = Api('foo.janrain.com', transport=transport,
+                  concurrency_limiter=limiter, scheduler=scheduler,
+                  defaults={'client_id': 'foo', 'client_secret': 'bar'})
+
+        def call(name, priority_class):
+            with priority(priority_class):
+                api.call("entity.count", type_name=name)
+
+        def start(name, priority_class, queued):
+            thread = threading.Thread(target=call,
+                                      args=(name, priority_class))
+            thread.start()
+            threads.append(thread)
+            while scheduler.stats()[priority_class]['queued'] < queued:
+                time.sleep(0.001)
+
+        threads = []
+        start("first", "interactive", 0)
+        self.assertTrue(started.wait(5))
+        for i in range(3):
+            start("bulk", "bulk", i + 1)
+        start("interactive", "interactive", 1)
+        self.assertEqual(scheduler.stats()['active'], 1)
+        # time spent queued does not count as latency
+        time.sleep(0.15)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ["first", "interactive", "bulk", "bulk",
+                                 "bulk"])
+        self.assertGreater(limiter.limit, 1)
+        self.assertEqual(scheduler.stats()['active'], 0)
@@ -0,0 +1,55 @@
+import unittest
+
+try:
+    from mock import patch
+except ImportError:
+    from unittest.mock import patch
+
+from janrain.capture import Api, JanrainDeadlineError
+from janrain.capture.api import MemoryTransport
+from janrain.capture.deadline import Deadline, current_deadline
+from janrain.capture.pool import run_concurrently
+
+
+class TestDeadline(unittest.TestCase):
+    """ Test end-to-end deadlines """
+
+    def setUp(self):
+        self.transport = MemoryTransport()
+        self.transport.add("entity.count", {"stat": "ok", "total_count": 5})
+        self.api = Api('foo.janrain.com', transport=self.transport,
+                       defaults={'client_id': 'foo', 'client_secret': 'bar'})
+
+    def test_timeouts_clamped(self):
+        """ Request timeouts never exceed the time remaining """
+        with Deadline(0.5):
+            self.api.call("entity.count", timeout=30)
+        connect_timeout, read_timeout = self.transport.requests[0]['timeout']
+        self.assertLessEqual(connect_timeout, 0.5)
+        self.assertLessEqual(read_timeout, 0.5)
+
+        self.api.call("entity.count")
+        self.assertEqual(self.transport.requests[1]['timeout'], (10, 10))
+
+    def test_expired(self):
+        """ Calls fail without a request once the budget is used up """
+        with Deadline(1) as deadline:
+            with patch.object(deadline, 'remaining', return_value=0):
+                with self.assertRaises(JanrainDeadlineError):
+                    self.api.call("entity.count")
+        self.assertEqual(self.transport.requests, [])
+        self.assertIsNone(current_deadline())
+
+    def test_nested(self):
+        """ Inner deadlines cannot extend the outer budget """
+        with Deadline(1) as outer:
+            with Deadline(60) as inner:
+                self.assertEqual(inner.expires, outer.expires)
+                self.assertIs(current_deadline(), inner)
+            self.assertIs(current_deadline(), outer)
+
+    def test_worker_threads(self):
+        """ Deadlines are propagated into worker threads """
+        with Deadline(1) as deadline:
+            results = run_concurrently(lambda x: current_deadline(), [1, 2])
+        self.assertEqual([r[1] for r in results], [deadline, deadline])
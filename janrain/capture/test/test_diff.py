@@ -0,0 +1,77 @@
+import unittest
+import json
+
+from janrain.capture import Api
+from janrain.capture.api import MemoryTransport
+from janrain.capture.diff import diff_attributes, EntityUpdater
+
+
+class TestDiff(unittest.TestCase):
+    """ Test minimal entity updates """
+
+    def test_nested_diff(self):
+        """ Only changed sub-attributes of objects are included """
+        current = {
+            'uuid': "abc",
+            'givenName': "Jane",
+            'primaryAddress': {'city': "Paris", 'zip': "75001"},
+        }
+        desired = {
+            'uuid': "abc",
+            'givenName': "Jane",
+            'primaryAddress': {'city': "Lyon", 'zip': "75001"},
+        }
+        self.assertEqual(diff_attributes(current, desired),
+                         {'primaryAddress': {'city': "Lyon"}})
+        self.assertEqual(diff_attributes(current, current), {})
+
+    def test_plurals(self):
+        """ Plurals are compared ignoring order and element ids """
+        current = {'photos': [{'id': 1, 'value': "a"},
+                              {'id': 2, 'value': "b"}]}
+        same = {'photos': [{'value': "b"}, {'value': "a"}]}
+        self.assertEqual(diff_attributes(current, same), {})
+
+        changed = {'photos': [{'value': "a"}]}
+        self.assertEqual(diff_attributes(current, changed), changed)
+
+    def test_replace(self):
+        """ Missing attributes are cleared when replacing """
+        current = {'givenName': "Jane", 'familyName': "Doe",
+                   'photos': [{'value': "a"}]}
+        desired = {'givenName': "Jane"}
+        self.assertEqual(diff_attributes(current, desired), {})
+        self.assertEqual(diff_attributes(current, desired, replace=True),
+                         {'familyName': None, 'photos': []})
+
+    def test_updater(self):
+        """ Calls are skipped when nothing changed """
+        transport = MemoryTransport()
+        transport.add("entity", {"stat": "ok", "result": {
+            'givenName': "Jane", 'familyName': "Doe"}})
+        transport.add("entity.update", {"stat": "ok"})
+        api = Api('foo.janrain.com', transport=transport,
+                  defaults={'client_id': 'foo', 'client_secret': 'bar'})
+        updater = EntityUpdater(api)
+
+        updater.update({'givenName': "Jane"}, uuid="abc")
+        self.assertEqual([r['path'] for r in transport.requests], ["/entity"])
+        # the fetch replaced the update, so no call was saved
+        self.assertEqual(updater.stats.fetches, 1)
+        self.assertEqual(updater.stats.calls_saved, 0)
+
+        updater.update({'givenName': "Jane"}, current={'givenName': "Jane"},
+                       uuid="abc")
+        self.assertEqual(len(transport.requests), 1)
+        self.assertEqual(updater.stats.calls_saved, 1)
+
+        current = {'givenName': "Jane", 'familyName': "Doe"}
+        updater.update({'givenName': "John", 'familyName': "Doe"},
+                       current=current, uuid="abc")
+        request = transport.requests[-1]
+        self.assertEqual(request['path'], "/entity.update")
+        self.assertEqual(json.loads(request['params']['value']),
+                         {'givenName': "John"})
+        self.assertEqual(request['params']['uuid'], "abc")
+        self.assertEqual(updater.stats.calls_made, 1)
+        self.assertGreater(updater.stats.bytes_saved, 0)
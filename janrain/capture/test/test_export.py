@@ -0,0 +1,123 @@
+import unittest
+import json
+import shutil
+import tempfile
+
+from janrain.capture import Api
+from janrain.capture.api import MemoryTransport
+from janrain.capture.breaker import CircuitBreaker
+from janrain.capture.exceptions import ApiResponseError
+from janrain.capture.export import export, id_partitions, DirectorySink
+
+RECORDS = [{'id': i, 'email': "user{}@x.com".format(i)} for i in range(10)]
+
+
+def find(params):
+    records = RECORDS
+    for clause in params.get('filter', "").replace("(", "") \
+            .replace(")", "").split(" and "):
+        if not clause:
+            continue
+        attribute, operator, value = clause.split(" ")
+        value = int(value)
+        records = [r for r in records if {
+            '>=': r['id'] >= value,
+            '<': r['id'] < value,
+            '>': r['id'] > value,
+        }[operator]]
+    if params['sort_on'] == '["-id"]':
+        records = records[::-1]
+    return {"stat": "ok", "results": records[:int(params['max_results'])]}
+
+
+def drop_odd(record):
+    if record['id'] % 2:
+        return None
+    return {'email': record['email']}
+
+
+class TestExport(unittest.TestCase):
+    """ Test partitioned exports """
+
+    def setUp(self):
+        self.transport = MemoryTransport()
+        self.transport.add("entity.find", find)
+        self.api = Api('foo.janrain.com', transport=self.transport,
+                       defaults={'client_id': 'foo', 'client_secret': 'bar'})
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, sink, partition):
+        with open(sink.path(partition)) as stream:
+            return [json.loads(line) for line in stream]
+
+    def test_partitions(self):
+        """ Id ranges cover every entity """
+        self.assertEqual(id_partitions(self.api, 2),
+                         ["id >= 0 and id < 5", "id >= 5 and id < 10"])
+
+    def test_export(self):
+        """ Partitions are written in id order """
+        partitions = id_partitions(self.api, 2)
+        with DirectorySink(self.directory) as sink:
+            result = export(self.api, sink, partitions, page_size=2)
+        self.assertEqual(result, {0: 5, 1: 5})
+        self.assertEqual([r['id'] for r in self.read(sink, 1)],
+                         [5, 6, 7, 8, 9])
+
+    def test_process_pool(self):
+        """ Pages can be decoded and transformed in other processes """
+        partitions = id_partitions(self.api, 2)
+        with DirectorySink(self.directory) as sink:
+            result = export(self.api, sink, partitions, page_size=3,
+                            processes=2, transform=drop_odd)
+        self.assertEqual(result, {0: 5, 1: 5})
+        self.assertEqual(self.read(sink, 0), [
+            {'email': "user0@x.com"}, {'email': "user2@x.com"},
+            {'email': "user4@x.com"}])
+
+    def test_process_pool_pipelined(self):
+        """ Pages are written in order when many are decoded at once """
+        with DirectorySink(self.directory) as sink:
+            result = export(self.api, sink, ["id >= 0 and id < 10"],
+                            page_size=1, processes=3)
+        self.assertEqual(result, {0: 10})
+        self.assertEqual([r['id'] for r in self.read(sink, 0)],
+                         list(range(10)))
+
+    def test_process_pool_windows(self):
+        """ With a pool, pages are requested in fixed windows of ids """
+        with DirectorySink(self.directory) as sink:
+            result = export(self.api, sink, ["id >= 2 and id < 100"],
+                            page_size=4, processes=2)
+        self.assertEqual(result, {0: 8})
+        self.assertEqual([r['id'] for r in self.read(sink, 0)],
+                         list(range(2, 10)))
+        filters = [r['params']['filter'] for r in self.transport.requests
+                   if str(r['params']['max_results']) == "4"]
+        self.assertEqual(filters, [
+            "(id >= 2 and id < 100) and (id >= {} and id < {})".format(
+                start, start + 4) for start in (2, 6)])
+
+    def test_errors(self):
+        """ API errors stop only the failing partition """
+        self.transport.add("entity.find", {
+            "stat": "error", "code": 200, "error": "invalid_argument",
+            "error_description": "bad filter"})
+        with DirectorySink(self.directory) as sink:
+            result = export(self.api, sink)
+        self.assertIsInstance(result[0], ApiResponseError)
+
+    def test_errors_seen_by_breaker(self):
+        """ API errors on raw pages are raised inside the call """
+        self.transport.add("entity.find", {
+            "stat": "error", "code": 510, "error": "rate_limited",
+            "error_description": "slow down"})
+        breaker = CircuitBreaker(min_calls=1, window=1, error_codes=[510])
+        self.api.circuit_breaker = breaker
+        with self.assertRaises(ApiResponseError):
+            self.api.call_raw("entity.find", type_name="user")
+        self.assertEqual(
+            breaker.state("https://foo.janrain.com/entity.find"), 'open')
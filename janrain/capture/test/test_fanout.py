@@ -0,0 +1,64 @@
+import unittest
+import os
+
+try:
+    from mock import Mock
+except ImportError:
+    from unittest.mock import Mock
+
+from janrain.capture import ApiResponseError, JanrainCredentialsError
+from janrain.capture.fanout import init_apis, fan_out, api_from_settings
+from janrain.capture.pool import run_concurrently
+
+
+class TestFanOut(unittest.TestCase):
+    """ Test running calls against many clients """
+
+    def setUp(self):
+        this_dir = os.path.dirname(os.path.abspath(__file__))
+        config_file = os.path.join(this_dir, "janrain-config")
+        self.old_env = os.environ.get('JANRAIN_CONFIG')
+        os.environ['JANRAIN_CONFIG'] = config_file
+
+    def test_init_apis(self):
+        """ One Api is created for each configured client """
+        apis = init_apis()
+        self.assertEqual(sorted(apis), ['cluster-client', 'test-client'])
+        self.assertEqual(apis['test-client'].api_url,
+                         "https://test.example.com")
+        self.assertEqual(apis['cluster-client'].defaults['client_id'],
+                         "dev client_id")
+
+        apis = init_apis(['test-client'])
+        self.assertEqual(list(apis), ['test-client'])
+
+    def test_missing_credentials(self):
+        """ Settings without credentials are rejected """
+        with self.assertRaises(JanrainCredentialsError):
+            api_from_settings({'apid_uri': "foo.janrain.com"}, name="foo")
+
+    def test_partial_failures(self):
+        """ A failing client does not prevent the others from succeeding """
+        good = Mock()
+        good.call.return_value = {"stat": "ok", "total_count": 5}
+        bad = Mock()
+        bad.call.side_effect = ApiResponseError(
+            100, "mock_error", "mock API error", {})
+
+        result = fan_out({'good': good, 'bad': bad}, "entity.count",
+                         type_name="user")
+        self.assertFalse(result.ok)
+        self.assertEqual(result.results['good']['total_count'], 5)
+        self.assertIn('bad', result.errors)
+        self.assertEqual(result.error_summary()['bad']['code'], 100)
+        good.call.assert_called_with("entity.count", type_name="user")
+
+    def test_run_concurrently_order(self):
+        """ Results are returned in the same order as the items """
+        results = run_concurrently(lambda x: x * 2, range(20), workers=4)
+        self.assertEqual([r[1] for r in results], list(range(0, 40, 2)))
+
+    def tearDown(self):
+        del os.environ['JANRAIN_CONFIG']
+        if self.old_env:
+            os.environ['JANRAIN_CONFIG'] = self.old_env
@@ -0,0 +1,205 @@
+import unittest
+import threading
+import time
+
+from janrain.capture import Api, ApiResponseError
+from janrain.capture.api import MemoryTransport
+from janrain.capture.concurrency import AdaptiveConcurrency
+from janrain.capture.hedge import HedgePolicy, percentile
+from janrain.capture.ratelimit import RateLimiter
+from janrain.capture.scheduler import Scheduler
+
+
+class TestHedge(unittest.TestCase):
+    """ Test hedged requests """
+
+    def setUp(self):
+        self.transport = MemoryTransport()
+        self.lock = threading.Lock()
+        self.slow = set([1])
+        self.threads = set()
+
+        def entity(params):
+            with self.lock:
+                attempt = len(self.transport.requests)
+                self.threads.add(threading.current_thread())
+            if attempt in self.slow:
+                time.sleep(0.3)
+            return {'stat': "ok", 'result': {'attempt': attempt}}
+
+        self.transport.add("entity", entity)
+        self.transport.add("entity.update", entity)
+
+    def tearDown(self):
+        self.hedging.close()
+
+    def init_api(self, limits=None, **kwargs):
+        self.hedging = HedgePolicy(**kwargs)
+        return Api('foo.janrain.com', transport=self.transport,
+                   hedging=self.hedging,
+                   defaults={'client_id': 'foo', 'client_secret': 'bar'},
+                   **(limits or {}))
+
+    def test_percentile(self):
+        """ Nearest-rank percentiles """
+        self.hedging = HedgePolicy()
+        self.assertEqual(percentile([5, 1, 3, 2, 4], 50), 3)
+        self.assertEqual(percentile(range(101), 95), 95)
+        self.assertEqual(percentile([7], 99), 7)
+
+    def test_hedge_wins(self):
+        """ A duplicate is sent for a slow call and answers first """
+        api = self.init_api(initial_delay=0.02, budget=1.0)
+        start = time.time()
+        result = api.call("entity", type_name="user", id=1)
+        self.assertLess(time.time() - start, 0.25)
+        self.assertEqual(result['result']['attempt'], 2)
+        self.assertEqual(len(self.transport.requests), 2)
+        self.assertEqual(api.last_call.status_code, 200)
+
+        stats = self.hedging.stats()
+        self.assertEqual(stats['calls'], 1)
+        self.assertEqual(stats['hedges'], 1)
+        self.assertEqual(stats['wins'], 1)
+        self.assertEqual(stats['win_rate'], 1.0)
+
+    def test_fast_response_not_hedged(self):
+        """ Fast calls are not hedged """
+        self.slow = set()
+        api = self.init_api(initial_delay=0.2, budget=1.0)
+        api.call("entity", type_name="user", id=1)
+        self.assertEqual(len(self.transport.requests), 1)
+        self.assertEqual(self.hedging.stats()['hedge_rate'], 0.0)
+
+    def test_writes_not_hedged(self):
+        """ Only the configured read endpoints are hedged """
+        api = self.init_api(initial_delay=0.02, budget=1.0)
+        api.call("entity.update", type_name="user", id=1, value={})
+        self.assertEqual(len(self.transport.requests), 1)
+        self.assertEqual(self.hedging.stats()['calls'], 0)
+
+    def test_budget(self):
+        """ The budget caps the share of hedged calls """
+        api = self.init_api(initial_delay=0.02, budget=0.5)
+        api.call("entity", type_name="user", id=1)
+        api.call("entity", type_name="user", id=1)
+        # a hedge for the first call would exceed the budget
+        self.assertEqual(len(self.transport.requests), 2)
+        self.assertEqual(self.hedging.stats()['hedges'], 0)
+        self.slow = set([3])
+        api.call("entity", type_name="user", id=1)
+        self.assertEqual(self.hedging.stats()['hedges'], 1)
+
+    def test_delay_from_latencies(self):
+        """ The delay follows recent latencies """
+        hedging = self.hedging = HedgePolicy(min_samples=3, min_delay=0.01,
+                                             initial_delay=2.0, percentile=50)
+        self.assertEqual(hedging.delay("/entity"), 2.0)
+        for latency in (0.1, 0.2, 0.3):
+            hedging._record("/entity", latency)
+        self.assertEqual(hedging.delay("/entity"), 0.2)
+        hedging._record("/entity", 0.001)
+        hedging.percentile = 0
+        self.assertEqual(hedging.delay("/entity"), 0.01)
+
+    def test_api_error_not_retried(self):
+        """ API errors are returned without hedging """
+        self.transport.add("entity", {'stat': "error", 'code': 310,
+                                      'error': "record_not_found",
+                                      'error_description': "not found"})
+        api = self.init_api(initial_delay=0.02, budget=1.0)
+        with self.assertRaises(ApiResponseError):
+            api.call("entity", type_name="user", id=1)
+        self.assertEqual(len(self.transport.requests), 1)
+
+    def test_shared_threads(self):
+        """ Requests run on the policy's threads, which are reused """
+        api = self.init_api(initial_delay=0.02, budget=1.0, workers=2)
+        self.slow = set([1, 3, 5])
+        for _ in range(3):
+            api.call("entity", type_name="user", id=1)
+            # let the losing request give its thread back
+            time.sleep(0.35)
+        self.assertEqual(self.hedging.stats()['hedges'], 3)
+        self.assertEqual(len(self.threads), 2)
+
+    def test_no_free_thread(self):
+        """ Without a free thread the request is sent unhedged """
+        api = self.init_api(initial_delay=0.02, budget=1.0, workers=0)
+        api.call("entity", type_name="user", id=1)
+        self.assertEqual(len(self.transport.requests), 1)
+        self.assertEqual(self.threads, set([threading.current_thread()]))
+
+        api = self.init_api(initial_delay=0.02, budget=1.0, workers=1)
+        self.slow = set([2])
+        api.call("entity", type_name="user", id=1)
+        self.assertEqual(len(self.transport.requests), 2)
+        self.assertEqual(self.hedging.stats()['hedges'], 0)
+
+    def test_losers_do_not_delay_calls(self):
+        """ Calls never queue for threads held by losing requests """
+        self.slow = set(range(1, 100))
+        api = self.init_api(initial_delay=0.02, budget=1.0, workers=4)
+        latencies = []
+
+        def call(i):
+            start = time.time()
+            api.call("entity", type_name="user", id=i)
+            latencies.append(time.time() - start)
+
+        threads = [threading.Thread(target=call, args=(i,))
+                   for i in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLess(max(latencies), 0.5)
+
+    def test_hedge_needs_rate_limit_token(self):
+        """ No duplicate is sent without a rate limit token """
+        scheduler = Scheduler(concurrency=2)
+        limiter = AdaptiveConcurrency(initial=2, maximum=2)
+        api = self.init_api(initial_delay=0.02, budget=1.0, limits={
+            'rate_limiter': RateLimiter(rate=1, burst=1),
+            'scheduler': scheduler, 'concurrency_limiter': limiter})
+        api.call("entity", type_name="user", id=1)
+        self.assertEqual(len(self.transport.requests), 1)
+        self.assertEqual(self.hedging.stats()['hedges'], 0)
+        # the slots taken for the duplicate were given back
+        self.assertEqual(scheduler.stats()['interactive']['dispatched'], 1)
+        self.assertEqual(scheduler.stats()['active'], 0)
+        self.assertEqual(limiter.stats()['in_flight'], 0)
+
+    def test_hedge_needs_scheduler_slot(self):
+        """ No duplicate is sent without a scheduler slot """
+        scheduler = Scheduler(concurrency=1)
+        api = self.init_api(initial_delay=0.02, budget=1.0,
+                            limits={'scheduler': scheduler})
+        api.call("entity", type_name="user", id=1)
+        self.assertEqual(len(self.transport.requests), 1)
+
+        scheduler.concurrency = 2
+        self.slow = set([2])
+        api.call("entity", type_name="user", id=1)
+        self.assertEqual(len(self.transport.requests), 3)
+        time.sleep(0.4)
+        stats = scheduler.stats()
+        self.assertEqual(stats['active'], 0)
+        self.assertEqual(stats['interactive']['dispatched'], 3)
+
+    def test_hedge_needs_concurrency_slot(self):
+        """ No duplicate is sent without a concurrency slot """
+        limiter = AdaptiveConcurrency(initial=1, maximum=1)
+        api = self.init_api(initial_delay=0.02, budget=1.0,
+                            limits={'concurrency_limiter': limiter})
+        api.call("entity", type_name="user", id=1)
+        self.assertEqual(len(self.transport.requests), 1)
+        self.assertEqual(self.hedging.stats()['hedges'], 0)
+
+        limiter = AdaptiveConcurrency(initial=2, maximum=2)
+        api.concurrency_limiter = limiter
+        self.slow = set([2])
+        api.call("entity", type_name="user", id=1)
+        self.assertEqual(self.hedging.stats()['hedges'], 1)
+        time.sleep(0.4)
+        self.assertEqual(limiter.stats()['in_flight'], 0)
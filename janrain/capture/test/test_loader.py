@@ -0,0 +1,158 @@
+import re
+import unittest
+import threading
+
+from janrain.capture import Api, ApiResponseError
+from janrain.capture.api import MemoryTransport
+from janrain.capture.loader import EntityLoader, build_filters
+
+
+class TestEntityLoader(unittest.TestCase):
+    """ Test batching of entity lookups """
+
+    def setUp(self):
+        self.transport = MemoryTransport()
+        self.transport.add("entity.find", lambda params: {
+            "stat": "ok",
+            "results": [{'email': e, 'uuid': e.split('@')[0]}
+                        for e in ("a@x.com", "b@x.com")
+                        if "'{}'".format(e) in params['filter']]
+        })
+        self.api = Api('foo.janrain.com', transport=self.transport,
+                       defaults={'client_id': 'foo', 'client_secret': 'bar'})
+
+    def test_build_filters(self):
+        """ Filters are quoted and split to respect the length limit """
+        filters = build_filters("email", ["a@x.com", "o'brien@x.com"])
+        self.assertEqual(filters[0][0],
+                         "email = 'a@x.com' or email = 'o\\'brien@x.com'")
+
+        filters = build_filters("uuid", ["a" * 10] * 5, max_length=40)
+        self.assertEqual(len(filters), 5)
+        self.assertTrue(all(len(f) <= 40 for f, values in filters))
+
+    def test_concurrent_loads(self):
+        """ Concurrent lookups share a single entity.find """
+        # emails compare case-insensitively like in Capture
+        self.transport.add("entity.find", lambda params: {
+            "stat": "ok",
+            "results": [{'email': e, 'uuid': e.split('@')[0]}
+                        for e in ("a@x.com", "b@x.com")
+                        if "'{}'".format(e) in params['filter'].lower()]
+        })
+        loader = EntityLoader(self.api, key_attribute="email", wait=0.2,
+                              attributes=["uuid"], normalize=lambda key: key.lower())
+        keys = ["a@x.com", "B@x.com", "c@x.com", "a@x.com"]
+        results = {}
+
+        def load(i):
+            results[i] = loader.load(keys[i])
+
+        threads = [threading.Thread(target=load, args=(i,))
+                   for i in range(len(keys))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.transport.requests), 1)
+        self.assertEqual(results[0]['uuid'], "a")
+        self.assertEqual(results[1]['uuid'], "b")
+        self.assertIsNone(results[2])
+        self.assertEqual(results[3], results[0])
+        self.assertEqual(self.transport.requests[0]['params']['attributes'],
+                         '["uuid", "email"]')
+        self.assertIn("'B@x.com'",
+                      self.transport.requests[0]['params']['filter'])
+
+    def test_case_sensitive_keys(self):
+        """ Keys are matched exactly unless normalize is given """
+        self.transport.add("entity.find", lambda params: {
+            "stat": "ok",
+            "results": [{'externalId': k} for k in ("AbC", "abc")
+                        if "'{}'".format(k) in params['filter']]
+        })
+        loader = EntityLoader(self.api, key_attribute="externalId")
+        results = loader.load_many(["AbC", "abc", "ABC"])
+        self.assertEqual([r and r['externalId'] for r in results],
+                         ["AbC", "abc", None])
+        self.assertEqual(self.transport.requests[0]['params']['filter'],
+                         "externalId = 'AbC' or externalId = 'abc' or "
+                         "externalId = 'ABC'")
+
+    def test_integer_keys(self):
+        """ Integer keys are sent as numbers """
+        self.transport.add("entity.find", lambda params: {
+            "stat": "ok",
+            "results": [{'id': i} for i in (1, 2)
+                        if "id = {}".format(i) in params['filter']]
+        })
+        loader = EntityLoader(self.api, key_attribute="id")
+        results = loader.load_many([2, 3, 1])
+        self.assertEqual([r and r['id'] for r in results], [2, None, 1])
+        self.assertEqual(self.transport.requests[0]['params']['filter'],
+                         "id = 2 or id = 3 or id = 1")
+        self.assertEqual(loader.load(1), {'id': 1})
+
+    def test_load_many(self):
+        """ Results are returned in order and errors reach every caller """
+        loader = EntityLoader(self.api, key_attribute="email", max_batch=2)
+        results = loader.load_many(["c@x.com", "b@x.com", "a@x.com"])
+        self.assertEqual([r and r['uuid'] for r in results], [None, "b", "a"])
+        self.assertEqual(loader.calls, 2)
+
+        self.transport.add("entity.find", {
+            "stat": "error", "code": 200, "error": "invalid_argument",
+            "error_description": "bad filter"})
+        with self.assertRaises(ApiResponseError):
+            loader.load("a@x.com")
+
+    def test_chunk_errors(self):
+        """ Errors from a later filter only reach the keys it looked up """
+        self.transport.add("entity.find", lambda params: {
+            "stat": "error", "code": 200, "error": "invalid_argument",
+            "error_description": "bad filter"}
+            if "b@x.com" in params['filter'] else {
+            "stat": "ok", "results": [{'email': "a@x.com", 'uuid': "a"}]})
+        loader = EntityLoader(self.api, key_attribute="email", wait=0.2,
+                              max_filter_length=20)
+        results = {}
+
+        def load(key):
+            try:
+                results[key] = loader.load(key)
+            except ApiResponseError as error:
+                results[key] = error
+
+        threads = [threading.Thread(target=load, args=(key,))
+                   for key in ("a@x.com", "b@x.com")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.transport.requests), 2)
+        self.assertEqual(results["a@x.com"]['uuid'], "a")
+        self.assertIsInstance(results["b@x.com"], ApiResponseError)
+
+    def test_several_matches(self):
+        """ Results are paged when keys match more than one record """
+        emails = sorted(["A@x.com", "a@X.com", "a@x.com", "b@x.com"])
+
+        def find(params):
+            after = re.search(r"email > '([^']*)'", params['filter'])
+            matches = [{'email': e} for e in emails
+                       if "'{}'".format(e.lower()) in params['filter'] and
+                       (after is None or e > after.group(1))]
+            return {"stat": "ok",
+                    "results": matches[:int(params['max_results'])]}
+
+        self.transport.add("entity.find", find)
+        loader = EntityLoader(self.api, key_attribute="email",
+                              normalize=lambda key: key.lower())
+        results = loader.load_many(["a@x.com", "b@x.com"])
+        self.assertEqual([r['email'] for r in results],
+                         ["A@x.com", "b@x.com"])
+        self.assertEqual(loader.calls, 2)
+        self.assertEqual(self.transport.requests[0]['params']['sort_on'],
+                         '["email"]')
@@ -0,0 +1,96 @@
+import unittest
+import threading
+import time
+
+from janrain.capture import Api
+from janrain.capture.api import MemoryTransport
+from janrain.capture.loadtest import LoadTestResult, render_params, \
+    run_load_test
+from janrain.capture.exceptions import ApiResponseError
+
+
+class TestLoadTest(unittest.TestCase):
+    """ Test the load test driver """
+
+    def setUp(self):
+        self.transport = MemoryTransport()
+        self.lock = threading.Lock()
+        self.calls = 0
+
+        def entity(params):
+            with self.lock:
+                self.calls += 1
+                calls = self.calls
+            if calls % 4 == 0:
+                return {'stat': "error", 'code': 310,
+                        'error': "record_not_found",
+                        'error_description': "not found"}
+            return {'stat': "ok", 'result': {}}
+
+        self.transport.add("entity", entity)
+        self.api = Api('foo.janrain.com', transport=self.transport,
+                       defaults={'client_id': 'foo', 'client_secret': 'bar'})
+
+    def test_render_params(self):
+        """ $n and $uuid are substituted in string parameters """
+        params = render_params({'key_value': "user$n@example.com",
+                                'attributes': '["email"]', 'id': 5,
+                                'value': '{"price": "$5"}'}, 7)
+        self.assertEqual(params['key_value'], "user7@example.com")
+        self.assertEqual(params['attributes'], '["email"]')
+        self.assertEqual(params['value'], '{"price": "$5"}')
+        self.assertEqual(params['id'], 5)
+        self.assertNotEqual(render_params({'a': "$uuid"}, 1)['a'], "$uuid")
+
+    def test_concurrency(self):
+        """ Closed loop workers call back to back and count errors """
+        result = run_load_test(self.api, "entity",
+                               {'type_name': "user", 'id': "$n"},
+                               duration=0.1, concurrency=3)
+        summary = result.summary()
+        self.assertEqual(summary['requests'], self.calls)
+        self.assertEqual(summary['errors'], self.calls // 4)
+        self.assertEqual(summary['error_codes'].get('310', 0),
+                         self.calls // 4)
+        self.assertGreater(summary['throughput'], 0)
+        self.assertLessEqual(summary['latency']['p50'],
+                             summary['latency']['max'])
+        ids = sorted(int(r['params']['id']) for r in self.transport.requests)
+        self.assertEqual(ids, list(range(1, self.calls + 1)))
+
+    def test_rate(self):
+        """ A fixed rate schedules duration times rate calls """
+        result = run_load_test(self.api, "entity", {'type_name': "user"},
+                               duration=0.2, concurrency=2, rate=50)
+        summary = result.summary()
+        self.assertEqual(summary['requests'] + summary['dropped'], 10)
+
+    def test_rate_backlog_dropped(self):
+        """ Calls that could not start in time are dropped, not drained """
+        def slow(params):
+            time.sleep(0.05)
+            return {'stat': "ok", 'result': {}}
+
+        self.transport.add("entity", slow)
+        result = run_load_test(self.api, "entity", {'type_name': "user"},
+                               duration=0.2, concurrency=1, rate=200)
+        summary = result.summary()
+        self.assertLess(result.elapsed, 0.4)
+        self.assertLessEqual(summary['requests'], 6)
+        self.assertGreater(summary['dropped'], 20)
+        self.assertEqual(summary['requests'] + summary['dropped'], 40)
+
+    def test_summary(self):
+        """ Throughput, error codes and latency percentiles are summarized """
+        result = LoadTestResult()
+        self.assertEqual(result.summary()['latency'], {})
+        result.record(0.5, ApiResponseError(200, "invalid_argument", "", {}))
+        result.record(0.1, ValueError())
+        result.record(0.2)
+        result.elapsed = 2.0
+        summary = result.summary()
+        self.assertEqual(summary['throughput'], 1.5)
+        self.assertEqual(summary['error_codes'],
+                         {'200': 1, 'ValueError': 1})
+        self.assertEqual(summary['latency']['p50'], 0.2)
+        self.assertEqual(summary['latency']['max'], 0.5)
@@ -0,0 +1,64 @@
+import unittest
+import socket
+
+from janrain.capture import Api
+from janrain.capture.api import MemoryTransport, CallInfo
+from janrain.capture.paginate import Paginator, AdaptivePageSize
+
+
+def call_info(network_time, response_size=0):
+    info = CallInfo("https://foo.janrain.com/entity.find")
+    info.network_time = network_time
+    info.response_size = response_size
+    return info
+
+
+class TestAdaptivePageSize(unittest.TestCase):
+    """ Test page size tuning """
+
+    def test_grows_and_shrinks(self):
+        """ Fast pages grow the size and slow pages shrink it """
+        page_size = AdaptivePageSize(initial=100, target_latency=1.0)
+        page_size.observe(call_info(0.1), 100)
+        self.assertEqual(page_size.size, 150)
+
+        page_size.observe(call_info(3.0), 150)
+        self.assertEqual(page_size.size, 75)
+
+        page_size.observe(call_info(1.0), 75)
+        self.assertEqual(page_size.size, 75)
+
+    def test_limits(self):
+        """ Sizes stay within the bounds and the byte budget """
+        page_size = AdaptivePageSize(initial=100, maximum=120,
+                                     max_page_bytes=5000)
+        page_size.observe(call_info(0.01), 100)
+        self.assertEqual(page_size.size, 120)
+        page_size.observe(call_info(0.01, response_size=12000), 120)
+        self.assertEqual(page_size.size, 60)
+
+        page_size = AdaptivePageSize(initial=20, minimum=10)
+        self.assertTrue(page_size.timed_out())
+        self.assertEqual(page_size.size, 10)
+        self.assertFalse(page_size.timed_out())
+
+    def test_paginator_timeouts(self):
+        """ Timed out pages are requested again with fewer records """
+        records = [{'id': i} for i in range(5)]
+
+        def find(params):
+            if int(params['max_results']) > 2:
+                raise socket.timeout()
+            return {"stat": "ok",
+                    "results": records[:int(params['max_results'])]}
+
+        transport = MemoryTransport()
+        transport.add("entity.find", find)
+        api = Api('foo.janrain.com', transport=transport,
+                  defaults={'client_id': 'foo', 'client_secret': 'bar'})
+        page_size = AdaptivePageSize(initial=8, minimum=1, growth=1)
+        pages = list(Paginator(api, page_size=page_size).pages())
+
+        self.assertEqual(pages[0], [{'id': 0}, {'id': 1}])
+        self.assertEqual([r['params']['max_results'] for r in
+                          transport.requests[:3]], [8, 4, 2])
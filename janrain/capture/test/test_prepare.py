@@ -0,0 +1,64 @@
+import unittest
+
+try:
+    from mock import patch
+except ImportError:
+    from unittest.mock import patch
+
+from janrain.capture import Api
+from janrain.capture.api import MemoryTransport
+
+
+class TestPreparedCall(unittest.TestCase):
+    """ Test prepared API calls """
+
+    def setUp(self):
+        self.transport = MemoryTransport()
+        self.transport.add("entity.find", {"stat": "ok", "results": []})
+        self.api = Api('foo.janrain.com', transport=self.transport,
+                       defaults={'client_id': 'foo', 'client_secret': 'bar'})
+
+    @patch('time.gmtime', return_value=(2000, 1, 1, 1, 1, 1, 1, 1, 0))
+    def test_same_request(self, time_mock):
+        """ Prepared calls send the same request as Api.call() """
+        attributes = ["uuid", "email"]
+        self.api.call("entity.find", type_name="user", attributes=attributes,
+                      filter="email = 'a@x.com'")
+        find = self.api.prepare("entity.find", type_name="user",
+                                attributes=attributes)
+        find(filter="email = 'a@x.com'")
+
+        called, prepared = self.transport.requests
+        self.assertEqual(prepared['url'], called['url'])
+        self.assertEqual(prepared['params'], called['params'])
+        self.assertEqual(prepared['headers'], called['headers'])
+
+    def test_varying_params(self):
+        """ Only the varying parameters change between invocations """
+        find = self.api.prepare("/entity.find", type_name="user",
+                                max_results=10)
+        find(filter="id > 1")
+        find(filter="id > 2", max_results=5)
+        first, second = self.transport.requests
+        self.assertEqual(first['params']['filter'], "id > 1")
+        self.assertEqual(second['params']['filter'], "id > 2")
+        self.assertEqual(second['params']['max_results'], 5)
+        self.assertEqual(first['params']['max_results'], 10)
+        self.assertNotIn('client_secret', second['params'])
+
+    def test_access_token(self):
+        """ Access tokens are used as-is without signing """
+        find = self.api.prepare("entity.find", type_name="user",
+                                access_token="token")
+        find()
+        headers = self.transport.requests[0]['headers']
+        self.assertEqual(headers['Authorization'], "OAuth token")
+        self.assertNotIn('Date', headers)
+
+    def test_unsigned(self):
+        """ Credentials are posted when requests are not signed """
+        self.api.sign_requests = False
+        self.api.prepare("entity.find")(type_name="user")
+        request = self.transport.requests[0]
+        self.assertEqual(request['params']['client_id'], "foo")
+        self.assertNotIn('Authorization', request['headers'])
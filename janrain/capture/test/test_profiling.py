@@ -0,0 +1,55 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from janrain.capture import Api
+from janrain.capture.api import MemoryTransport
+from janrain.capture.profiling import PhaseRecorder, Profile
+
+
+class TestProfiling(unittest.TestCase):
+    """ Test profiling of API calls """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.transport = MemoryTransport()
+        self.transport.add("entity.count", {"stat": "ok", "total_count": 5})
+        self.api = Api('foo.janrain.com', transport=self.transport,
+                       defaults={'client_id': 'foo', 'client_secret': 'bar'})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_profile(self):
+        """ Phases, statistics and memory are written to the report """
+        path = os.path.join(self.directory, "profile.txt")
+        with Profile(path, [self.api]) as profile:
+            self.api.call("entity.count", type_name="user")
+            self.api.call("entity.count", type_name="user")
+            with profile.phase("output"):
+                str(self.api.last_call)
+        self.assertIsNone(self.api.tracer)
+
+        phases = profile.phases
+        for name in ("encode", "sign", "network", "decode"):
+            self.assertEqual(phases[name][0], 2)
+        self.assertEqual(phases["output"][0], 1)
+        self.assertGreater(profile.elapsed, 0)
+
+        with open(path) as stream:
+            report = stream.read()
+        self.assertIn("network", report)
+        self.assertIn("function calls", report)
+        if profile.peak_memory is not None:
+            self.assertIn("peak memory", report)
+
+    def test_chained_tracer(self):
+        """ Spans are passed on to the Api's own tracer """
+        inner = PhaseRecorder()
+        self.api.tracer = inner
+        with Profile(apis=[self.api]) as profile:
+            self.api.call("entity.count", type_name="user")
+        self.assertIs(self.api.tracer, inner)
+        self.assertEqual(inner.phases["network"][0], 1)
+        self.assertEqual(profile.phases["network"][0], 1)
@@ -0,0 +1,47 @@
+import unittest
+
+from janrain.capture import Api
+from janrain.capture.api import MemoryTransport
+from janrain.capture.projection import Projection
+
+
+class UserSummary(Projection):
+    attributes = ["uuid", "email"]
+
+
+class TestProjection(unittest.TestCase):
+    """ Test projected entity reads """
+
+    def setUp(self):
+        self.transport = MemoryTransport()
+        self.transport.add("entity", {"stat": "ok", "result": {
+            'uuid': "abc", 'email': "a@x.com"}})
+        self.transport.add("entity.find", {"stat": "ok", "results": [
+            {'uuid': "abc", 'email': "a@x.com"},
+            {'uuid': "def", 'email': "b@x.com"}]})
+        self.api = Api('foo.janrain.com', transport=self.transport,
+                       defaults={'client_id': 'foo', 'client_secret': 'bar'})
+
+    def test_attributes_sent(self):
+        """ The declared attributes are always requested """
+        users = UserSummary(self.api)
+        self.assertEqual(users.get(uuid="abc")['email'], "a@x.com")
+        self.assertEqual(len(users.find("email is not null")), 2)
+        for request in self.transport.requests:
+            self.assertEqual(request['params']['attributes'],
+                             '["uuid", "email"]')
+            self.assertEqual(request['params']['type_name'], "user")
+
+    def test_stats(self):
+        """ Payload sizes are reported """
+        users = UserSummary(self.api)
+        users.find()
+        self.assertEqual(users.stats.calls, 1)
+        self.assertEqual(users.stats.records, 2)
+        self.assertEqual(users.stats.bytes, self.api.last_call.response_size)
+        self.assertGreater(users.stats.bytes_per_record, 0)
+
+    def test_requires_attributes(self):
+        """ An empty projection is rejected """
+        with self.assertRaises(ValueError):
+            Projection(self.api)
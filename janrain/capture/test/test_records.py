@@ -0,0 +1,77 @@
+import unittest
+import sys
+
+from janrain.capture import Api
+from janrain.capture.api import MemoryTransport
+from janrain.capture.paginate import Paginator
+from janrain.capture.records import record_class, JsonRecord, \
+    memory_footprint
+
+
+def make_records(count):
+    return [{'id': i, 'uuid': "uuid-{}".format(i),
+             'email': "user{}@example.com".format(i),
+             'primaryAddress': {'city': "Paris", 'zip': "75001"}}
+            for i in range(count)]
+
+
+class TestRecords(unittest.TestCase):
+    """ Test compact record representations """
+
+    def test_slots_record(self):
+        """ Slots records flatten the projected attributes """
+        User = record_class(["uuid", "primaryAddress.city"], "User")
+        user = User.from_dict(make_records(1)[0])
+        self.assertEqual(user['primaryAddress.city'], "Paris")
+        self.assertEqual(user.get('email', "none"), "none")
+        self.assertEqual(user.as_dict(), {'uuid': "uuid-0",
+                                          'primaryAddress.city': "Paris"})
+        self.assertFalse(hasattr(user, '__dict__'))
+
+    def test_reserved_names(self):
+        """ Names clashing with the record class are refused """
+        for name in ("as_dict", "get", "attributes", "__class__", "__x",
+                     "2fa", "", "a.b", "a_b"):
+            with self.assertRaises(ValueError):
+                record_class(["a_b", name])
+
+    def test_json_record(self):
+        """ JSON records decode lazily """
+        record = make_records(1)[0]
+        compact = JsonRecord.from_dict(record)
+        self.assertIsInstance(compact.raw, bytes)
+        self.assertEqual(compact['primaryAddress.city'], "Paris")
+        self.assertEqual(compact.decode(), record)
+
+    def test_paginator_factory(self):
+        """ Paginators can return compact records """
+        transport = MemoryTransport()
+        transport.add("entity.find", {"stat": "ok",
+                                      "results": make_records(3)})
+        api = Api('foo.janrain.com', transport=transport,
+                  defaults={'client_id': 'foo', 'client_secret': 'bar'})
+        User = record_class(["id", "email"])
+        users = list(Paginator(api, attributes=User.attributes,
+                               page_size=10, record_factory=User.from_dict))
+        self.assertEqual([u['id'] for u in users], [0, 1, 2])
+
+    @unittest.skipIf(sys.version_info < (3, 4), "requires tracemalloc")
+    def test_memory_footprint(self):
+        """ Compact records use less memory than dictionaries """
+        records = make_records(2000)
+        User = record_class(["id", "uuid", "email", "primaryAddress.city"])
+        dicts = memory_footprint(records)
+        self.assertLess(memory_footprint(records, User.from_dict), dicts)
+        self.assertLess(memory_footprint(records, JsonRecord.from_dict),
+                        dicts)
+
+    @unittest.skipIf(sys.version_info < (3, 4), "requires tracemalloc")
+    def test_memory_footprint_keeps_tracing(self):
+        """ Tracing started by someone else is left running """
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            self.assertGreater(memory_footprint(make_records(10)), 0)
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,96 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+
+from janrain.capture import Api
+from janrain.capture.api import MemoryTransport
+from janrain.capture.replica import Replica
+
+
+class TestReplica(unittest.TestCase):
+    """ Test the local SQLite replica """
+
+    def setUp(self):
+        self.records = [
+            {'id': 1, 'uuid': "a", 'lastUpdated': "2018-01-01",
+             'email': "a@x.com", 'primaryAddress': {'city': "Paris"}},
+            {'id': 2, 'uuid': "b", 'lastUpdated': "2018-01-02",
+             'email': "b@x.com", 'primaryAddress': {'city': "Lyon"}},
+        ]
+        self.transport = MemoryTransport()
+        self.transport.add("entity.find", lambda params: {
+            "stat": "ok",
+            "results": [r for r in self.records
+                        if 'filter' not in params or
+                        r['lastUpdated'] > "2018-01-02"]})
+        self.api = Api('foo.janrain.com', transport=self.transport,
+                       defaults={'client_id': 'foo', 'client_secret': 'bar'})
+        self.replica = Replica(self.api, ":memory:",
+                               attributes=["email", "primaryAddress.city"],
+                               indexes=["email"])
+
+    def tearDown(self):
+        self.replica.close()
+
+    def test_refresh_and_query(self):
+        """ Entities are copied and queried locally """
+        self.assertEqual(self.replica.refresh(), 2)
+        self.assertEqual(self.replica.count(), 2)
+        self.assertEqual(
+            self.replica.get(email="b@x.com")['primaryAddress.city'], "Lyon")
+        rows = self.replica.query('"primaryAddress.city" = ?', ["Paris"])
+        self.assertEqual([r['uuid'] for r in rows], ["a"])
+        self.assertEqual(self.transport.requests[0]['params']['attributes'],
+                         '["email", "id", "lastUpdated", "primaryAddress", '
+                         '"uuid"]')
+
+    def test_incremental_refresh(self):
+        """ Only changed entities are pulled on later refreshes """
+        self.replica.refresh()
+        self.records.append({'id': 1, 'uuid': "a",
+                             'lastUpdated': "2018-01-03",
+                             'email': "new@x.com"})
+        self.assertEqual(self.replica.refresh(), 1)
+        self.assertEqual(self.replica.get(uuid="a")['email'], "new@x.com")
+        self.assertEqual(self.replica.count(), 2)
+
+    def test_query_during_refresh(self):
+        """ Local queries are not blocked while a page is being fetched """
+        fetching = threading.Event()
+        release = threading.Event()
+
+        def find(params):
+            fetching.set()
+            release.wait(5)
+            return {"stat": "ok", "results": self.records}
+        self.transport.add("entity.find", find)
+        thread = threading.Thread(target=self.replica.refresh)
+        thread.start()
+        try:
+            self.assertTrue(fetching.wait(5))
+            self.assertEqual(self.replica.count(), 0)
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(self.replica.count(), 2)
+
+    def test_attributes_changed(self):
+        """ The table is recreated when the attribute list changes """
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "users.db")
+            replica = Replica(self.api, path, attributes=["email"])
+            replica.refresh()
+            replica.close()
+
+            replica = Replica(self.api, path,
+                              attributes=["email", "primaryAddress.city"])
+            self.assertEqual(replica.count(), 0)
+            self.assertEqual(replica.refresh(), 2)
+            self.assertEqual(
+                replica.get(uuid="a")['primaryAddress.city'], "Paris")
+            replica.close()
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,121 @@
+import unittest
+import threading
+import time
+
+from janrain.capture import Api
+from janrain.capture.api import MemoryTransport
+from janrain.capture.deadline import Deadline
+from janrain.capture.exceptions import JanrainDeadlineError
+from janrain.capture.pool import run_concurrently
+from janrain.capture.scheduler import Scheduler, priority
+
+
+class TestScheduler(unittest.TestCase):
+    """ Test priority scheduling of calls """
+
+    def queue_calls(self, scheduler, names):
+        """ Queue one waiting call per class name while the only slot is
+        held, then release it and return the order they ran in. """
+        order = []
+        lock = threading.Lock()
+
+        def call(name):
+            with scheduler.slot(name):
+                with lock:
+                    order.append(name)
+
+        scheduler.acquire()
+        threads = []
+        for i, name in enumerate(names):
+            thread = threading.Thread(target=call, args=(name,))
+            thread.start()
+            threads.append(thread)
+            while sum(stats['queued'] for key, stats in
+                      scheduler.stats().items() if key != 'active') <= i:
+                time.sleep(0.001)
+        scheduler.release()
+        for thread in threads:
+            thread.join()
+        return order
+
+    def test_interactive_first(self):
+        """ Interactive calls are dispatched before bulk calls """
+        scheduler = Scheduler(concurrency=1)
+        order = self.queue_calls(scheduler, ['bulk', 'bulk', 'interactive',
+                                             'bulk', 'interactive'])
+        self.assertEqual(order, ['interactive', 'interactive',
+                                 'bulk', 'bulk', 'bulk'])
+
+        stats = scheduler.stats()
+        self.assertEqual(stats['active'], 0)
+        self.assertEqual(stats['bulk']['dispatched'], 3)
+        self.assertEqual(stats['bulk']['queued'], 0)
+        self.assertGreater(stats['bulk']['max_wait'], 0)
+
+    def test_weighted_fair_queuing(self):
+        """ Classes of equal priority share slots by weight """
+        scheduler = Scheduler(concurrency=1, classes={
+            'interactive': (0, 1),
+            'reports': (1, 1),
+            'exports': (1, 3),
+        })
+        order = self.queue_calls(scheduler, ['reports'] * 4 + ['exports'] * 6)
+        self.assertEqual(order[:4].count('exports'), 3)
+        self.assertEqual(order[-2:], ['reports', 'reports'])
+
+    def test_unknown_class(self):
+        """ Unknown classes are refused """
+        scheduler = Scheduler()
+        with self.assertRaises(ValueError):
+            scheduler.acquire('batch')
+        with self.assertRaises(ValueError):
+            Scheduler(default='batch')
+
+    def test_deadline_while_queued(self):
+        """ A call waiting past its deadline leaves the queue """
+        scheduler = Scheduler(concurrency=1)
+        scheduler.acquire()
+        with Deadline(0.01):
+            with self.assertRaises(JanrainDeadlineError):
+                scheduler.acquire('bulk')
+        self.assertEqual(scheduler.stats()['bulk']['queued'], 0)
+        scheduler.release()
+
+    def test_rate_limited_dispatch(self):
+        """ Dispatch waits for the rate limiter """
+        class Limiter(object):
+            calls = 0
+
+            def try_acquire(self):
+                self.calls += 1
+                return 0 if self.calls % 2 else 0.001
+
+        def call(i):
+            with scheduler.slot():
+                pass
+
+        limiter = Limiter()
+        scheduler = Scheduler(concurrency=5, rate_limiter=limiter)
+        run_concurrently(call, range(3), workers=3)
+        self.assertEqual(scheduler.stats()['interactive']['dispatched'], 3)
+        self.assertGreaterEqual(limiter.calls, 5)
+
+    def test_api_priority(self):
+        """ Api calls are scheduled in the current class """
+        transport = MemoryTransport()
+        transport.add("entity.count", {'stat': "ok", 'total_count': 1})
+        scheduler = Scheduler(concurrency=2)
+        api = Api('foo.janrain.com', transport=transport, scheduler=scheduler,
+                  defaults={'client_id': 'foo', 'client_secret': 'bar'})
+
+        api.call("entity.count", type_name="user")
+        with priority('bulk'):
+            results = run_concurrently(
+                lambda i: api.call("entity.count", type_name="user"),
+                range(4), workers=2)
+        self.assertTrue(all(error is None for _, _, error in results))
+
+        stats = scheduler.stats()
+        self.assertEqual(stats['active'], 0)
+        self.assertEqual(stats['interactive']['dispatched'], 1)
+        self.assertEqual(stats['bulk']['dispatched'], 4)
@@ -0,0 +1,111 @@
+import unittest
+import threading
+
+from janrain.capture import Api, JanrainValidationError
+from janrain.capture.api import MemoryTransport
+from janrain.capture.schema import SchemaCache, Validator
+
+ATTR_DEFS = [
+    {'name': "uuid", 'type': "uuid"},
+    {'name': "email", 'type': "string", 'length': 20,
+     'constraints': ["required"]},
+    {'name': "birthday", 'type': "date"},
+    {'name': "optIn", 'type': "boolean"},
+    {'name': "primaryAddress", 'type': "object", 'attr_defs': [
+        {'name': "city", 'type': "string", 'length': 10}]},
+    {'name': "photos", 'type': "plural", 'attr_defs': [
+        {'name': "id", 'type': "id"},
+        {'name': "value", 'type': "string"}]},
+]
+
+
+class TestSchema(unittest.TestCase):
+    """ Test local validation of entity payloads """
+
+    def test_validator(self):
+        """ Names, types, lengths and plurals are checked """
+        validator = Validator(ATTR_DEFS)
+        self.assertEqual(validator.errors({
+            'email': "jane@example.com",
+            'birthday': "2000-01-31",
+            'primaryAddress': {'city': "Paris"},
+            'photos': [{'id': 1, 'value': "a"}, {'value': "b"}],
+        }), [])
+
+        errors = validator.errors({
+            'emial': "jane@example.com",
+            'optIn': "yes",
+            'birthday': "31/01/2000",
+            'primaryAddress': {'city': "Llanfairpwllgwyngyll"},
+            'photos': [{'value': 5}],
+        }, partial=False)
+        self.assertEqual(sorted(errors), [
+            "birthday: expected date",
+            "email: required",
+            "emial: unknown attribute",
+            "optIn: expected boolean",
+            "photos[0].value: expected string",
+            "primaryAddress.city: longer than 10 characters",
+        ])
+
+    def test_api_validation(self):
+        """ Invalid writes fail before the request is sent """
+        transport = MemoryTransport()
+        transport.add("entityType", {"stat": "ok", "schema": {
+            'name': "user", 'attr_defs': ATTR_DEFS}})
+        transport.add("entity.update", {"stat": "ok"})
+        api = Api('foo.janrain.com', transport=transport,
+                  defaults={'client_id': 'foo', 'client_secret': 'bar'},
+                  validate_schemas=True)
+
+        with self.assertRaises(JanrainValidationError):
+            api.call("entity.create", type_name="user",
+                     attributes={'optIn': True})
+        with self.assertRaises(JanrainValidationError) as cm:
+            api.call("entity.bulkCreate", type_name="user",
+                     all_attributes=[{'email': "a@x.com"}, {'optIn': 1}])
+        self.assertEqual(len(cm.exception.errors), 2)
+
+        api.call("entity.update", type_name="user", uuid="abc",
+                 value='{"optIn": false}')
+        api.call("entity.update", type_name="user", uuid="abc",
+                 value={'primaryAddress': {'city': "Lyon"}})
+        paths = [r['path'] for r in transport.requests]
+        self.assertEqual(paths, ["/entityType", "/entity.update",
+                                 "/entity.update"])
+
+    def test_cache_fetches_outside_lock(self):
+        """ A slow entityType call only holds up its own type """
+        fetching = threading.Event()
+        release = threading.Event()
+
+        def entity_type(params):
+            if params['type_name'] == "user":
+                fetching.set()
+                release.wait(5)
+            return {"stat": "ok", "schema": {'name': params['type_name'],
+                                             'attr_defs': ATTR_DEFS}}
+
+        transport = MemoryTransport()
+        transport.add("entityType", entity_type)
+        api = Api('foo.janrain.com', transport=transport,
+                  defaults={'client_id': 'foo', 'client_secret': 'bar'})
+        cache = SchemaCache(api)
+        cache.get("admin")
+
+        threads = [threading.Thread(target=cache.get, args=("user",))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        try:
+            self.assertTrue(fetching.wait(5))
+            other = threading.Thread(target=cache.get, args=("admin",))
+            other.start()
+            other.join(1)
+            self.assertFalse(other.is_alive())
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join()
+        types = [r['params']['type_name'] for r in transport.requests]
+        self.assertEqual(types, ["admin", "user"])
@@ -0,0 +1,211 @@
+import unittest
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from janrain.capture import Api
+from janrain.capture.api import MemoryTransport
+from janrain.capture.deadline import Deadline
+from janrain.capture.exceptions import JanrainDeadlineError, \
+    JanrainSharedStateError
+from janrain.capture.sharedstate import SharedRateLimiter, \
+    SharedTokenCache, locked, state_path
+
+try:
+    from mock import patch
+except ImportError:
+    from unittest.mock import patch
+
+
+def take_tokens(directory):
+    limiter = SharedRateLimiter.for_client('foo', 0.001, burst=5,
+                                           directory=directory)
+    taken = sum(1 for _ in range(5) if not limiter.try_acquire())
+    limiter.close()
+    return taken
+
+
+class TestSharedState(unittest.TestCase):
+    """ Test state shared between processes through files """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_rate_limiter_shared_across_instances(self):
+        """ Limiters opened for the same client share one bucket """
+        first = SharedRateLimiter.for_client('foo', 0.001, burst=3,
+                                             directory=self.directory)
+        second = SharedRateLimiter.for_client('foo', 0.001, burst=3,
+                                              directory=self.directory)
+        other = SharedRateLimiter.for_client('bar', 0.001, burst=3,
+                                             directory=self.directory)
+        self.assertEqual(first.try_acquire(), 0)
+        self.assertEqual(second.try_acquire(), 0)
+        self.assertEqual(first.try_acquire(), 0)
+        self.assertGreater(second.try_acquire(), 0)
+        self.assertEqual(other.try_acquire(), 0)
+        for limiter in (first, second, other):
+            limiter.close()
+
+    def test_rate_limiter_shared_across_processes(self):
+        """ Processes share the bucket through the file """
+        pool = multiprocessing.Pool(3)
+        try:
+            taken = pool.map(take_tokens, [self.directory] * 3)
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(sum(taken), 5)
+
+    def test_rate_limiter_shared_across_threads(self):
+        """ Threads sharing a limiter never take the same token """
+        limiter = SharedRateLimiter.for_client('foo', 0.001, burst=2000,
+                                               directory=self.directory)
+        granted = []
+
+        def take():
+            granted.append(sum(1 for _ in range(1000)
+                               if not limiter.try_acquire()))
+
+        # switch threads as often as possible to provoke races
+        if hasattr(sys, 'setswitchinterval'):
+            getinterval, setinterval, fastest = \
+                sys.getswitchinterval, sys.setswitchinterval, 1e-6
+        else:
+            # Python 2
+            getinterval, setinterval, fastest = \
+                sys.getcheckinterval, sys.setcheckinterval, 1
+        interval = getinterval()
+        setinterval(fastest)
+        try:
+            threads = [threading.Thread(target=take) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            setinterval(interval)
+        limiter.close()
+        self.assertEqual(sum(granted), 2000)
+
+    def test_lock_excludes_threads(self):
+        """ The file lock also excludes the other threads """
+        limiter = SharedRateLimiter.for_client('foo', 0.001, burst=2,
+                                               directory=self.directory)
+        thread = threading.Thread(target=limiter.try_acquire)
+        with locked(limiter._fd, limiter._lock):
+            thread.start()
+            thread.join(0.1)
+            self.assertTrue(thread.is_alive())
+        thread.join()
+        limiter.close()
+
+    def test_acquire_respects_deadline(self):
+        """ Waiting for the rate limit is bounded by the Deadline """
+        limiter = SharedRateLimiter.for_client('foo', 0.001, burst=1,
+                                               directory=self.directory)
+        limiter.acquire()
+        with Deadline(1):
+            with self.assertRaises(JanrainDeadlineError):
+                limiter.acquire()
+        limiter.close()
+
+    def test_api_waits_on_rate_limiter(self):
+        """ Api calls take a token from the shared limiter """
+        limiter = SharedRateLimiter.for_client('foo', 1000, burst=1,
+                                               directory=self.directory)
+        transport = MemoryTransport()
+        transport.add("entity.count", {'stat': "ok", 'total_count': 1})
+        api = Api('foo.janrain.com', transport=transport, rate_limiter=limiter,
+                  defaults={'client_id': 'foo', 'client_secret': 'bar'})
+        api.call("entity.count", type_name="user")
+        api.call("entity.count", type_name="user")
+        self.assertGreater(limiter.try_acquire(), 0)
+        limiter.close()
+
+    def test_token_cache(self):
+        """ Only one instance fetches the shared token """
+        fetched = []
+
+        def fetch():
+            fetched.append(1)
+            return "token{}".format(len(fetched)), 3600
+
+        first = SharedTokenCache.for_client('foo', directory=self.directory)
+        second = SharedTokenCache.for_client('foo', directory=self.directory)
+        self.assertEqual(first.get(fetch), "token1")
+        self.assertEqual(second.get(fetch), "token1")
+        self.assertEqual(len(fetched), 1)
+
+        second.clear()
+        self.assertEqual(first.get(fetch), "token2")
+
+    def test_token_cache_refreshes_expiring_token(self):
+        """ Tokens close to expiry are fetched again """
+        cache = SharedTokenCache.for_client('foo', margin=60,
+                                            directory=self.directory)
+        self.assertEqual(cache.get(lambda: ("old", 30)), "old")
+        self.assertEqual(cache.get(lambda: ("new", 3600)), "new")
+        self.assertEqual(cache.get(lambda: ("newer", 3600)), "new")
+
+    def test_private_directory(self):
+        """ State files default to a directory only the user can access """
+        with patch('tempfile.gettempdir', return_value=self.directory):
+            path = state_path("token", "foo")
+        directory = os.path.dirname(path)
+        self.assertEqual(os.path.dirname(directory), self.directory)
+        self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+
+        os.chmod(directory, 0o755)
+        with patch('tempfile.gettempdir', return_value=self.directory):
+            with self.assertRaises(JanrainSharedStateError):
+                state_path("token", "foo")
+
+    def test_unsafe_files_refused(self):
+        """ Files readable by others or symbolic links are not used """
+        path = os.path.join(self.directory, "token")
+        with open(path, 'w') as stream:
+            stream.write('{"access_token": "planted", "expires_at": 1e10}')
+        os.chmod(path, 0o644)
+        with self.assertRaises(JanrainSharedStateError):
+            SharedTokenCache(path).get(lambda: ("token", 3600))
+
+        link = os.path.join(self.directory, "link")
+        os.symlink(os.path.join(self.directory, "target"), link)
+        with self.assertRaises(OSError):
+            SharedRateLimiter(link, 1)
+        self.assertFalse(os.path.exists(os.path.join(self.directory,
+                                                     "target")))
+
+    def test_api_token_cache(self):
+        """ Api calls are authorized with the cached token """
+        transport = MemoryTransport()
+        transport.add("oauth/token", {'stat': "ok", 'access_token': "abc",
+                                      'expires_in': 3600})
+        transport.add("entity.count", {'stat': "ok", 'total_count': 1})
+        tokens = SharedTokenCache.for_client('foo', directory=self.directory)
+        api = Api('foo.janrain.com', transport=transport, token_cache=tokens,
+                  defaults={'client_id': 'foo', 'client_secret': 'bar'})
+        api.call("entity.count", type_name="user")
+        api.call("entity.count", type_name="user")
+        paths = [r['path'] for r in transport.requests]
+        self.assertEqual(paths, ["/oauth/token", "/entity.count",
+                                 "/entity.count"])
+        self.assertEqual(transport.requests[0]['params'],
+                         {'grant_type': "client_credentials"})
+        self.assertNotEqual(
+            transport.requests[0]['headers']['Authorization'], "OAuth abc")
+        for request in transport.requests[1:]:
+            self.assertEqual(request['headers']['Authorization'],
+                             "OAuth abc")
+
+        api.call("entity.count", type_name="user", client_id="other",
+                 client_secret="secret")
+        self.assertNotEqual(
+            transport.requests[-1]['headers']['Authorization'], "OAuth abc")
@@ -0,0 +1,87 @@
+import unittest
+from contextlib import contextmanager
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+from janrain.capture import Api, ApiResponseError
+from janrain.capture.api import MemoryTransport
+from janrain.capture.aggregate import group_count, Dimension
+
+
+class FakeSpan(object):
+    def __init__(self, name, attributes, parent):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.parent = parent
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+
+class FakeTracer(object):
+    """ Records spans with the OpenTelemetry start_as_current_span API """
+
+    def __init__(self):
+        self.spans = []
+        self.current = contextvars.ContextVar('span', default=None)
+
+    @contextmanager
+    def start_as_current_span(self, name, attributes=None):
+        current = FakeSpan(name, attributes, self.current.get())
+        self.spans.append(current)
+        token = self.current.set(current)
+        try:
+            yield current
+        finally:
+            self.current.reset(token)
+
+    def named(self, name):
+        return [s for s in self.spans if s.name == name]
+
+
+@unittest.skipIf(contextvars is None, "requires contextvars")
+class TestTracing(unittest.TestCase):
+    """ Test tracing spans """
+
+    def setUp(self):
+        self.tracer = FakeTracer()
+        self.transport = MemoryTransport()
+        self.transport.add("entity.count", {"stat": "ok", "total_count": 5})
+        self.transport.add("entity", {"stat": "error", "code": 310,
+                                      "error": "record_not_found",
+                                      "error_description": "not found"})
+        self.api = Api('foo.janrain.com', transport=self.transport,
+                       defaults={'client_id': 'foo', 'client_secret': 'bar'},
+                       tracer=self.tracer)
+
+    def test_call_spans(self):
+        """ Each call has encode, sign, network and decode child spans """
+        self.api.call("entity.count", type_name="user")
+        call = self.tracer.named("capture /entity.count")[0]
+        self.assertEqual(call.attributes['janrain.endpoint'],
+                         "/entity.count")
+        self.assertEqual(call.attributes['http.status_code'], 200)
+        self.assertGreater(call.attributes['janrain.response_size'], 0)
+        children = [s.name for s in self.tracer.spans if s.parent is call]
+        self.assertEqual(children, ["encode", "sign", "network", "decode"])
+
+    def test_error_code(self):
+        """ API error codes are recorded """
+        with self.assertRaises(ApiResponseError):
+            self.api.call("entity", uuid="abc")
+        call = self.tracer.named("capture /entity")[0]
+        self.assertEqual(call.attributes['janrain.error_code'], 310)
+
+    def test_propagation(self):
+        """ Calls made in worker threads are children of the caller's span """
+        with self.tracer.start_as_current_span("request") as parent:
+            group_count(self.api, [Dimension("country", ["US", "FR"])])
+        job = self.tracer.named("capture.group_count")[0]
+        self.assertIs(job.parent, parent)
+        calls = self.tracer.named("capture /entity.count")
+        self.assertEqual(len(calls), 2)
+        for call in calls:
+            self.assertIs(call.parent, job)
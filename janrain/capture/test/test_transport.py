@@ -0,0 +1,231 @@
+import unittest
+import json
+import socket
+import threading
+
+try:
+    from mock import patch
+except ImportError:
+    from unittest.mock import patch
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from janrain.capture import Api, ApiResponseError
+from janrain.capture.api import MemoryTransport, TransportResponse, HTTPError
+
+
+class TestTransport(unittest.TestCase):
+    """ Test pluggable HTTP transports """
+
+    def setUp(self):
+        self.transport = MemoryTransport()
+        defaults = {'client_id': 'foo', 'client_secret': 'bar'}
+        self.api = Api('foo.janrain.com', defaults=defaults,
+                       transport=self.transport)
+
+    def test_memory_transport(self):
+        """ Requests are signed and encoded before reaching the transport """
+        self.transport.add("entity.count", {"stat": "ok", "total_count": 5})
+        result = self.api.call("entity.count", type_name="user")
+        self.assertEqual(result['total_count'], 5)
+
+        request = self.transport.requests[0]
+        self.assertEqual(request['path'], "/entity.count")
+        self.assertEqual(request['params'], {'type_name': "user"})
+        self.assertTrue(
+            request['headers']['Authorization'].startswith("Signature foo:"))
+        self.assertEqual(request['timeout'], (10, 10))
+
+    def test_memory_transport_callable(self):
+        """ Responses can be computed from the request parameters """
+        self.transport.add("entity", lambda params: {
+            "stat": "ok", "result": {"uuid": params['uuid']}})
+        result = self.api.call("entity", uuid="abc")
+        self.assertEqual(result['result']['uuid'], "abc")
+
+    def test_error_handling(self):
+        """ Error handling is shared by all transports """
+        self.transport.add("entity", {
+            "code": 999,
+            "error_description": "mock API error",
+            "error": "mock_error",
+            "stat": "error"
+        })
+        with self.assertRaises(ApiResponseError):
+            self.api.call("entity")
+
+        # unknown endpoints respond with an empty 404
+        with self.assertRaises(HTTPError):
+            self.api.call("foo")
+
+        self.transport.add("bar", b"<html>oops</html>", status_code=503)
+        with self.assertRaises(HTTPError):
+            self.api.call("bar")
+
+    def test_transport_response(self):
+        """ TransportResponse decodes JSON bodies """
+        response = TransportResponse(200, b'{"stat": "ok"}')
+        self.assertEqual(response.json(), {"stat": "ok"})
+        response.raise_for_status()
+
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+except ImportError:
+    h2 = None
+
+RESPONSE = json.dumps({"stat": "ok", "total_count": 5}).encode('utf-8')
+
+
+class Http1Handler(BaseHTTPRequestHandler):
+    """ Answers every POST with RESPONSE over HTTP/1.1 """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.versions.append(self.request_version)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+class H2Server(object):
+    """ A minimal cleartext HTTP/2 server answering with RESPONSE """
+
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, address = self.sock.accept()
+            except (OSError, socket.error):
+                return
+            self.handle(conn)
+            conn.close()
+
+    def handle(self, conn):
+        connection = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False))
+        connection.initiate_connection()
+        conn.sendall(connection.data_to_send())
+        bodies = {}
+        while True:
+            data = conn.recv(65535)
+            if not data:
+                return
+            for event in connection.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    bodies[event.stream_id] = b""
+                    self.requests.append(dict(event.headers))
+                elif isinstance(event, h2.events.DataReceived):
+                    bodies[event.stream_id] += event.data
+                    connection.acknowledge_received_data(
+                        event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    connection.send_headers(event.stream_id, [
+                        (":status", "200"),
+                        ("content-type", "application/json"),
+                        ("content-length", str(len(RESPONSE))),
+                    ])
+                    connection.send_data(event.stream_id, RESPONSE,
+                                         end_stream=True)
+            conn.sendall(connection.data_to_send())
+
+    def close(self):
+        self.sock.close()
+
+
+@unittest.skipIf(httpx is None, "httpx is not installed")
+class TestHttp2Transport(unittest.TestCase):
+    """ Test the HTTP/2 transport """
+
+    def test_post(self):
+        """ Parameters are form encoded and responses decoded """
+        from janrain.capture.api import Http2Transport
+        seen = []
+
+        def handler(request):
+            seen.append(request)
+            return httpx.Response(200, json={"stat": "ok", "total_count": 5})
+
+        client = httpx.Client(transport=httpx.MockTransport(handler))
+        api = Api('foo.janrain.com', defaults={'client_id': 'foo',
+                                               'client_secret': 'bar'},
+                  transport=Http2Transport(client))
+        result = api.call("entity.count", type_name="user")
+
+        self.assertEqual(result['total_count'], 5)
+        self.assertEqual(seen[0].url.path, "/entity.count")
+        self.assertEqual(seen[0].content, b"type_name=user")
+
+    def test_fallback_without_h2(self):
+        """ HTTP/1.1 is used when the 'h2' module is missing """
+        from janrain.capture.api import Http2Transport
+        server = HTTPServer(("127.0.0.1", 0), Http1Handler)
+        server.versions = []
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            with patch('janrain.capture.api.find_spec', return_value=None), \
+                    patch.object(httpx, 'Client',
+                                 wraps=httpx.Client) as client_class:
+                with self.assertLogs('janrain.capture.api', 'WARNING'):
+                    transport = Http2Transport()
+            self.assertFalse(client_class.call_args[1]['http2'])
+            api = Api("http://127.0.0.1:{}".format(server.server_port),
+                      defaults={'client_id': 'foo', 'client_secret': 'bar'},
+                      transport=transport)
+            result = api.call("entity.count", type_name="user")
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(result['total_count'], 5)
+        self.assertEqual(server.versions, ["HTTP/1.1"])
+
+    @unittest.skipIf(h2 is None, "h2 is not installed")
+    def test_http2_server(self):
+        """ Calls are sent over HTTP/2 to a server which speaks it """
+        from janrain.capture.api import Http2Transport
+        server = H2Server()
+        try:
+            # cleartext HTTP/2 needs prior knowledge instead of TLS ALPN
+            transport = Http2Transport(http1=False)
+            api = Api("http://127.0.0.1:{}".format(server.port),
+                      defaults={'client_id': 'foo', 'client_secret': 'bar'},
+                      transport=transport)
+            with self.assertLogs('janrain.capture.api', 'DEBUG') as logs:
+                results = [api.call("entity.count", type_name="user")
+                           for i in range(3)]
+        finally:
+            server.close()
+        self.assertEqual([r['total_count'] for r in results], [5, 5, 5])
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(server.requests[0][b':path'], b'/entity.count')
+        self.assertTrue(any("HTTP/2 http://127.0.0.1" in line
+                            for line in logs.output))
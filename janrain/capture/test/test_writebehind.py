@@ -0,0 +1,131 @@
+import unittest
+import json
+import threading
+import time
+
+from janrain.capture import Api
+from janrain.capture.api import MemoryTransport
+from janrain.capture.writebehind import WriteBehindBuffer, deep_merge
+
+
+class TestWriteBehind(unittest.TestCase):
+    """ Test coalescing of buffered entity updates """
+
+    def setUp(self):
+        self.transport = MemoryTransport()
+        self.transport.add("entity.update", {'stat': "ok"})
+        self.api = Api('foo.janrain.com', transport=self.transport,
+                       defaults={'client_id': 'foo', 'client_secret': 'bar'})
+
+    def sent(self):
+        return [(r['params'].get('uuid'), json.loads(r['params']['value']))
+                for r in self.transport.requests]
+
+    def test_deep_merge(self):
+        """ Nested dicts merge and lists and scalars are replaced """
+        target = {'givenName': "Jane", 'primaryAddress': {'city': "Paris"},
+                  'photos': [{'value': "a"}]}
+        deep_merge(target, {'primaryAddress': {'zip': "75001"},
+                            'photos': [{'value': "b"}], 'givenName': None})
+        self.assertEqual(target, {
+            'givenName': None,
+            'primaryAddress': {'city': "Paris", 'zip': "75001"},
+            'photos': [{'value': "b"}],
+        })
+
+    def test_coalesce_and_flush(self):
+        """ Updates to one entity are coalesced into one call """
+        buffer = WriteBehindBuffer(self.api, window=60)
+        buffer.update({'givenName': "Jane"}, uuid="1")
+        buffer.update({'primaryAddress': {'city': "Paris"}}, uuid="1")
+        buffer.update({'familyName': "Doe"}, uuid="2")
+        buffer.update({'primaryAddress': {'zip': "75001"}}, uuid="1")
+        self.assertEqual(self.transport.requests, [])
+
+        buffer.flush()
+        self.assertEqual(sorted(self.sent()), [
+            ("1", {'givenName': "Jane",
+                   'primaryAddress': {'city': "Paris", 'zip': "75001"}}),
+            ("2", {'familyName': "Doe"}),
+        ])
+        self.assertEqual(buffer.stats.as_dict(), {
+            'updates': 4, 'calls': 2, 'errors': 0, 'coalescing_ratio': 2.0})
+        buffer.shutdown()
+
+    def test_window(self):
+        """ Buffered updates are sent once the window elapses """
+        buffer = WriteBehindBuffer(self.api, window=0.05)
+        buffer.update({'givenName': "Jane"}, uuid="1")
+        buffer.update({'familyName': "Doe"}, uuid="1")
+        for i in range(100):
+            if self.transport.requests:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.sent(), [
+            ("1", {'givenName': "Jane", 'familyName': "Doe"})])
+        buffer.shutdown()
+
+    def test_shutdown(self):
+        """ Shutdown flushes and further updates are refused """
+        with WriteBehindBuffer(self.api, window=60) as buffer:
+            buffer.update({'givenName': "Jane"}, uuid="1")
+        self.assertEqual(len(self.transport.requests), 1)
+        with self.assertRaises(ValueError):
+            buffer.update({'givenName': "Jane"}, uuid="1")
+
+    def test_max_pending(self):
+        """ A full buffer is flushed by update() """
+        buffer = WriteBehindBuffer(self.api, window=60, max_pending=2)
+        buffer.update({'givenName': "Jane"}, uuid="1")
+        self.assertEqual(len(self.transport.requests), 0)
+        buffer.update({'givenName': "John"}, uuid="2")
+        self.assertEqual(len(self.transport.requests), 2)
+        buffer.shutdown()
+
+    def test_flush_concurrent_updates(self):
+        """ Flush waits only for the updates buffered before it """
+        buffer = WriteBehindBuffer(self.api, window=60)
+        buffer.update({'givenName': "Jane"}, uuid="1")
+        stop = threading.Event()
+
+        def produce():
+            i = 0
+            while not stop.is_set():
+                i += 1
+                buffer.update({'givenName': str(i)}, uuid=str(i % 5 + 2))
+                time.sleep(0.001)
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        try:
+            flusher = threading.Thread(target=buffer.flush)
+            flusher.start()
+            flusher.join(5)
+            self.assertFalse(flusher.is_alive())
+        finally:
+            stop.set()
+            producer.join()
+        self.assertIn(("1", {'givenName': "Jane"}), self.sent())
+        buffer.shutdown()
+
+    def test_errors(self):
+        """ Failed calls are reported to on_error """
+        self.transport.add("entity.update", {
+            'stat': "error", 'code': 200, 'error': "invalid_argument",
+            'error_description': "bad value"})
+        failures = []
+        buffer = WriteBehindBuffer(
+            self.api, window=60,
+            on_error=lambda *args: failures.append(args))
+        buffer.update({'givenName': "Jane"}, uuid="1")
+        buffer.shutdown()
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(failures[0][0], {'uuid': "1"})
+        self.assertEqual(failures[0][2].code, 200)
+        self.assertEqual(buffer.stats.errors, 1)
+
+    def test_identifier_required(self):
+        """ Updates without an identifier are refused """
+        buffer = WriteBehindBuffer(self.api)
+        with self.assertRaises(ValueError):
+            buffer.update({'givenName': "Jane"})
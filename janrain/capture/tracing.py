@@ -0,0 +1,63 @@
+"""
+Optional tracing of API calls and pipelines with OpenTelemetry.
+
+Pass a tracer to Api to create a span for each API call, with child spans
+for encoding, signing, the network request and decoding. Pagination, batch
+and export helpers built on the Api add parent spans around their work.
+Spans are started as children of the caller's current span, including in
+the worker threads started by the helpers.
+
+Any object with an OpenTelemetry style start_as_current_span() method can
+be used as the tracer.
+
+Example:
+    from janrain.capture.tracing import get_tracer
+    api = janrain.capture.Api("https://...", defaults, tracer=get_tracer())
+"""
+from contextlib import contextmanager
+
+
+def get_tracer(name="janrain.capture"):
+    """
+    Get an OpenTelemetry tracer. Requires the 'opentelemetry-api' module.
+
+    Returns:
+        An opentelemetry.trace.Tracer instance.
+    """
+    from opentelemetry import trace
+    return trace.get_tracer(name)
+
+
+@contextmanager
+def span(tracer, name, **attributes):
+    """
+    Start a span as the current span, or do nothing without a tracer.
+
+    Args:
+        tracer - A tracer or None.
+        name   - The name of the span.
+
+    Keyword Args:
+        Attributes of the span. None values are skipped.
+
+    Yields:
+        The span, or None without a tracer.
+    """
+    if tracer is None:
+        yield None
+        return
+    attributes = {k: v for k, v in attributes.items() if v is not None}
+    with tracer.start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+def set_attributes(current, **attributes):
+    """
+    Set attributes on a span yielded by span(). None values are skipped and
+    nothing is done without a span.
+    """
+    if current is None:
+        return
+    for key, value in attributes.items():
+        if value is not None:
+            current.set_attribute(key, value)
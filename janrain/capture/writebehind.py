@@ -0,0 +1,247 @@
+"""
+Coalesce frequent updates to the same entity into a single entity.update.
+
+Updates are buffered per entity for a short window. Later updates are deep
+merged into the pending one, so that many one-attribute updates for a uuid
+are sent as one call when the window closes.
+
+Example:
+    with WriteBehindBuffer(api, window=2.0) as buffer:
+        for event in events:
+            buffer.update({event.attribute: event.value}, uuid=event.uuid)
+    print(buffer.stats.coalescing_ratio)
+"""
+from collections import OrderedDict
+from copy import deepcopy
+import logging
+import threading
+
+from janrain.capture.pool import run_concurrently
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+logger = logging.getLogger(__name__)
+
+
+def deep_merge(target, source):
+    """
+    Merge a dictionary of attributes into another. Objects are merged
+    recursively while plurals and other values are replaced.
+
+    Args:
+        target - The dictionary to update in place.
+        source - The dictionary of newer values.
+
+    Returns:
+        The target dictionary.
+    """
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            deep_merge(target[key], value)
+        else:
+            target[key] = deepcopy(value)
+    return target
+
+
+class WriteBehindStats(object):
+    """
+    Counters kept by WriteBehindBuffer.
+
+    Attributes:
+        updates - Number of updates buffered.
+        calls   - Number of entity.update calls sent.
+        errors  - Number of entity.update calls which failed.
+    """
+
+    def __init__(self):
+        self.updates = 0
+        self.calls = 0
+        self.errors = 0
+
+    @property
+    def coalescing_ratio(self):
+        """ Average number of updates combined into each call. """
+        return float(self.updates) / self.calls if self.calls else 0.0
+
+    def as_dict(self):
+        return {
+            'updates': self.updates,
+            'calls': self.calls,
+            'errors': self.errors,
+            'coalescing_ratio': self.coalescing_ratio,
+        }
+
+
+class WriteBehindBuffer(object):
+    """
+    Buffer entity updates and flush one combined update per entity after a
+    window. Updates for an entity are never sent concurrently, so they are
+    applied in order.
+
+    Args:
+        api         - A janrain.capture.Api instance.
+        type_name   - The entity type to update.
+        window      - Seconds an update is held to collect later updates.
+        max_pending - Number of buffered entities at which update() flushes
+                      everything at once.
+        workers     - Number of updates sent at the same time.
+        on_error    - A callable passed the identifier dictionary, the value
+                      and the exception of a failed update (by default the
+                      failure is logged).
+    """
+
+    def __init__(self, api, type_name="user", window=1.0, max_pending=1000,
+                 workers=4, on_error=None):
+        self.api = api
+        self.type_name = type_name
+        self.window = window
+        self.max_pending = max_pending
+        self.workers = workers
+        self.on_error = on_error or self._log_error
+        self.stats = WriteBehindStats()
+        # key: (identifier, value, due, sequence number)
+        self._pending = OrderedDict()
+        # key: sequence number of the update being sent
+        self._in_flight = {}
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = None
+
+    def update(self, value, **identifier):
+        """
+        Buffer an update for an entity.
+
+        Args:
+            value - A dictionary of attributes to update.
+
+        Keyword Args:
+            Identify the entity (eg. uuid="...", or key_attribute and
+            key_value).
+        """
+        if not identifier:
+            raise ValueError("An entity identifier is required")
+        key = tuple(sorted(identifier.items()))
+        with self._condition:
+            if self._closed:
+                raise ValueError("The write-behind buffer is shut down")
+            if key in self._pending:
+                deep_merge(self._pending[key][1], value)
+            else:
+                self._sequence += 1
+                self._pending[key] = (identifier, deep_merge({}, value),
+                                      monotonic() + self.window,
+                                      self._sequence)
+                self._condition.notify_all()
+            self.stats.updates += 1
+            full = len(self._pending) >= self.max_pending
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Send the updates buffered so far now and wait until they are done.
+        Updates buffered while flushing are left to the window.
+        """
+        with self._condition:
+            last = self._sequence
+        while True:
+            with self._condition:
+                batch = self._take(force=True, last=last)
+                if not batch:
+                    if not any(entry[3] <= last
+                               for entry in self._pending.values()) and \
+                            not any(sequence <= last for sequence in
+                                    self._in_flight.values()):
+                        return
+                    self._condition.wait()
+                    continue
+            self._send(batch)
+
+    def shutdown(self):
+        """ Flush the buffered updates and stop accepting new ones. """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        return False
+
+    def _take(self, force, last=None):
+        # called with the condition held; 'last' excludes the updates
+        # buffered after that sequence number
+        now = monotonic()
+        batch = []
+        for key, (identifier, value, due, sequence) in \
+                list(self._pending.items()):
+            if key in self._in_flight:
+                continue
+            if last is not None and sequence > last:
+                # entries are ordered by sequence number
+                break
+            if not force and due > now:
+                # entries are ordered by due time
+                break
+            del self._pending[key]
+            self._in_flight[key] = sequence
+            batch.append((key, identifier, value))
+        return batch
+
+    def _next_due(self):
+        for key, (identifier, value, due, sequence) in \
+                self._pending.items():
+            if key not in self._in_flight:
+                return max(0, due - monotonic())
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                batch = self._take(force=False)
+                while not batch and not self._closed:
+                    self._condition.wait(self._next_due())
+                    batch = self._take(force=False)
+                if not batch:
+                    return
+            self._send(batch)
+
+    def _send(self, batch):
+        def send(entry):
+            key, identifier, value = entry
+            return self.api.call("entity.update", type_name=self.type_name,
+                                 value=value, **identifier)
+
+        try:
+            results = run_concurrently(send, batch, self.workers)
+        finally:
+            with self._condition:
+                for key, identifier, value in batch:
+                    del self._in_flight[key]
+                self._condition.notify_all()
+
+        for (key, identifier, value), result, error in results:
+            with self._condition:
+                self.stats.calls += 1
+                if error is not None:
+                    self.stats.errors += 1
+            if error is not None:
+                self.on_error(identifier, value, error)
+
+    def _log_error(self, identifier, value, error):
+        logger.error("Buffered update for {} failed: {}".format(
+            identifier, error))
@@ -41,6 +41,10 @@ setup(
         'requests',
         'pyyaml',
     ],
+    extras_require = {
+        'http2': ['httpx[http2]'],
+        'tracing': ['opentelemetry-api'],
+    },
     setup_requires=[
         'nose',
         'mock',